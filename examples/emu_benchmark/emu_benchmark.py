@@ -0,0 +1,131 @@
+import sys
+sys.path.insert(1, '../../src/')
+from emulator.emulator import emulatedHw
+from emulator.fastEmulator import fastEmulatedHw
+import firmware.firmware as firm
+import numpy as np
+import argparse, itertools, json, platform, subprocess, time, tracemalloc
+
+# Firmware library (firmware that need more chains than the hardware has are skipped)
+FIRMWARES = {'distribution':       lambda cp, N, M: firm.distribution(cp,bins=2*M,M=M),
+             'summaryStats':       lambda cp, N, M: firm.summaryStats(cp),
+             'spatialSparsity':    lambda cp, N, M: firm.spatialSparsity(cp,N),
+             'vectorChange':       lambda cp, N, M: firm.vectorChange(cp),
+             'correlation':        lambda cp, N, M: firm.correlation(cp),
+             'passThrough':        lambda cp, N, M: firm.passThrough(cp),
+             'sumAll':             lambda cp, N, M: firm.sumAll(cp),
+             'raw':                lambda cp, N, M: firm.raw(cp),
+             'vvalu_simple':       lambda cp, N, M: firm.vvalu_simple(cp),
+             'fru_simple':         lambda cp, N, M: firm.fru_simple(cp),
+             'multipleChains':     lambda cp, N, M: firm.multipleChains(cp),
+             'conditions':         lambda cp, N, M: firm.conditions(cp),
+             'minicache':          lambda cp, N, M: firm.minicache(cp),
+             'activationPredictiveness': lambda cp, N, M: firm.activationPredictiveness(cp),
+             'normCheck':          lambda cp, N, M: firm.normCheck(cp,M)}
+
+# Grid of hardware parameters (the quick grid is meant for a fast check before committing)
+GRID       = {'N':[64,256,1024], 'M':[8,32], 'MAX_CHAINS':[8,16], 'TB_SIZE':[64,512]}
+QUICK_GRID = {'N':[64,256],      'M':[8],    'MAX_CHAINS':[16],   'TB_SIZE':[64]}
+BUILDING_BLOCKS = ['InputBuffer','FilterReduceUnit','VectorVectorALU','VectorScalarReduce','DataPacker','TraceBuffer']
+EMULATORS = {'emulatedHw': emulatedHw, 'fastEmulatedHw': fastEmulatedHw}
+
+# Creates a processor that is ready to run a given firmware over a given number of input vectors
+def setup(emulator,name,N,M,MAX_CHAINS,TB_SIZE,num_input_vectors):
+    proc = EMULATORS[emulator](N,M,num_input_vectors,MAX_CHAINS,MAX_CHAINS,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    if emulator=='emulatedHw':
+        proc.configLog(blocks=[])
+    np.random.seed(0)
+    proc.fu.vrf=np.sort(np.random.rand(MAX_CHAINS*M)*8-4)
+    proc.vvalu.vrf=np.random.rand(MAX_CHAINS*N)*8-4
+    proc.config(FIRMWARES[name](proc.compiler,N,M))
+    for i in range(num_input_vectors):
+        proc.push([np.random.rand(N)*8-4,i%4==3,i%16==15])
+    return proc
+
+# Runs a processor until all input vectors are processed and returns the elapsed time
+def emulate(emulator,proc):
+    # Accumulating random values over long runs may overflow, which is expected
+    with np.errstate(over='ignore',invalid='ignore'):
+        start = time.perf_counter()
+        if emulator=='emulatedHw':
+            proc.run(steps=None)
+        else:
+            proc.run()
+        return time.perf_counter()-start
+
+def benchmark(emulator,name,N,M,MAX_CHAINS,TB_SIZE,num_input_vectors):
+    result = {'emulator':emulator,'firmware':name,'N':N,'M':M,'MAX_CHAINS':MAX_CHAINS,'TB_SIZE':TB_SIZE,'input_vectors':num_input_vectors}
+    try:
+        proc = setup(emulator,name,N,M,MAX_CHAINS,TB_SIZE,num_input_vectors)
+    except AssertionError as e:
+        result['skipped'] = str(e)
+        return result
+    elapsed = emulate(emulator,proc)
+
+    # Peak memory is measured on a separate run, since tracing allocations slows down emulation
+    tracemalloc.start()
+    proc = setup(emulator,name,N,M,MAX_CHAINS,TB_SIZE,num_input_vectors)
+    tracemalloc.reset_peak()
+    emulate(emulator,proc)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result['seconds'] = elapsed
+    result['vectors_per_sec'] = num_input_vectors/elapsed
+    if emulator=='emulatedHw':
+        result['cycles'] = proc.cycle
+        result['cycles_per_sec'] = proc.cycle/elapsed
+    result['peak_memory_bytes'] = peak_memory
+    return result
+
+def runSuite(grid,num_input_vectors,fast_input_vectors):
+    results = []
+    for N, M, MAX_CHAINS, TB_SIZE in itertools.product(grid['N'],grid['M'],grid['MAX_CHAINS'],grid['TB_SIZE']):
+        for name in FIRMWARES:
+            for emulator, vectors in [('emulatedHw',num_input_vectors),('fastEmulatedHw',fast_input_vectors)]:
+                result = benchmark(emulator,name,N,M,MAX_CHAINS,TB_SIZE,vectors)
+                results.append(result)
+                if 'skipped' not in result:
+                    cycles = f"{result['cycles_per_sec']:9.0f} cycles/sec  " if 'cycles_per_sec' in result else ' '*22
+                    print(f"{emulator:15s}{name:25s}N={N:<5d}M={M:<4d}MAX_CHAINS={MAX_CHAINS:<3d}TB_SIZE={TB_SIZE:<4d}"
+                          f"{cycles}{result['vectors_per_sec']:9.0f} vectors/sec  {result['peak_memory_bytes']/2**20:7.2f} MiB")
+    return results
+
+# Prints the throughput of each benchmark relative to a previous run
+def compare(results,baseline_file):
+    with open(baseline_file) as file:
+        baseline = {key(r): r for r in json.load(file)['results']}
+    print("********** Speedup relative to "+baseline_file+" **********")
+    for result in results:
+        old = baseline.get(key(result))
+        if old is None or 'skipped' in result or 'skipped' in old:
+            continue
+        print(f"{result['emulator']:15s}{result['firmware']:25s}N={result['N']:<5d}M={result['M']:<4d}"
+              f"MAX_CHAINS={result['MAX_CHAINS']:<3d}TB_SIZE={result['TB_SIZE']:<4d}"
+              f"{result['vectors_per_sec']/old['vectors_per_sec']:6.2f}x")
+
+def key(result):
+    return tuple(result[k] for k in ['emulator','firmware','N','M','MAX_CHAINS','TB_SIZE','input_vectors'])
+
+def commit():
+    try:
+        return subprocess.run(['git','rev-parse','HEAD'],capture_output=True,text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Emulator throughput and memory benchmark')
+    parser.add_argument('--quick', action='store_true', help='Run a reduced grid')
+    parser.add_argument('--vectors', type=int, default=64, help='Input vectors emulated by emulatedHw')
+    parser.add_argument('--fast-vectors', type=int, default=4096, help='Input vectors emulated by fastEmulatedHw')
+    parser.add_argument('--output', default='emu_benchmark.json', help='JSON file where results are stored')
+    parser.add_argument('--compare', default=None, help='JSON file of a previous run to compare against')
+    args = parser.parse_args()
+
+    print("********** Emulator benchmark **********")
+    results = runSuite(QUICK_GRID if args.quick else GRID,args.vectors,args.fast_vectors)
+    with open(args.output,'w') as file:
+        json.dump({'commit':commit(),'python':platform.python_version(),'numpy':np.__version__,'results':results},file,indent=2)
+    print("Results stored in "+args.output)
+    if args.compare is not None:
+        compare(results,args.compare)
@@ -1,9 +1,20 @@
 import sys
 sys.path.insert(1, '../../src/')
-from emulator.emulator import emulatedHw
+from emulator.emulator import emulatedHw, fuChain
+from emulator.fastEmulator import fastEmulatedHw
+from emulator.batchEmulator import batchEmulatedHw
+from firmware.compiler import compiler, optimizeFirmware
+from emulator.sweep import sweep
+from misc.misc import encode, decode, encodeArray, decodeArray
+from emulator.traceFile import openTraceFile, traceHistory
+from firmware.cache import firmwareCache, cached, functionSource
+from firmware.binary import encodeImage, decodeImage, encodeDelta, applyDelta
+from firmware.costModel import firmwareCost
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from hardware.hardware import rtlHw
 import firmware.firmware as firm
-import math, yaml
+import math, os, tempfile, yaml
 import numpy as np
 
 # Read YAML configuration file and declare those as global variables
@@ -176,4 +187,804 @@ def testVectorChange():
 
     print("Passed test #6")
 
-testVectorChange()
\ No newline at end of file
+testVectorChange()
+
+def testFastEmulatorEquivalence():
+
+    # Every firmware of the library is emulated with enough resources for normCheck (16 chains)
+    FIRMWARES = {'distribution':       lambda cp: firm.distribution(cp,bins=2*M,M=M),
+                 'summaryStats':       lambda cp: firm.summaryStats(cp),
+                 'spatialSparsity':    lambda cp: firm.spatialSparsity(cp,N),
+                 'vectorChange':       lambda cp: firm.vectorChange(cp),
+                 'correlation':        lambda cp: firm.correlation(cp),
+                 'passThrough':        lambda cp: firm.passThrough(cp),
+                 'sumAll':             lambda cp: firm.sumAll(cp),
+                 'raw':                lambda cp: firm.raw(cp),
+                 'vvalu_simple':       lambda cp: firm.vvalu_simple(cp),
+                 'fru_simple':         lambda cp: firm.fru_simple(cp),
+                 'multipleChains':     lambda cp: firm.multipleChains(cp),
+                 'conditions':         lambda cp: firm.conditions(cp),
+                 'minicache':          lambda cp: firm.minicache(cp),
+                 'activationPredictiveness': lambda cp: firm.activationPredictiveness(cp),
+                 'normCheck':          lambda cp: firm.normCheck(cp,M)}
+    num_input_vectors, chains = 40, 16
+    for blocks in [BUILDING_BLOCKS, ['InputBuffer','FilterReduceUnit','VectorScalarReduce','VectorVectorALU','DataPacker','TraceBuffer']]:
+        for name, firmware in FIRMWARES.items():
+            proc = emulatedHw(N,M,num_input_vectors,chains,chains,TB_SIZE,chains,blocks)
+            fast_proc = fastEmulatedHw(N,M,num_input_vectors,chains,chains,TB_SIZE,chains,blocks)
+
+            # Initialize both processors the same way
+            np.random.seed(0)
+            fuvrf = np.sort(np.random.rand(chains*M)*8-4)
+            vvvrf = np.random.rand(chains*N)*8-4
+            proc.fu.vrf, fast_proc.fu.vrf = fuvrf.copy(), fuvrf.copy()
+            proc.vvalu.vrf, fast_proc.vvalu.vrf = vvvrf.copy(), vvvrf.copy()
+            proc.config(firmware(proc.compiler))
+            fast_proc.config(firmware(fast_proc.compiler))
+
+            # Feed the same values to both processors
+            for i in range(num_input_vectors):
+                input_vector = np.random.rand(N)*8-4
+                eof = list(np.random.rand(2)<0.3)
+                proc.push([input_vector]+eof)
+                fast_proc.push([input_vector]+eof)
+
+            proc.run(steps=None)
+            fast_proc.run()
+            assert np.allclose(proc.tb.mem,fast_proc.tb.mem) and proc.tb.size==fast_proc.tb.size, "Trace buffer mismatch with "+name
+            assert np.allclose(proc.dp.v_out,fast_proc.dp.v_out), "Data packer mismatch with "+name
+            assert np.allclose(proc.vvalu.vrf,fast_proc.vvalu.vrf), "VVVRF mismatch with "+name
+    print("Passed test #7")
+
+testFastEmulatorEquivalence()
+
+def testRunUntilDrained():
+
+    # Instantiate processors
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    drained_proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.fu.vrf=list(range(FUVRF_SIZE*M))
+    drained_proc.fu.vrf=list(range(FUVRF_SIZE*M))
+    proc.config(firm.distribution(proc.compiler,bins=2*M,M=M))
+    drained_proc.config(firm.distribution(drained_proc.compiler,bins=2*M,M=M))
+
+    # Feed values to input buffer
+    np.random.seed(0)
+    for i in range(IB_DEPTH):
+        input_vector=np.random.rand(N)*8
+        proc.push([input_vector,i%3==2])
+        drained_proc.push([input_vector,i%3==2])
+
+    # Drained run must stop early and give the same results as a fixed number of steps
+    proc.run(steps=1000)
+    drained_proc.run(steps=None)
+    assert drained_proc.drained() and drained_proc.cycle<IB_DEPTH*2+20, "Run until drained did not stop"
+    assert proc.cycle==1000, "Idle cycles were not fast-forwarded"
+    assert np.allclose(proc.tb.mem,drained_proc.tb.mem), "Run until drained failed"
+
+    # Logged or probed cycles are stepped instead of fast-forwarded, so they all have a log entry and fire their events
+    logged_proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    logged_proc.fu.vrf=list(range(FUVRF_SIZE*M))
+    logged_proc.config(firm.distribution(logged_proc.compiler,bins=2*M,M=M))
+    logged_proc.configLog(window=1000,blocks=['ib','dp'])
+    filtered = []
+    logged_proc.attachProbe('fu','filter',lambda info: filtered.append(info.cycle))
+    np.random.seed(0)
+    for i in range(IB_DEPTH):
+        logged_proc.push([np.random.rand(N)*8,i%3==2])
+    log = logged_proc.run(steps=1000)
+    assert logged_proc.cycle==proc.cycle and np.allclose(logged_proc.tb.mem,proc.tb.mem), "Logged run failed"
+    assert len(log['ib'])==len(log['dp'])==1000 and np.array_equal(log['ib'].column('cycle'),np.arange(1,1001)), "Idle cycles were not logged"
+    assert filtered==list(range(1,1001)), "Idle cycles were not probed"
+
+    # Fast-forwarded cycles leave the processor in the same state as stepped ones (e.g. no row is left valid in the data packer)
+    vectors = np.random.rand(3,N)
+    for steps in range(40,44):
+        procs = []
+        for stepped in [False,True]:
+            p = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+            p.config(firm.raw(p.compiler))
+            if stepped:
+                p.attachProbe('tb','write',lambda info: None)
+            for v in vectors:
+                p.push([v,False])
+            p.run(steps=steps)
+            procs.append(p.snapshot())
+        assert procs[0]['dp.v_out_valid']==0, "Data packer output is still valid after fast-forwarding"
+        assert all(np.array_equal(procs[0][key],procs[1][key]) for key in procs[1]), "Fast-forwarded state differs from stepped state"
+    print("Passed test #8")
+
+testRunUntilDrained()
+
+def testSignalLog():
+
+    # Instantiate processor keeping only the last 8 cycles of a few blocks
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.configLog(window=8,blocks=['ib','dp','tb'])
+    proc.config(firm.raw(proc.compiler))
+
+    # Feed values to input buffer
+    np.random.seed(0)
+    input_vectors=np.random.rand(IB_DEPTH,N)
+    for v in input_vectors:
+        proc.push([v,False])
+    log = proc.run(steps=None)
+
+    # Log has a fixed size and the rows written to the trace buffer are logged every cycle
+    assert proc.cycle>8 and len(log['ib'])==8 and len(log['vvalu'])==0, "Log window failed"
+    valid = log['dp'].column('valid')
+    addr, rows = log['tb'].column('addr'), log['tb'].column('row')
+    assert np.array_equal(addr>=0,valid) and valid.any(), "Trace buffer writes failed"
+    assert np.array_equal(rows[valid],proc.tb.mem[addr[valid]]), "Trace buffer writes failed"
+    assert np.allclose(log['tb'][-1][:IB_DEPTH],input_vectors), "Trace buffer contents failed"
+    assert np.all(log['tb'].column('cycle')==np.arange(proc.cycle-7,proc.cycle+1)), "Log cycles failed"
+
+    # The trace buffer of every cycle in the window is rebuilt from the logged writes, also when rows are overwritten
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,4,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.configLog(window=8,blocks=['tb'])
+    proc.config(firm.raw(proc.compiler))
+    for v in input_vectors:
+        proc.push([v,False])
+    snapshots = []
+    while not proc.drained():
+        proc.run(steps=1)
+        snapshots.append(np.copy(proc.tb.mem))
+    assert all(np.array_equal(proc.log['tb'][i],snapshots[i-8]) for i in range(8)), "Trace buffer snapshots failed"
+    assert np.count_nonzero(proc.log['tb'].column('addr')>=0)>4, "Trace buffer was not overwritten"
+    try:
+        proc.log['tb'][8]
+        assert False, "Trace buffer snapshot outside of the window"
+    except IndexError:
+        pass
+
+    # Nothing is logged by default, and the log never holds copies of the trace buffer
+    n, tb_size = 1024, 512
+    proc = emulatedHw(n,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,tb_size,MAX_CHAINS,BUILDING_BLOCKS)
+    logBytes = lambda log: sum(a.nbytes for b in log.keys() for a in list(log[b].data.values())+[log[b].cycles])
+    assert logBytes(proc.log)==0 and proc.log['tb'][-1] is proc.tb.mem, "Log is enabled by default"
+    small = emulatedHw(n,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,1,MAX_CHAINS,BUILDING_BLOCKS)
+    for p in [proc,small]:
+        p.configLog(blocks=['ib','fu','mvru','vvalu','vsru','dp','tb'])
+    assert logBytes(proc.log)==logBytes(small.log)<=proc.log['ib'].window*(M+8)*n*8, "Log size depends on the trace buffer"
+    print("Passed test #9")
+
+testSignalLog()
+
+def testManyBinsFilter():
+    # Histogram with hundreds of bins, including values that land exactly on the limits of the ranges
+    bins, n = 256, 512
+    proc = emulatedHw(n,bins,IB_DEPTH,1,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.fu.vrf=list(np.arange(bins)*0.5)
+    input_vector=np.concatenate((np.arange(n//2)*0.5,np.random.rand(n-n//2)*bins*0.6-1))
+    proc.fu.config=[fuChain(),fuChain(filter=1,addr=0)]
+    proc.fu.v_in, proc.fu.chainId_in = input_vector, 1
+    m_out,_,_,_=proc.fu.step([np.zeros(n),[False,False],[False,False],0])
+
+    # Range i is (vrf[i],vrf[i+1]] and the last range is as wide as the previous one
+    expected=np.zeros((bins,n))
+    for i in range(bins):
+        low_range=proc.fu.vrf[i]
+        high_range=proc.fu.vrf[i+1] if i+1<bins else low_range+(low_range-proc.fu.vrf[i-1])
+        expected[i]=(input_vector>low_range) & (input_vector<=high_range)
+    assert np.array_equal(m_out,expected), "Test with many bins failed"
+    print("Passed test #10")
+
+testManyBinsFilter()
+
+def testProbes():
+    # Instantiate processor
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.fu.vrf=list(range(FUVRF_SIZE*M))
+    fw = firm.distribution(proc.compiler,bins=2*M,M=M)
+    proc.config(fw)
+
+    # Record the trace buffer writes and count the vectors popped from the input buffer
+    writes, pops = [], []
+    proc.attachProbe('tb','write',lambda info: writes.append((info.cycle,info.addr,np.copy(info.vector))))
+    proc.attachProbe('ib','pop',lambda info: pops.append(info.cycle))
+    np.random.seed(0)
+    for i in range(4):
+        proc.push([np.random.rand(N)*8,i%2==1])
+    log = proc.run(steps=None)
+    assert len(pops)==4, "Probe of input buffer failed"
+    assert [addr for _, addr, _ in writes]==[0,1], "Probe of trace buffer failed"
+    assert all(np.array_equal(log['tb'][-1][addr],vector) for _, addr, vector in writes), "Probe of trace buffer failed"
+
+    # Detached probes are not called anymore
+    proc.detachProbe()
+    proc.push([np.random.rand(N)*8,True])
+    proc.run(steps=None)
+    assert len(writes)==2 and len(pops)==4, "Detaching probes failed"
+    print("Passed test #11")
+
+testProbes()
+
+def testBatchEmulator():
+    # Each instance runs a different firmware with different inputs
+    FIRMWARES = [lambda cp: firm.distribution(cp,bins=2*M,M=M),
+                 lambda cp: firm.summaryStats(cp),
+                 lambda cp: firm.vectorChange(cp),
+                 lambda cp: firm.correlation(cp),
+                 lambda cp: firm.minicache(cp),
+                 lambda cp: firm.activationPredictiveness(cp)]
+    K, chains = len(FIRMWARES), 8
+    batch = batchEmulatedHw(K,N,M,IB_DEPTH,chains,chains,TB_SIZE,chains,BUILDING_BLOCKS)
+    procs = [emulatedHw(N,M,IB_DEPTH,chains,chains,TB_SIZE,chains,BUILDING_BLOCKS) for k in range(K)]
+    np.random.seed(0)
+    for k, proc in enumerate(procs):
+        proc.fu.vrf = np.sort(np.random.rand(chains*M)*8-4)
+        proc.vvalu.vrf = np.random.rand(chains*N)*8-4
+        batch.fu.vrf[k], batch.vvalu.vrf[k] = proc.fu.vrf, proc.vvalu.vrf
+        proc.config(FIRMWARES[k](proc.compiler))
+    batch.config([firmware(compiler(N,M,chains)) for firmware in FIRMWARES])
+
+    # Feed the same values to both and step them in lockstep
+    for i in range(20):
+        input_vectors = np.random.rand(K,N)*8-4
+        eof = np.random.rand(K,2)<0.3
+        for k, proc in enumerate(procs):
+            proc.push([input_vectors[k]]+list(eof[k]))
+            proc.run(steps=10)
+        batch.push([input_vectors,eof[:,0],eof[:,1]])
+        batch.run(steps=10)
+    for k, proc in enumerate(procs):
+        assert np.array_equal(proc.tb.mem,batch.tb.mem[k]) and proc.tb.size==batch.tb.size[k], "Trace buffer mismatch in instance "+str(k)
+        assert np.array_equal(proc.vvalu.vrf,batch.vvalu.vrf[k]), "VVVRF mismatch in instance "+str(k)
+    print("Passed test #12")
+
+testBatchEmulator()
+
+def testStreaming():
+    # Streaming vectors must give the same results as pushing them beforehand
+    fw = lambda cp: firm.distribution(cp,bins=2*M,M=M)
+    np.random.seed(0)
+    inputs = [(np.random.rand(N)*8, i%3==2, False) for i in range(30)]
+    proc = emulatedHw(N,M,len(inputs),FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.fu.vrf=list(range(FUVRF_SIZE*M))
+    proc.config(fw(proc.compiler))
+    for vector, eof0, eof1 in inputs:
+        proc.push([vector,eof0,eof1])
+    proc.run(steps=None)
+
+    # The input stream is only consumed when there is space in the input buffer
+    streamed = emulatedHw(N,M,2,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    streamed.fu.vrf=list(range(FUVRF_SIZE*M))
+    streamed.config(fw(streamed.compiler))
+    # A second stream attached before the first one is drained continues it
+    streamed.stream(iter(inputs[:10]))
+    streamed.stream(iter(inputs[10:]))
+    streamed.run(steps=None)
+    assert np.array_equal(proc.tb.mem,streamed.tb.mem) and proc.tb.size==streamed.tb.size, "Streaming failed"
+    assert streamed.ib.stalls>0 and len(streamed.ib.buffer)==0, "Streaming stalls not reported"
+
+    fast_proc = fastEmulatedHw(N,M,2,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    fast_proc.fu.vrf=list(range(FUVRF_SIZE*M))
+    fast_proc.config(fw(fast_proc.compiler))
+    fast_proc.stream(iter(inputs[:10]))
+    fast_proc.stream(iter(inputs[10:]))
+    assert np.array_equal(fast_proc.tb.mem,np.zeros_like(fast_proc.tb.mem)), "Fast emulator consumed the stream before run()"
+    fast_proc.run()
+    assert np.array_equal(proc.tb.mem,fast_proc.tb.mem), "Streaming failed on fast emulator"
+    print("Passed test #13")
+
+testStreaming()
+
+def testSweep():
+    # Two configurations and two firmware over 3 shards of the same input vectors
+    np.random.seed(0)
+    input_vectors = np.random.rand(60,N)*8
+    eof = np.random.rand(60,2)<0.2
+    configs = [{'N':N,'M':M,'IB_DEPTH':depth,'FUVRF_SIZE':FUVRF_SIZE,'VVVRF_SIZE':VVVRF_SIZE,'TB_SIZE':TB_SIZE,
+                'MAX_CHAINS':MAX_CHAINS,'BUILDING_BLOCKS':BUILDING_BLOCKS,'fuvrf':list(range(FUVRF_SIZE*M))} for depth in [2,IB_DEPTH]]
+    firmwares = {'distribution': functools.partial(firm.distribution,bins=2*M,M=M), 'summaryStats': firm.summaryStats}
+    results = sweep(configs,firmwares,input_vectors,eof,shards=3,workers=2)
+    assert [(r['config'],r['firmware'],r['shard']) for r in results]==[(c,f,s) for c in range(2) for f in firmwares for s in range(3)], "Sweep results out of order"
+
+    # Each job must match running the same shard sequentially
+    for r in results:
+        proc = emulatedHw(N,M,configs[r['config']]['IB_DEPTH'],FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+        proc.fu.vrf=list(range(FUVRF_SIZE*M))
+        proc.config(firmwares[r['firmware']](proc.compiler))
+        shard = range(r['shard']*20,r['shard']*20+20)
+        proc.stream((input_vectors[i],eof[i,0],eof[i,1]) for i in shard)
+        proc.run(steps=None)
+        assert np.array_equal(proc.tb.mem,r['tb']) and proc.tb.size==r['tb_size'] and proc.cycle==r['cycles'], "Sweep mismatch"
+    print("Passed test #14")
+
+# Workers may import this file again, so the sweep only runs from the main process
+if __name__ == "__main__":
+    testSweep()
+
+def testSnapshot():
+    # Run a processor halfway through a stream of input vectors
+    np.random.seed(0)
+    inputs = [(np.random.rand(N)*8-4, i%3==2, i%7==6) for i in range(40)]
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.fu.vrf=list(range(FUVRF_SIZE*M))
+    proc.vvalu.vrf=np.random.rand(VVVRF_SIZE*N)
+    proc.config(firm.correlation(proc.compiler))
+    proc.stream(iter(inputs[:20]))
+    proc.run(steps=None)
+    drained = proc.snapshot()
+    proc.push([inputs[20][0],True,False])
+    proc.run(steps=3)
+
+    # Continuing a fork or a restored snapshot must give the same results as continuing the processor itself
+    state = proc.snapshot()
+    fork = proc.fork()
+    restored = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    restored.restore(state)
+    for p in [proc,fork,restored]:
+        p.stream(iter(inputs[21:]))
+        p.run(steps=None)
+    for p in [fork,restored]:
+        assert np.array_equal(proc.tb.mem,p.tb.mem) and proc.tb.size==p.tb.size and proc.cycle==p.cycle, "Snapshot restore failed"
+        assert np.array_equal(proc.vvalu.vrf,p.vvalu.vrf) and np.array_equal(proc.dp.v_out,p.dp.v_out), "Snapshot restore failed"
+
+    # Trying a different firmware from a drained state does not affect the snapshot it came from
+    tb = np.copy(drained['tb.mem'])
+    other = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    other.restore(drained)
+    other.config(firm.sumAll(other.compiler))
+    other.stream(iter(inputs[20:]))
+    other.run(steps=None)
+    assert np.array_equal(drained['tb.mem'],tb) and not np.array_equal(other.tb.mem,tb), "Fork modified snapshot"
+    print("Passed test #15")
+
+testSnapshot()
+
+def testFixedPoint():
+    # Range filters compare the unsigned codes of a single FUVRF row as filter_reduce_unit.sv does, also with negative values
+    np.random.seed(0)
+    width = 16
+    fuvrf = np.concatenate((np.linspace(-4,4,2*M),np.linspace(-1,0.5,M),-np.linspace(-4,0,M)))[:FUVRF_SIZE*M]
+    vectors = np.round((np.random.rand(12,N)*10-5)*4)/4
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS,'fixed_point',width)
+    proc.fu.vrf = fuvrf
+    cp = proc.compiler
+    for addr in range(FUVRF_SIZE):
+        cp.begin_chain()
+        cp.vv_filter(addr)
+        cp.m_reduce('M')
+        cp.v_commit(M)
+        cp.end_chain()
+    proc.config(cp.compile())
+    proc.stream((v,False,False) for v in vectors)
+    proc.run(steps=None)
+
+    # Expected codes of the trace buffer computed as in the RTL, where the last range of each row is as wide as its first one
+    mask = (1<<width)-1
+    rows = encodeArray(fuvrf,width).reshape(FUVRF_SIZE,M)
+    expected = []
+    for codes in encodeArray(vectors,width):
+        for row in rows:
+            upper = list(row[1:])+[(row[-1]+row[1]-row[0]) & mask]
+            expected += [int(np.count_nonzero((codes>row[j]) & (codes<=upper[j])))<<(width//2) for j in range(M)]
+    expected = np.array(expected).reshape(-1,N)
+    assert proc.tb.size==len(expected), "Fixed point emulation failed"
+    assert np.array_equal(proc.fxp.toEncoded(proc.tb.mem[:len(expected)]),expected), "Fixed point filter does not match the RTL"
+
+    # The maximum of 'int' values compares their unsigned codes, so negative values are larger than positive ones
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS,'int',8)
+    proc.vvalu.vrf = np.tile(np.arange(N)-N//2,VVVRF_SIZE)
+    cp = proc.compiler
+    cp.begin_chain()
+    cp.vv_max(0)
+    cp.v_commit(N)
+    cp.end_chain()
+    proc.config(cp.compile())
+    vectors = np.random.randint(-100,100,size=(4,N))
+    proc.stream((v.astype(float),False,False) for v in vectors)
+    proc.run(steps=None)
+    operand = np.arange(N)-N//2
+    expected = np.where((vectors&255)>(operand&255),vectors,operand)
+    assert np.array_equal(proc.tb.mem[:4],expected), "Integer maximum does not match the RTL"
+
+    # Integer sums wrap around at DATA_WIDTH bits instead of saturating
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS,'int',8)
+    proc.config(firm.sumAll(proc.compiler))
+    vectors = np.random.randint(-100,100,size=(2*N,N))
+    proc.stream((v.astype(float),False,False) for v in vectors)
+    proc.run(steps=None)
+    expected = (vectors.sum(axis=1)+128)%256-128
+    assert np.array_equal(proc.tb.mem[:2].reshape(-1),expected), "Integer emulation did not wrap around"
+    print("Passed test #16")
+
+testFixedPoint()
+
+def testEncoding():
+    # Array encoding matches the scalar encoding, including rounding, saturation and negative values
+    np.random.seed(0)
+    for DATA_WIDTH in [8,16,32,63]:
+        frac = 2**(DATA_WIDTH//2)
+        values = np.concatenate((np.random.randn(256)*frac/8, np.random.randn(16)*frac, (np.arange(-7,7)+0.5)/frac, [0.0,-1e-9]))
+        encoded = encodeArray(values.reshape(4,-1),DATA_WIDTH)
+        assert encoded.shape==(4,len(values)//4), "Array encoding failed"
+        assert encoded.reshape(-1).tolist()==[encode(x,DATA_WIDTH) for x in values.tolist()], "Array encoding failed"
+        assert decodeArray(encoded,DATA_WIDTH).reshape(-1).tolist()==[decode(x,DATA_WIDTH) for x in encoded.reshape(-1).tolist()], "Array decoding failed"
+    print("Passed test #17")
+
+testEncoding()
+
+def testTraceFile():
+    # A trace buffer backed by a file keeps the same contents as one in RAM, including wraparound
+    np.random.seed(0)
+    inputs = [(np.random.rand(N)*8-4, False, False) for i in range(200)]
+    with tempfile.TemporaryDirectory() as folder:
+        procs = [emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)]
+        procs.append(emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS,TB_FILE=os.path.join(folder,'tb')))
+        procs.append(emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS,TB_FILE=os.path.join(folder,'tb_grow'),TB_GROW=True))
+        # A growing file of a trace buffer much larger than the stream only holds the rows written so far
+        procs.append(emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,2**24,MAX_CHAINS,BUILDING_BLOCKS,TB_FILE=os.path.join(folder,'tb_large'),TB_GROW=True))
+        for proc in procs:
+            proc.config(firm.raw(proc.compiler))
+            proc.stream(iter(inputs))
+            proc.run(steps=None)
+        assert procs[0].tb.size<len(inputs)-TB_SIZE, "Trace buffer did not wrap around"
+        for proc in procs[1:3]:
+            assert np.array_equal(procs[0].tb.mem,proc.tb.mem) and procs[0].tb.size==proc.tb.size, "Trace buffer file failed"
+
+        # Files can be reopened after the emulation, with the rows in the order they were written
+        trace = openTraceFile(os.path.join(folder,'tb_grow'))
+        assert np.array_equal(trace.mem,procs[0].tb.mem) and trace.rows==len(inputs), "Trace buffer file failed"
+        assert np.array_equal(traceHistory(trace),np.array([v for v, _, _ in inputs[-TB_SIZE:]])), "Trace buffer file failed"
+        trace = openTraceFile(os.path.join(folder,'tb_large'))
+        assert np.array_equal(traceHistory(trace),np.array([v for v, _, _ in inputs])), "Trace buffer file failed"
+        assert os.path.getsize(os.path.join(folder,'tb_large'))<2**24*N*8, "Trace buffer file did not grow"
+        del trace, procs
+    print("Passed test #18")
+
+testTraceFile()
+
+def testCommitQueue():
+    # A consumer thread accumulates a histogram of the packed rows while the processor runs
+    np.random.seed(0)
+    inputs = [(np.random.rand(N)*8-4, i%4==3, False) for i in range(64)]
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.fu.vrf=np.linspace(-4,4,FUVRF_SIZE*M)
+    proc.config(firm.distribution(proc.compiler,bins=M,M=M))
+    histogram, rows, written = np.zeros(N), [], []
+    proc.attachProbe('tb','write',lambda info: written.append(np.array(info.vector)))
+    consumer = proc.subscribe(maxsize=2,policy='block')
+    consumer.start(lambda row: (rows.append(row), np.add(histogram,row.vector,out=histogram)))
+    proc.stream(iter(inputs))
+    proc.run(steps=None)
+    proc.unsubscribe(consumer)
+    consumer.join()
+    assert len(rows)==len(written)>0 and all(np.array_equal(r.vector,w) for r, w in zip(rows,written)), "Commit queue failed"
+    assert np.array_equal(histogram,np.sum(written,axis=0)) and all(a.cycle<b.cycle for a, b in zip(rows,rows[1:])), "Commit queue failed"
+
+    # Without a consumer, rows that don't fit in a 'drop' queue are discarded
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.config(firm.raw(proc.compiler))
+    rows = proc.subscribe(maxsize=4,policy='drop')
+    proc.stream(iter(inputs))
+    proc.run(steps=None)
+    assert rows.dropped==len(inputs)-4 and np.array_equal(rows.get().vector,inputs[0][0]), "Commit queue failed"
+
+    # A 'block' queue that no one reads stops the emulation once it is full, and closing it doesn't block
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.config(firm.raw(proc.compiler))
+    rows = proc.subscribe(maxsize=4,policy='block')
+    proc.stream(iter(inputs))
+    try:
+        proc.run(steps=None)
+        assert False, "Blocking commit queue without consumer did not fail"
+    except RuntimeError:
+        pass
+    proc.unsubscribe(rows)
+    read = list(rows)
+    assert len(read)==4 and rows.dropped==0 and np.array_equal(read[0].vector,inputs[0][0]) and rows.get() is None, "Blocking commit queue without consumer failed"
+    print("Passed test #19")
+
+testCommitQueue()
+
+def testFirmwareCache():
+    # Cached firmware is the same as freshly compiled firmware and is only compiled once per function, arguments and hardware shape
+    with tempfile.TemporaryDirectory() as folder:
+        cache = firmwareCache(maxsize=2,folder=folder)
+        proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+        fw = cached(firm.distribution,cache)(proc.compiler,bins=2*M,M=M)
+        assert repr(fw)==repr(firm.distribution(compiler(N,M,MAX_CHAINS),bins=2*M,M=M)), "Firmware cache failed"
+        assert cache.firmware(firm.distribution,proc.compiler,bins=2*M,M=M) is fw and cache.misses==1 and cache.hits==1, "Firmware cache failed"
+        cache.firmware(firm.distribution,proc.compiler,bins=M,M=M)
+        cache.firmware(firm.distribution,compiler(2*N,M,MAX_CHAINS),bins=2*M,M=M)
+        cache.firmware(functools.partial(firm.distribution,bins=2*M),proc.compiler,M=M)
+        assert cache.misses==3 and cache.disk_hits==1 and len(cache.memory)==2, "Firmware cache failed"
+
+        # Firmware on disk is reused by other caches, unless the compiler changed
+        other = firmwareCache(folder=folder)
+        assert repr(other.firmware(firm.distribution,proc.compiler,bins=M,M=M))==repr(firm.distribution(compiler(N,M,MAX_CHAINS),bins=M,M=M))
+        assert other.disk_hits==1 and other.misses==0, "Firmware cache failed"
+        other.version = 'changed'
+        other.clear()
+        other.firmware(firm.distribution,proc.compiler,bins=M,M=M)
+        assert other.misses==1, "Firmware cache was not invalidated"
+
+    # Arrays are identified by their contents, even when their repr is truncated
+    large = np.zeros(2000)
+    changed = large.copy()
+    changed[1000] = 1
+    assert repr(large)==repr(changed), "Arrays have different repr"
+    cache = firmwareCache()
+    keys = [cache.key(firm.distribution,compiler(N,M,MAX_CHAINS),(a,),{}) for a in [large,changed,large.copy()]]
+    assert keys[0]!=keys[1] and keys[0]==keys[2], "Array arguments collide in the firmware cache"
+    assert 'def summaryStats' in functionSource(firm.distribution), "Helpers of firmware functions are not part of the key"
+
+    # Lambdas with the same source but different closures, or on the same line, are different firmware functions
+    cache = firmwareCache()
+    for bins in [M,4*M]:
+        fw = cache.firmware(lambda cp: firm.distribution(cp,bins=bins,M=M),compiler(N,M,MAX_CHAINS))
+        assert fw['valid_chains']==bins//M, "Closures collide in the firmware cache"
+    raw, stats = [lambda cp: firm.raw(cp), lambda cp: firm.summaryStats(cp)]
+    assert repr(cache.firmware(raw,compiler(N,M,MAX_CHAINS)))==repr(firm.raw(compiler(N,M,MAX_CHAINS))), "Firmware cache failed"
+    assert repr(cache.firmware(stats,compiler(N,M,MAX_CHAINS)))==repr(firm.summaryStats(compiler(N,M,MAX_CHAINS))), "Lambdas on the same line collide in the firmware cache"
+    assert cache.hits==0 and cache.misses==4, "Firmware cache failed"
+    print("Passed test #20")
+
+testFirmwareCache()
+
+def testFirmwareImage():
+    # Firmware sent through the UART is decoded back to the same firmware and FUVRF, and configures the emulator in the same way
+    np.random.seed(0)
+    inputs = [(np.random.rand(N)*8-4, i%4==3, False) for i in range(32)]
+    fuvrf = list(np.arange(-FUVRF_SIZE*M/2,FUVRF_SIZE*M/2)*0.5)
+    for fw_function in [lambda cp: firm.distribution(cp,bins=2*M,M=M), firm.summaryStats, firm.conditions, firm.minicache]:
+        for DATA_WIDTH, DATA_TYPE in [(32,'fixed_point'),(16,'fixed_point'),(8,'int')]:
+            fw = fw_function(compiler(N,M,MAX_CHAINS))
+            values = [int(v) for v in fuvrf] if DATA_TYPE=='int' else fuvrf
+            image = encodeImage(fw,values,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,DATA_TYPE)
+            assert image[0]==42 and len(image)==1+1+3*MAX_CHAINS+FUVRF_SIZE*M*DATA_WIDTH//8+7*MAX_CHAINS+MAX_CHAINS+2*MAX_CHAINS, "Firmware image has a wrong size"
+            decoded_fw, decoded_fuvrf = decodeImage(image,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,DATA_TYPE)
+            assert decoded_fuvrf==values and encodeImage(decoded_fw,decoded_fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,DATA_TYPE)==image, "Firmware image failed"
+
+            procs = []
+            for f, vrf in [(fw,values),(decoded_fw,decoded_fuvrf)]:
+                proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+                proc.fu.vrf = np.array(vrf,dtype=float)
+                proc.config(f)
+                proc.stream(iter(inputs))
+                proc.run(steps=None)
+                procs.append(proc)
+            assert np.array_equal(procs[0].tb.mem,procs[1].tb.mem) and procs[0].tb.size==procs[1].tb.size, "Firmware image failed"
+
+    # The RTL with the reconfiguration unit can still be generated
+    current_folder = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            hw_proc = rtlHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,32,MAX_CHAINS,BUILDING_BLOCKS,'int','Cyclone V')
+            hw_proc.config(firm.summaryStats(hw_proc.compiler))
+            hw_proc.push([list(range(N)),False])
+            hw_proc.steps = 10
+            hw_proc.generateRtl()
+            with open('rtl/debugProcessor.sv') as f:
+                assert '.FUVRF_SIZE(FUVRF_SIZE)' in f.read(), "RTL generation failed"
+        finally:
+            os.chdir(current_folder)
+    print("Passed test #21")
+
+testFirmwareImage()
+
+def testCostModel():
+    # Estimated cycles per vector and trace buffer rows match the ones measured on the emulator
+    np.random.seed(0)
+    num_vectors = 96
+    firmwares = [lambda cp: firm.distribution(cp,bins=2*M,M=M), firm.summaryStats, firm.conditions, firm.raw, firm.vectorChange]
+    for fw_function in firmwares:
+        for frame_length, frame2_length in [(4,None),(8,16),(1,None)]:
+            proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+            proc.configLog(blocks=[])
+            fw = fw_function(proc.compiler)
+            proc.config(fw)
+            rows = []
+            proc.attachProbe('tb','write',lambda info: rows.append(info.cycle))
+            proc.stream((np.random.rand(N), i%frame_length==frame_length-1, frame2_length is not None and i%frame2_length==frame2_length-1) for i in range(num_vectors))
+            proc.run(steps=None)
+            cost = firmwareCost(fw,N,M,IB_DEPTH,TB_SIZE,32,frame_length,frame2_length)
+            assert len(rows)==cost.rows_per_vector*num_vectors, "Cost model failed"
+            # Cycles only differ by the latency of the pipeline
+            assert 0<=proc.cycle-cost.cycles_per_vector*num_vectors<=8, "Cost model failed"
+            # The input buffer only stalls the stream when vectors arrive faster than they are processed
+            assert (proc.ib.stalls>0)==(cost.cycles_to_overflow is not None), "Cost model failed"
+    print("Passed test #22")
+
+testCostModel()
+
+def testOptimizer():
+    # Sum of each vector and its change relative to the previous one, with a few chains that can be merged or removed
+    def reducible(cp):
+        cp.begin_chain()
+        cp.vv_sub(0)
+        cp.v_reduce()
+        cp.v_commit(1)
+        cp.end_chain()
+
+        cp.begin_chain()
+        cp.v_reduce()
+        cp.v_commit(1)
+        cp.end_chain()
+
+        cp.begin_chain()
+        cp.vv_add(1)
+        cp.v_cache(2)
+        cp.end_chain()
+
+        cp.begin_chain()
+        cp.v_cache(0)
+        cp.v_mc_save()
+        cp.end_chain()
+        return cp.compile()
+
+    # Optimized firmware gives the same results as the original one
+    np.random.seed(0)
+    inputs = [(np.random.rand(N)*8-4, i%4==3, i%8==7) for i in range(48)]
+    vvvrf = np.random.rand(VVVRF_SIZE*N)
+    firmwares = [reducible, firm.summaryStats, firm.vectorChange, firm.correlation, firm.passThrough, firm.multipleChains,
+                 firm.conditions, firm.minicache, firm.activationPredictiveness, lambda cp: firm.distribution(cp,bins=2*M,M=M)]
+    for fw_function in firmwares:
+        fw = fw_function(compiler(N,M,MAX_CHAINS))
+        optimized, report = optimizeFirmware(fw,BUILDING_BLOCKS)
+        assert report.chains_after==optimized['valid_chains']<=fw['valid_chains'] and len(optimized['fu'])==MAX_CHAINS, "Optimizer failed"
+        procs = []
+        for f in [fw,optimized]:
+            proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+            proc.fu.vrf = np.linspace(-4,4,FUVRF_SIZE*M)
+            proc.vvalu.vrf = np.copy(vvvrf)
+            proc.config(f)
+            proc.stream(iter(inputs))
+            proc.run(steps=None)
+            procs.append(proc)
+        assert np.array_equal(procs[0].tb.mem,procs[1].tb.mem) and procs[0].tb.size==procs[1].tb.size, "Optimized firmware is not equivalent"
+        # Firmware without chains also skips the cycles that drain the pipeline
+        assert procs[0].cycle-procs[1].cycle>=report.cycles_saved_per_vector*len(inputs), "Optimizer report failed"
+        if fw_function==reducible:
+            assert report.chains_after==2 and report.cycles_saved_per_vector==2 and report.merged==1, "Optimizer failed"
+    print("Passed test #23")
+
+testOptimizer()
+
+def testDeltaReconfig():
+    # A delta only sends what changed and reconfigures the emulator in the same way as the full image
+    np.random.seed(0)
+    inputs = [(np.random.rand(N)*8-4, i%4==3, False) for i in range(64)]
+    for DATA_WIDTH, DATA_TYPE in [(32,'float'),(16,'fixed_point'),(8,'int')]:
+        image_type = 'fixed_point' if DATA_TYPE=='fixed_point' else 'int'
+        row_bytes = M*DATA_WIDTH//8
+        fuvrf = list(np.arange(-FUVRF_SIZE*M/2,FUVRF_SIZE*M/2))
+        fw = firm.distribution(compiler(N,M,MAX_CHAINS),bins=2*M,M=M)
+        image = encodeImage(fw,fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,image_type)
+
+        # Changing one range set only sends its row
+        new_fuvrf = fuvrf[:M]+[v/2 for v in fuvrf[M:2*M]]+fuvrf[2*M:]
+        new_image = encodeImage(fw,new_fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,image_type)
+        delta = encodeDelta(image,new_image,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+        assert delta[0]==43 and delta[-1]==255 and len(delta)==1+4+row_bytes+1, "Delta has a wrong size"
+        assert applyDelta(image,delta,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)==new_image, "Delta failed"
+
+        # Swapping the firmware only sends the chain entries that changed
+        new_fw = firm.summaryStats(compiler(N,M,MAX_CHAINS))
+        swap_image = encodeImage(new_fw,new_fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,image_type)
+        swap = encodeDelta(new_image,swap_image,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+        assert applyDelta(new_image,swap,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)==swap_image and len(swap)<len(swap_image), "Delta failed"
+        assert encodeDelta(image,image,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)==bytes([43,255]), "Delta failed"
+
+        procs = []
+        for images in [[delta,swap],[new_image,swap_image]]:
+            proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS,DATA_TYPE,DATA_WIDTH)
+            proc.fu.vrf = np.array(fuvrf,dtype=float)
+            proc.config(fw)
+            proc.stream(iter(inputs[:16]))
+            proc.run(steps=None)
+            for idx, img in enumerate(images):
+                proc.reconfigure(img)
+                proc.stream(iter(inputs[16*(idx+1):16*(idx+2)]))
+                proc.run(steps=None)
+            procs.append(proc)
+        assert np.array_equal(procs[0].fu.vrf,procs[1].fu.vrf) and procs[0].firmware['valid_chains']==new_fw['valid_chains'], "Delta reconfiguration failed"
+        assert np.array_equal(procs[0].tb.mem,procs[1].tb.mem) and procs[0].tb.size==procs[1].tb.size, "Delta reconfiguration failed"
+
+    # A float emulator keeps the fractional ranges of an image (and a delta) encoded for a 16 bit fixed point board
+    fuvrf = list(np.arange(FUVRF_SIZE*M)*0.375-2.5)
+    new_fuvrf = fuvrf[:M]+[v+0.125 for v in fuvrf[M:2*M]]+fuvrf[2*M:]
+    fw = firm.distribution(compiler(N,M,MAX_CHAINS),bins=2*M,M=M)
+    image = encodeImage(fw,fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,16,'fixed_point')
+    new_image = encodeImage(fw,new_fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,16,'fixed_point')
+    proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    proc.reconfigure(image,'fixed_point',16)
+    assert np.array_equal(proc.fu.vrf,fuvrf) and repr(proc.firmware)==repr(decodeImage(image,N,M,MAX_CHAINS,FUVRF_SIZE,16,'fixed_point')[0]), "Fixed point image failed"
+    proc.reconfigure(encodeDelta(image,new_image,M,MAX_CHAINS,FUVRF_SIZE,16),'fixed_point',16)
+    assert np.array_equal(proc.fu.vrf,new_fuvrf), "Fixed point delta failed"
+    print("Passed test #24")
+
+testDeltaReconfig()
+
+def testIncrementalRtl():
+    # Only the generated files whose contents change are rewritten, and callers learn which ones changed
+    current_folder = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            hw_proc = rtlHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,32,MAX_CHAINS,BUILDING_BLOCKS,'int','Cyclone V')
+            hw_proc.config(firm.summaryStats(hw_proc.compiler))
+            hw_proc.push([list(range(N)),False])
+            hw_proc.steps = 10
+            first = hw_proc.generateRtl()
+            assert {'debugProcessor.sv','testbench.sv','stimulus.hex','furf.mif','altera_mf.v','ram_dual_port.sv'}<=set(first.changed), "RTL generation failed"
+            assert set(os.listdir('rtl'))==set(first.changed)|{'.manifest.json'}, "RTL generation failed"
+            mtime = os.path.getmtime('rtl/altera_mf.v')
+            second = hw_proc.generateRtl()
+            assert second.key==first.key and second.changed==[] and os.path.getmtime('rtl/altera_mf.v')==mtime, "Unchanged RTL was rewritten"
+
+            # New inputs only change the stimulus, and new firmware or FUVRF values only change the files that hold them
+            hw_proc.push([list(range(N)),True])
+            assert hw_proc.generateRtl().changed==['stimulus.hex'], "Incremental RTL generation failed"
+            hw_proc.config(firm.vectorChange(compiler(N,M,MAX_CHAINS)))
+            assert hw_proc.generateRtl().changed==['debugProcessor.sv'], "Incremental RTL generation failed"
+            hw_proc.initialize_fu(list(range(FUVRF_SIZE*M)))
+            assert hw_proc.generateRtl().changed==['furf.mif'], "Incremental RTL generation failed"
+            with open('rtl/furf.mif') as f:
+                assert f"1 : {sum(v<<(32*i) for i, v in enumerate(range(M,2*M)))};" in f.read(), "FUVRF initial values were not written"
+
+            # Files that are deleted or modified outside of generateRtl are rewritten
+            os.remove('rtl/testbench.sv')
+            with open('rtl/uart.sv','a') as f:
+                f.write('// Modified')
+            assert hw_proc.generateRtl().changed==['uart.sv','testbench.sv'], "Deleted RTL was not regenerated"
+        finally:
+            os.chdir(current_folder)
+    print("Passed test #25")
+
+testIncrementalRtl()
+
+def testRtlFolders():
+    # RTL of several processors is generated at the same time in separate folders, without changing the current directory
+    current_folder = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        hw_procs = []
+        for fw_function in [firm.raw, firm.summaryStats, firm.vectorChange, firm.correlation]:
+            hw_proc = rtlHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,32,MAX_CHAINS,BUILDING_BLOCKS,'int','Cyclone V')
+            hw_proc.config(fw_function(hw_proc.compiler))
+            hw_proc.push([list(range(N)),False])
+            hw_proc.steps = 10
+            hw_procs.append(hw_proc)
+        jobs = [(hw_proc,os.path.join(folder,f"rtl_{idx}")) for idx, hw_proc in enumerate(hw_procs)]
+        with ThreadPoolExecutor(len(jobs)) as executor:
+            results = list(executor.map(lambda job: job[0].generateRtl(job[1]),jobs))
+        assert os.getcwd()==current_folder and not os.path.exists('rtl'), "RTL generation changed the current directory"
+        assert len({r.key for r in results})==len(jobs), "RTL generation failed"
+        for (hw_proc, rtl_folder), result in zip(jobs,results):
+            assert hw_proc.generateRtl(os.path.join(folder,'check')).key==result.key, "Parallel RTL generation failed"
+            with open(os.path.join(rtl_folder,'debugProcessor.sv')) as f, open(os.path.join(folder,'check','debugProcessor.sv')) as g:
+                assert f.read()==g.read(), "Parallel RTL generation failed"
+    print("Passed test #26")
+
+testRtlFolders()
+
+def testStimulusFile():
+    # The testbench reads its inputs from a file, so it doesn't change with the inputs or the number of steps
+    with tempfile.TemporaryDirectory() as folder:
+        hw_proc = rtlHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,16,16,MAX_CHAINS,BUILDING_BLOCKS,'int','Cyclone V')
+        hw_proc.config(firm.summaryStats(hw_proc.compiler))
+        hw_proc.push([list(range(N)),False])
+        hw_proc.steps = 10
+        first = hw_proc.generateRtl(folder)
+        inputs = [[np.random.randint(-2**15,2**15,N).tolist(),bool(np.random.rand()<0.5),bool(np.random.rand()<0.5)] for _ in range(1000)]
+        for inp in inputs:
+            hw_proc.push(inp)
+        hw_proc.steps = 2000
+        second = hw_proc.generateRtl(folder)
+        assert second.changed==['stimulus.hex'] and second.hashes['testbench.sv']==first.hashes['testbench.sv'], "Testbench depends on its inputs"
+
+        # One line per cycle with the dump, valid and eof flags followed by the elements (negative values in two's complement)
+        with open(os.path.join(folder,'stimulus.hex')) as f:
+            lines = [int(l,16) for l in f.read().split()]
+        assert len(lines)==hw_proc.steps+1, "Wrong number of stimulus cycles"
+        for i, line in enumerate(lines):
+            inp = hw_proc.testbench_inputs[min(i,len(hw_proc.testbench_inputs)-1)]
+            flags = line>>(16*N)
+            assert flags==(int(i!=0)<<3 | int(i<len(hw_proc.testbench_inputs))<<2 | int(len(inp)>2 and inp[2])<<1 | int(inp[1])), "Wrong stimulus flags"
+            assert [(line>>(16*idx))&0xFFFF for idx in range(N)]==[v&0xFFFF for v in inp[0]], "Wrong stimulus vector"
+    print("Passed test #27")
+
+testStimulusFile()
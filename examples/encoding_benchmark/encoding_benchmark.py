@@ -0,0 +1,41 @@
+import sys
+sys.path.insert(1, '../../src/')
+from misc.misc import encode, decode, encodeArray, decodeArray
+import numpy as np
+import argparse, itertools, time
+
+# Trace buffer shapes (TB_SIZE x N) and data widths that are benchmarked
+GRID = {'TB_SIZE':[64,512], 'N':[64,1024], 'DATA_WIDTH':[16,32,64]}
+
+# Returns the best of a few runs of a function
+def timeit(function,repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best,time.perf_counter()-start)
+    return best, result
+
+def benchmark(TB_SIZE,N,DATA_WIDTH,repeat):
+    np.random.seed(0)
+    values = np.random.randn(TB_SIZE,N)*2**(DATA_WIDTH//4)
+
+    # Element by element (scalar) versions against the array versions
+    scalar_encode, encoded = timeit(lambda: [[encode(x,DATA_WIDTH) for x in row] for row in values.tolist()],repeat)
+    array_encode, encoded_array = timeit(lambda: encodeArray(values,DATA_WIDTH),repeat)
+    scalar_decode, decoded = timeit(lambda: [[decode(x,DATA_WIDTH) for x in row] for row in encoded],repeat)
+    array_decode, decoded_array = timeit(lambda: decodeArray(encoded_array,DATA_WIDTH),repeat)
+    assert encoded_array.tolist()==encoded and decoded_array.tolist()==decoded, "Array encoding does not match scalar encoding"
+
+    print(f"TB_SIZE={TB_SIZE:<5d}N={N:<6d}DATA_WIDTH={DATA_WIDTH:<4d}"
+          f"encode {scalar_encode*1e3:8.2f}ms -> {array_encode*1e3:6.2f}ms ({scalar_encode/array_encode:5.0f}x)   "
+          f"decode {scalar_decode*1e3:8.2f}ms -> {array_decode*1e3:6.2f}ms ({scalar_decode/array_decode:5.0f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fixed point encode/decode benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark (the fastest one is reported)')
+    args = parser.parse_args()
+
+    print("********** Encoding benchmark **********")
+    for TB_SIZE, N, DATA_WIDTH in itertools.product(GRID['TB_SIZE'],GRID['N'],GRID['DATA_WIDTH']):
+        benchmark(TB_SIZE,N,DATA_WIDTH,args.repeat)
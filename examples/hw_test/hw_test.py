@@ -2,9 +2,13 @@ import sys
 sys.path.insert(1, '../../src/')
 from emulator.emulator import emulatedHw
 from hardware.hardware import rtlHw
+from containers.modelsim.modelsimSession import modelsimSession
+from containers.modelsim.modelsimPool import modelsimPool
 from misc.misc import *
 import firmware.firmware as firm
-import math
+from firmware.compiler import compiler
+from firmware.binary import encodeImage, encodeDelta
+import math, os
 import numpy as np
 np.set_printoptions(precision=3, suppress=False)
 
@@ -285,4 +289,99 @@ def predictiveness():
     assert np.allclose(emu_results_filtered,hw_results_filtered,rtol=0.05)
     print("Passed test #7")
 
-predictiveness()
\ No newline at end of file
+predictiveness()
+
+def session():
+
+    # Simulations that share a session reuse the running container and the compiled vendor libraries
+    readConf()
+    with modelsimSession(log=False) as modelsim:
+        for fw_function in [firm.raw, firm.summaryStats]:
+            hw_proc  = rtlHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,DATA_WIDTH,MAX_CHAINS,BUILDING_BLOCKS,DATA_TYPE,DEVICE_FAM)
+            emu_proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+            pushVals(emu_proc,hw_proc,3,neg_vals=True)
+
+            fw = fw_function(hw_proc.compiler)
+            emu_proc.config(fw)
+            hw_proc.config(fw)
+
+            steps=30
+            hw_results = hw_proc.run(steps=steps,gui=False,log=False,session=modelsim)
+            emu_results = emu_proc.run(steps=steps)
+            emu_results_filtered, hw_results_filtered = filterResults(emu_results, hw_results, DATA_TYPE)
+            assert np.allclose(emu_results_filtered,hw_results_filtered,rtol=0.01)
+
+    # Only the firmware changed between simulations, so the vendor libraries were only compiled once
+    assert modelsim.simulations==2 and modelsim.compilations==2 and modelsim.vendor_compilations==1
+    print("Passed test #8")
+
+session()
+
+
+def regression():
+
+    # Several firmware run at the same time, each one in its own RTL folder and working directory of the container
+    readConf()
+    cases = [firm.raw, firm.summaryStats, firm.vectorChange, firm.correlation]
+    hw_procs, emu_results = [], []
+    for fw_function in cases:
+        hw_proc  = rtlHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,DATA_WIDTH,MAX_CHAINS,BUILDING_BLOCKS,DATA_TYPE,DEVICE_FAM)
+        emu_proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+        pushVals(emu_proc,hw_proc,3,neg_vals=True)
+        fw = fw_function(hw_proc.compiler)
+        emu_proc.config(fw)
+        hw_proc.config(fw)
+        emu_results.append(emu_proc.run(steps=30))
+        hw_procs.append(hw_proc)
+
+    current_folder = os.getcwd()
+    with modelsimPool(workers=2) as pool:
+        hw_results = pool.run(hw_procs,steps=30)
+    assert os.getcwd()==current_folder
+
+    # Verify that results are equal
+    for emu_result, hw_result in zip(emu_results,hw_results):
+        emu_results_filtered, hw_results_filtered = filterResults(emu_result, hw_result, DATA_TYPE)
+        assert np.allclose(emu_results_filtered,hw_results_filtered,rtol=0.01)
+    print("Passed test #9")
+
+regression()
+
+
+def uartReconfiguration():
+
+    # A full image and then a delta are sent through uart_rxd before the inputs, and the emulator is reconfigured with the same bytes
+    readConf()
+    hw_proc  = rtlHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,DATA_WIDTH,MAX_CHAINS,BUILDING_BLOCKS,DATA_TYPE,DEVICE_FAM)
+    emu_proc = emulatedHw(N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS)
+    pushVals(emu_proc,hw_proc,4,eof1=[False,True,False,True])
+
+    # Both start with a different firmware than the one they are reconfigured with
+    fw = firm.raw(hw_proc.compiler)
+    emu_proc.config(fw)
+    hw_proc.config(fw)
+
+    # The delta only changes one range set of the histogram (a single FUVRF row)
+    fuvrf = list(np.arange(FUVRF_SIZE*M)*0.75)
+    new_fuvrf = [v+0.5 for v in fuvrf[:M]]+fuvrf[M:]
+    fw = firm.distribution(compiler(N,M,MAX_CHAINS),bins=M,M=M)
+    image = encodeImage(fw,fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,DATA_TYPE)
+    new_image = encodeImage(fw,new_fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,DATA_TYPE)
+    delta = encodeDelta(image,new_image,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+    for img in [image,delta]:
+        hw_proc.reconfigure(img)
+        emu_proc.reconfigure(img,DATA_TYPE,DATA_WIDTH)
+
+    # Run HW simulation and emulation
+    steps=30
+    hw_results = hw_proc.run(steps=steps,gui=False,log=False)
+    emu_results = emu_proc.run(steps=steps)
+
+    # Filter Results
+    emu_results_filtered, hw_results_filtered = filterResults(emu_results, hw_results, DATA_TYPE)
+
+    # Verify that results are equal
+    assert np.allclose(emu_results_filtered,hw_results_filtered,rtol=0.01)
+    print("Passed test #10")
+
+uartReconfiguration()
@@ -0,0 +1,49 @@
+import os, queue
+from concurrent.futures import ThreadPoolExecutor
+from containers.modelsim.modelsimContainer import modelsimContainer
+from containers.modelsim.modelsimSession import modelsimSession
+
+''' Sessions that share one Modelsim container, each with its own working directory, so simulations can run in parallel '''
+# Each worker is a modelsimSession, so it also keeps its compiled libraries across the simulations it runs
+class modelsimPool():
+
+    def start(self):
+        for session in self.sessions:
+            session.start()
+            self.free.put(session)
+
+    # Calls function(session,item) for each item with the first session that is free and returns the results in the same order
+    def map(self,function,items):
+        def work(item):
+            session=self.free.get()
+            try:
+                return function(session,item)
+            finally:
+                self.free.put(session)
+        with ThreadPoolExecutor(len(self.sessions)) as executor:
+            return list(executor.map(work,items))
+
+    # Runs the testbench of each rtlHw (see rtlHw.run) and returns their results in the same order
+    # Each rtlHw gets its own RTL folder inside folder, which is reused (and only partially rewritten) by later calls
+    def run(self,hw_procs,steps=50,folder="."):
+        hw_procs=list(hw_procs)
+        folders=[os.path.join(folder,f"rtl_{idx}") for idx in range(len(hw_procs))]
+        return self.map(lambda session, job: job[0].run(steps=steps,session=session,folder=job[1]),list(zip(hw_procs,folders)))
+
+    # Closes all sessions and stops the container
+    def close(self):
+        for session in self.sessions:
+            session.close()
+        self.container.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def __init__(self,workers=os.cpu_count(),log=False):
+        self.container=modelsimContainer(log)
+        self.sessions=[modelsimSession(log,f"/rtl_{idx}",self.container) for idx in range(workers)]
+        self.free=queue.Queue()
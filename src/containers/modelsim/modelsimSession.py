@@ -0,0 +1,95 @@
+import hashlib
+from containers.modelsim.modelsimContainer import modelsimContainer
+
+# Simulation libraries of the vendor IP, which are compiled once into their own library
+VENDOR_FILES=['altera_mf.v','altera_lnsim.sv']
+VENDOR_LIBRARY='altera'
+# Files that are read when simulating, so changing them doesn't require compiling the design again
+SIMULATION_FILES=('.mif','.hex')
+
+''' Modelsim container that keeps running across simulations, together with the files and libraries compiled in it '''
+# Only files that changed since the previous simulation are copied, the vendor libraries are only compiled again when they change
+# and the design is compiled incrementally (vlog -incr), so usually only the modules that changed are compiled
+class modelsimSession():
+
+    # Starts the container (if it is not running yet) with an empty working directory
+    def start(self):
+        self.container.container.reload()
+        if self.container.container.status!='running':
+            self.container.start()
+        self.container.exec('rm -rf '+self.workdir)
+        self.container.exec('mkdir -p '+self.workdir)
+        self.files={}
+        self.changed=[]
+        self.vendor=None
+        self.compiled=False
+        self.started=True
+
+    # Copies the files of the rtl folder whose hash (see rtlHw.generateRtl) changed since they were last copied
+    def sync(self,rtl_folder,hashes):
+        assert self.started, "Session must be started first"
+        changed=[name for name in sorted(hashes) if self.files.get(name)!=hashes[name]]
+        for name in changed:
+            self.container.copy(rtl_folder+"/"+name,self.name+':'+self.workdir+'/'+name)
+            self.files[name]=hashes[name]
+        self.changed=self.changed+changed
+        return changed
+
+    # Compiles the vendor libraries if they changed and the design if any of its files changed since the last compilation
+    def compile(self):
+        vendor=hashlib.sha256(repr([self.files.get(name) for name in VENDOR_FILES]).encode()).hexdigest()
+        if vendor!=self.vendor:
+            self.container.exec('vlib '+VENDOR_LIBRARY,working_directory=self.workdir)
+            self.container.exec('vlog -work '+VENDOR_LIBRARY+' '+' '.join(VENDOR_FILES),working_directory=self.workdir)
+            self.vendor=vendor
+            self.vendor_compilations=self.vendor_compilations+1
+        # Memory initialization files and the testbench stimulus are only read by the simulation
+        design=[name for name in self.changed if name not in VENDOR_FILES and not name.endswith(SIMULATION_FILES)]
+        if not self.compiled:
+            self.container.exec('vlib work',working_directory=self.workdir)
+        if design or not self.compiled:
+            self.container.exec('vlog -incr testbench.sv',working_directory=self.workdir)
+            self.compiled=True
+            self.compilations=self.compilations+1
+        self.changed=[]
+
+    # Runs the testbench and copies the given result files to the local folder
+    def simulate(self,results,folder='.',gui=False):
+        if gui:
+            print("Opening GUI\n\tMake sure to open socket using this command on your mac:\n\tsocat TCP-LISTEN:6000,reuseaddr,fork UNIX-CLIENT:\\\"$DISPLAY\\\"")
+            self.container.exec('vsim -gui -L '+VENDOR_LIBRARY+' -do "run -all" testbench',working_directory=self.workdir)
+        else:
+            self.container.exec('vsim -c -L '+VENDOR_LIBRARY+' -do "run -all" testbench',working_directory=self.workdir)
+        for name in results:
+            self.container.copy(self.name+':'+self.workdir+'/'+name,folder+'/'+name)
+        self.simulations=self.simulations+1
+
+    # Removes the working directory and stops the container (unless it is shared with other sessions)
+    def close(self):
+        if self.started:
+            self.container.exec('rm -rf '+self.workdir)
+            if not self.shared:
+                self.container.stop()
+            self.started=False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    # Sessions can share a container (see modelsimPool) as long as each one has its own working directory
+    def __init__(self,log=True,workdir='/rtl',container=None):
+        self.shared=container is not None
+        self.container=modelsimContainer(log) if container is None else container
+        self.name=self.container.container.name
+        self.workdir=workdir
+        self.files={}          # Hash of the files copied to the container
+        self.changed=[]        # Files copied since the last compilation
+        self.vendor=None       # Hash of the vendor libraries that were compiled
+        self.compiled=False
+        self.started=False
+        self.vendor_compilations=0
+        self.compilations=0
+        self.simulations=0
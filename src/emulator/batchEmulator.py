@@ -0,0 +1,355 @@
+import math
+import numpy as np
+from firmware.compiler import compiler
+from misc.misc import *
+from emulator.emulator import EOF0, EOF1, BOF0, BOF1, fuChain, mvruChain, vsruChain, vvaluChain, dpChain, decodeFirmware
+from emulator.fastEmulator import ALU_OPS
+
+# Returns the frame flags of the input vectors of all instances
+def batchFrameFlags(eof,bof):
+    return eof[:,0]*EOF0 | eof[:,1]*EOF1 | bof[:,0]*BOF0 | bof[:,1]*BOF1
+
+# Firmware of each block is stored as a KxCHAINSxFIELDS table, with the same fields as the chain records of emulatedHw
+def chainTable(K,MAX_CHAINS,record):
+    return np.zeros((K,MAX_CHAINS+1,len(record.__slots__)),dtype=int)
+
+''' Cycle-accurate emulation of K instances with the same N and M, each one with its own firmware and inputs '''
+# Every register, VRF, minicache and trace buffer has a leading instance axis, so all instances advance in one step
+class batchEmulatedHw():
+
+    # Input buffer class (one ring buffer per instance)
+    class InputBuffer():
+        def __init__(self,K,N,IB_DEPTH):
+            self.K = K
+            self.N = N
+            self.size=IB_DEPTH
+            self.buffer=np.zeros((K,IB_DEPTH+1,N))
+            self.eof=np.zeros((K,IB_DEPTH+1,2),dtype=bool)
+            self.head=np.zeros(K,dtype=int)
+            self.count=np.zeros(K,dtype=int)
+            self.num_chains=np.ones(K,dtype=int)
+            self.chainId_out=np.zeros(K,dtype=int)
+            self.bof_out=np.ones((K,2),dtype=bool)
+            self.k=np.arange(K)
+
+        def push(self,pushed_vals,instances=None):
+            instances=np.arange(self.K) if instances is None else np.asarray(instances).reshape(-1)
+            if len(pushed_vals)==2:
+                pushed_vals=list(pushed_vals)+[False]
+            v_in, eof0, eof1 = pushed_vals
+            v_in=np.asarray(v_in,dtype=float)
+            assert v_in.shape==(len(instances),self.N), "Input must be KxN"
+            assert np.all(self.count[instances]<=self.size), "Input buffer overflowed"
+            pos=(self.head[instances]+self.count[instances])%(self.size+1)
+            self.buffer[instances,pos]=v_in
+            self.eof[instances,pos,0]=eof0
+            self.eof[instances,pos,1]=eof1
+            self.count[instances]+=1
+
+        def step(self):
+            # Instances move to the next element of their input buffer once all chains were dispatched for the previous one
+            dispatch=(self.count>0) & (self.chainId_out<self.num_chains)
+            pop=dispatch & (self.chainId_out==self.num_chains-1)
+            self.bof_out[pop]=self.eof[pop,self.head[pop]]
+            self.head[pop]=(self.head[pop]+1)%(self.size+1)
+            self.count[pop]-=1
+            self.chainId_out=np.where(pop,np.where(self.count>0,1,0),np.where(dispatch,self.chainId_out+1,self.chainId_out))
+            self.chainId_out[self.count==0]=0
+
+            # Instances with an empty input buffer dispatch chain 0, which is a pass through
+            valid=self.count>0
+            v_out=self.buffer[self.k,self.head]*valid[:,None]
+            eof_out=self.eof[self.k,self.head] & valid[:,None]
+            return v_out, eof_out, self.bof_out.copy(), self.chainId_out.copy()
+
+    # Filter Unit
+    class FilterUnit():
+        def __init__(self,K,N,M,FUVRF_SIZE,MAX_CHAINS):
+            self.v_in=np.zeros((K,N))
+            self.eof_in=np.zeros((K,2),dtype=bool)
+            self.bof_in=np.ones((K,2),dtype=bool)
+            self.chainId_in=np.zeros(K,dtype=int)
+            self.chainId_out=np.zeros(K,dtype=int)
+            self.vrf=np.zeros((K,FUVRF_SIZE*M))
+            self.config=chainTable(K,MAX_CHAINS,fuChain)
+            self.k=np.arange(K)
+            self.K = K
+            self.M = M
+            self.N = N
+
+        # Returns the lower and upper limits of the M ranges used by each instance (see emulatedHw.FilterUnit.ranges)
+        def ranges(self,addr):
+            vrf=np.asarray(self.vrf,dtype=float)
+            length=vrf.shape[1]
+            idx=self.k[:,None]
+            base=addr*self.M
+            low_range=vrf[idx,base[:,None]+np.arange(self.M)]
+            high_range=vrf[idx,np.minimum(base[:,None]+np.arange(1,self.M+1),length-1)]
+            extrapolate=base+self.M>=length
+            last_range=low_range[extrapolate,-1]
+            high_range[extrapolate,-1]=last_range+(last_range-vrf[extrapolate,(base[extrapolate]+self.M-2)%length])
+            return low_range, high_range
+
+        def step(self,input_value):
+            filtering, addr = self.config[self.k,self.chainId_in].T
+            low_range, high_range = self.ranges(addr)
+            v=self.v_in[:,None,:]
+            m_out=((v>low_range[:,:,None]) & (v<=high_range[:,:,None])).astype(float)
+
+            # If we are not filtering, just pass the value through
+            passing=filtering!=1
+            if passing.any():
+                m_out[passing]=0
+                m_out[passing,0]=self.v_in[passing]
+
+            eof_out, bof_out, self.chainId_out = self.eof_in, self.bof_in, self.chainId_in
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
+            return m_out, eof_out, bof_out, self.chainId_out
+
+    # This block will reduce the matrix along a given axis
+    # If M<N, then the results will be padded with zeros
+    class MatrixVectorReduce():
+        def __init__(self,K,N,M,MAX_CHAINS):
+            self.m_in=np.zeros((K,M,N))
+            self.eof_in=np.zeros((K,2),dtype=bool)
+            self.bof_in=np.ones((K,2),dtype=bool)
+            self.chainId_in=np.zeros(K,dtype=int)
+            self.chainId_out=np.zeros(K,dtype=int)
+            self.config=chainTable(K,MAX_CHAINS,mvruChain)
+            self.k=np.arange(K)
+            self.K = K
+            self.N = N
+            self.M = M
+
+        def step(self,input_value):
+            axis=self.config[self.k,self.chainId_in,0]
+            v_out=np.zeros((self.K,self.N))
+            for a in np.unique(axis):
+                selected=axis==a
+                if a==0:
+                    v_out[selected]=self.m_in[selected,0]
+                elif a==1:
+                    v_out[selected]=np.sum(self.m_in[selected],axis=1)
+                elif a==2:
+                    v_out[selected,:self.M]=np.sum(self.m_in[selected],axis=2)
+
+            eof_out, bof_out, self.chainId_out = self.eof_in, self.bof_in, self.chainId_in
+            self.m_in, self.eof_in, self.bof_in, self.chainId_in = input_value
+            return v_out, eof_out, bof_out, self.chainId_out
+
+    # This block will reduce a vector to a scalar and pad with zeros
+    class VectorScalarReduce():
+        def __init__(self,K,N,MAX_CHAINS):
+            self.v_in=np.zeros((K,N))
+            self.eof_in=np.zeros((K,2),dtype=bool)
+            self.bof_in=np.ones((K,2),dtype=bool)
+            self.chainId_in=np.zeros(K,dtype=int)
+            self.chainId_out=np.zeros(K,dtype=int)
+            self.config=chainTable(K,MAX_CHAINS,vsruChain)
+            self.k=np.arange(K)
+            self.K = K
+            self.N = N
+
+        def step(self,input_value):
+            reduce=self.config[self.k,self.chainId_in,0]==1
+            v_out=np.copy(self.v_in)
+            if reduce.any():
+                v_out[reduce,0]=np.sum(self.v_in[reduce],axis=1)
+                v_out[reduce,1:]=0
+
+            eof_out, bof_out, self.chainId_out = self.eof_in, self.bof_in, self.chainId_in
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
+            return v_out, eof_out, bof_out, self.chainId_out
+
+    # This block will reduce the matrix along a given axis
+    class VectorVectorALU():
+        def __init__(self,K,N,VVVRF_SIZE,MAX_CHAINS):
+            self.v_in=np.zeros((K,N))
+            self.eof_in=np.zeros((K,2),dtype=bool)
+            self.bof_in=np.zeros((K,2),dtype=bool)
+            self.chainId_in=np.zeros(K,dtype=int)
+            self.vrf=np.zeros((K,N*VVVRF_SIZE))
+            self.minicache=np.zeros((K,N))
+            # Results are delayed for 2 cycles, so this FU takes 3 cycles (read, calculate, write)
+            self.v_out_d1, self.v_out_d2 = np.zeros((K,N)), np.zeros((K,N))
+            self.eof_out_d1, self.eof_out_d2 = np.zeros((K,2),dtype=bool), np.zeros((K,2),dtype=bool)
+            self.bof_out_d1, self.bof_out_d2 = np.ones((K,2),dtype=bool), np.ones((K,2),dtype=bool)
+            self.chainId_out_d1, self.chainId_out_d2 = np.zeros(K,dtype=int), np.zeros(K,dtype=int)
+            self.chainId_out=np.zeros(K,dtype=int)
+            self.config=chainTable(K,MAX_CHAINS,vvaluChain)
+            self.k=np.arange(K)
+            self.K = K
+            self.N = N
+
+        def step(self,input_value):
+            k=self.k
+            op, addr, cache, cache_addr, load, save, cond_mask, cond_value, cache_cond_mask, cache_cond_value = self.config[k,self.chainId_in].T
+            v_out, eof_out, bof_out, self.chainId_out = self.v_out_d2, self.eof_out_d2, self.bof_out_d2, self.chainId_out_d2
+            self.eof_out_d2, self.bof_out_d2, self.chainId_out_d2 = self.eof_out_d1, self.bof_out_d1, self.chainId_out_d1
+            self.eof_out_d1, self.bof_out_d1, self.chainId_out_d1 = self.eof_in, self.bof_in, self.chainId_in
+            flags=batchFrameFlags(self.eof_in,self.bof_in)
+            op=np.where((flags & cond_mask)==cond_value,op,0)
+
+            # Checking if we should use minicache or input vector as operator
+            operator=np.where(load[:,None]==1,self.minicache,self.v_in)
+            vrf=self.vrf.reshape(self.K,-1,self.N)
+            result=np.copy(operator)
+            for code in np.unique(op):
+                if code!=0:
+                    selected=op==code
+                    result[selected]=ALU_OPS[code](operator[selected],vrf[k[selected],addr[selected]])
+
+            cache=(cache==1) & ((flags & cache_cond_mask)==cache_cond_value)
+            if cache.any():
+                vrf[k[cache],cache_addr[cache]]=result[cache]
+            save=save==1
+            if save.any():
+                self.minicache[save]=result[save]
+            self.v_out_d2, self.v_out_d1 = self.v_out_d1, result
+
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
+            return v_out, eof_out, bof_out, self.chainId_out
+
+    # Packs data efficiently
+    class DataPacker():
+        def __init__(self,K,N,MAX_CHAINS):
+            self.v_in=np.zeros((K,N))
+            self.eof_in=np.zeros((K,2),dtype=bool)
+            self.bof_in=np.ones((K,2),dtype=bool)
+            self.chainId_in=np.zeros(K,dtype=int)
+            # Values are packed in place (values that overflow N elements are never pushed, so they are not kept)
+            self.packed=np.zeros((K,N))
+            self.packed_length=np.full(K,N)
+            self.v_out_size=np.zeros(K,dtype=int)
+            self.v_out_valid=np.zeros(K,dtype=bool)
+            self.col=np.arange(N)[None,:]
+            self.config=chainTable(K,MAX_CHAINS,dpChain)
+            self.k=np.arange(K)
+            self.K = K
+            self.N = N
+
+        # Returns the packed values of a given instance
+        def v_out(self,k):
+            return self.packed[k,:min(self.packed_length[k],self.N)]
+
+        def step(self,input_value):
+            commit, size, cond_mask, cond_value = self.config[self.k,self.chainId_in].T
+            commit=(commit==1) & ((batchFrameFlags(self.eof_in,self.bof_in) & cond_mask)==cond_value)
+            if commit.any():
+                # Each committing instance copies its values to the positions that follow the ones already packed
+                col=self.col-self.v_out_size[:,None]
+                copy_mask=commit[:,None] & (col>=0) & (col<size[:,None])
+                self.packed[copy_mask]=self.v_in[self.k[:,None],np.clip(col,0,self.N-1)][copy_mask]
+                self.v_out_size=np.where(commit,self.v_out_size+size,self.v_out_size)
+                self.packed_length=np.where(commit,self.v_out_size,self.packed_length)
+                self.v_out_valid=commit & (self.v_out_size==self.N)
+                self.v_out_size[self.v_out_valid]=0
+            else:
+                self.v_out_valid=commit
+
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
+            return self.packed, self.v_out_valid
+
+    # Circular trace buffer of each instance
+    class TraceBuffer():
+        def __init__(self,K,N,TB_SIZE):
+            self.mem=np.zeros((K,TB_SIZE,N))
+            self.size=np.zeros(K,dtype=int)
+            self.TB_SIZE=TB_SIZE
+
+        def step(self,packed_data):
+            output, output_valid = packed_data
+            if not output_valid.any():
+                return
+            self.size[output_valid & (self.size==self.TB_SIZE)]=0
+            self.mem[output_valid,self.size[output_valid]]=output[output_valid]
+            self.size[output_valid]+=1
+
+    def step(self):
+        self.cycle=self.cycle+1
+
+        # Perform operations according to how building blocks are connected
+        for b in self.BUILDING_BLOCKS:
+            if b=='InputBuffer':
+                chain = self.ib.step()
+            elif b=='FilterReduceUnit':
+                chain = self.fu.step(chain)
+                chain = self.mvru.step(chain)
+            elif b=='VectorVectorALU':
+                chain = self.vvalu.step(chain)
+            elif b=='VectorScalarReduce':
+                chain = self.vsru.step(chain)
+            elif b=='DataPacker':
+                packed_data = self.dp.step(chain)
+            elif b=='TraceBuffer':
+                self.tb.step(packed_data)
+            else:
+                assert False, "Unknown building block "+b
+
+    # Pushes one vector to the input of each instance (or of the given instances)
+    def push(self,pushed_vals,instances=None):
+        self.ib.push(pushed_vals,instances)
+
+    # Configures each instance with its own firmware (a single firmware is used by all instances)
+    def config(self,fw=None):
+        fws=fw if isinstance(fw,list) else [fw]*self.K
+        assert len(fws)==self.K, "Expected one firmware per instance"
+        for k, fw in enumerate(fws):
+            tables=decodeFirmware(fw)
+            self.ib.num_chains[k]=len(tables['fu'])
+            for block in [self.fu,self.mvru,self.vsru,self.vvalu,self.dp]:
+                block.config[k]=0
+            for block, table in [(self.fu,'fu'),(self.mvru,'mvru'),(self.vsru,'vsru'),(self.vvalu,'vvalu'),(self.dp,'dp')]:
+                block.config[k,:len(tables[table])]=[[getattr(r,f) for f in r.__slots__] for r in tables[table]]
+
+    # Checks if the input buffers are empty and only pass through bubbles (chain 0) are left in all pipelines
+    def drained(self):
+        return (not self.ib.count.any() and
+                not self.fu.chainId_in.any() and not self.fu.chainId_out.any() and
+                not self.mvru.chainId_in.any() and not self.mvru.chainId_out.any() and
+                not self.vvalu.chainId_in.any() and not self.vvalu.chainId_out_d1.any() and
+                not self.vvalu.chainId_out_d2.any() and not self.vvalu.chainId_out.any() and
+                not self.vsru.chainId_in.any() and not self.vsru.chainId_out.any() and
+                not self.dp.chainId_in.any())
+
+    def run(self,steps=50):
+        # Same as emulatedHw.run (steps=None stops as soon as all instances are drained)
+        i=0
+        while steps is None or i<steps:
+            if self.drained():
+                if steps is not None:
+                    self.cycle=self.cycle+steps-i
+                break
+            self.step()
+            i=i+1
+        return self.log
+
+    def __init__(self,K,N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS):
+        ''' Verifying parameters '''
+        assert math.log(N, 2).is_integer(), "N must be a power of 2"
+        assert math.log(M, 2).is_integer(), "N must be a power of 2"
+        assert M<=N, "M must be less or equal to N"
+
+        # hardware building blocks
+        self.K=K
+        self.N=N
+        self.M=M
+        self.BUILDING_BLOCKS=BUILDING_BLOCKS
+        self.MAX_CHAINS=MAX_CHAINS
+        self.ib   = self.InputBuffer(K,N,IB_DEPTH)
+        self.fu   = self.FilterUnit(K,N,M,FUVRF_SIZE,MAX_CHAINS)
+        self.mvru = self.MatrixVectorReduce(K,N,M,MAX_CHAINS)
+        self.vsru = self.VectorScalarReduce(K,N,MAX_CHAINS)
+        self.vvalu= self.VectorVectorALU(K,N,VVVRF_SIZE,MAX_CHAINS)
+        self.dp   = self.DataPacker(K,N,MAX_CHAINS)
+        self.tb   = self.TraceBuffer(K,N,TB_SIZE)
+        self.config()
+
+        # Firmware compiler
+        self.compiler = compiler(N,M,MAX_CHAINS)
+
+        # Number of cycles emulated so far
+        self.cycle=0
+
+        # Trace buffers of all instances (log['tb'][-1][k] is the trace buffer of instance k)
+        self.log={'tb':[self.tb.mem]}
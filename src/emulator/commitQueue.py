@@ -0,0 +1,77 @@
+import queue, threading
+import numpy as np
+from misc.misc import struct
+
+''' Bounded, thread-safe queue of the rows packed by the DataPacker (see emulatedHw.subscribe) '''
+# When the queue is full, 'block' stalls the emulation until the consumer catches up and 'drop' discards the row (counted in dropped)
+# Nothing would ever make space in a queue that no one reads, so a full 'block' queue without a consumer (start or get) raises instead
+class commitQueue():
+
+    # Probe attached to the 'packed' event of the DataPacker (rows are copied, since the packer reuses its buffer)
+    def __call__(self,info):
+        row=struct(cycle=info.cycle,vector=np.array(info.vector))
+        if self.policy=='block':
+            if self.queue.full() and not self.consumed():
+                raise RuntimeError("Commit queue is full and has no consumer (start one before running the processor or use policy='drop')")
+            self.queue.put(row)
+        else:
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                self.dropped=self.dropped+1
+
+    # Returns the next row as a struct with the cycle and the packed vector (None once the queue is closed and empty)
+    def get(self,timeout=None):
+        self.reading=True
+        if self.closed and self.queue.empty():
+            return None
+        row=self.queue.get(timeout=timeout)
+        if row is None:
+            # Leave the end marker for other consumers
+            self.mark()
+        return row
+
+    # Checks if a consumer started reading the queue
+    def consumed(self):
+        return self.reading or self.thread is not None
+
+    # Iterates over the rows until the queue is closed
+    def __iter__(self):
+        row=self.get()
+        while row is not None:
+            yield row
+            row=self.get()
+
+    # Calls a function with each row in a background thread (see join)
+    def start(self,callback):
+        def consume():
+            for row in self:
+                callback(row)
+        self.thread=threading.Thread(target=consume,daemon=True)
+        self.thread.start()
+
+    # Marks the end of the rows (the consumer still gets all rows that were queued before)
+    # Closing never blocks: if the queue is full, consumers see that it is closed once they have read all rows
+    def close(self):
+        self.closed=True
+        self.mark()
+
+    def mark(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    # Waits for the background consumer to process all rows
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def __init__(self,maxsize=1024,policy='block'):
+        assert policy in ['block','drop'], "Unknown policy "+str(policy)
+        self.queue=queue.Queue(maxsize)
+        self.policy=policy
+        self.dropped=0
+        self.thread=None
+        self.reading=False
+        self.closed=False
@@ -1,26 +1,94 @@
-import logging as log
-import sys, math
+import math, itertools
+from collections import deque
 import numpy as np
 from firmware.compiler import compiler
+from firmware.binary import DELTA_COMMAND, encodeImage, decodeImage, applyDelta, deltaFuvrfRows
 from misc.misc import *
-
-# Setting Debug level (can be debug, info, warning, error and critical)
-log.basicConfig(stream=sys.stderr, level=log.INFO)
+from emulator.signalLog import signalLog
+from emulator.probes import probeSet
+from emulator.fixedPoint import fixedPoint
+from emulator.traceFile import traceFile
+from emulator.commitQueue import commitQueue
+from emulator import snapshot
 
 ''' Emulation settings '''
 DEBUG=True
 
+# Cycles of bubbles that flush the values of a drained pipeline, and period of the banks of the pipeline registers (see emulatedHw.skip)
+FLUSH_CYCLES=16
+BANK_PERIOD=4
+
+# Bits of the frame flags of an input vector
+EOF0, EOF1, BOF0, BOF1, NEVER = 1, 2, 4, 8, 16
+
+# Firmware is decoded into one table of records per block, indexed by chainId
+class fuChain(record):
+    __slots__=['filter','addr']
+class mvruChain(record):
+    __slots__=['axis']
+class vsruChain(record):
+    __slots__=['op']
+class vvaluChain(record):
+    __slots__=['op','addr','cache','cache_addr','load','save','cond_mask','cond_value','cache_cond_mask','cache_cond_value']
+class dpChain(record):
+    __slots__=['commit','size','cond_mask','cond_value']
+
+# Encodes both conditions of a chain as a mask of the frame flags that matter and the value they must have
+# Conditions that can never be met (e.g. 'last' and 'notlast') set a bit outside of the mask
+def encodeCondition(cond1,cond2):
+    mask, value = 0, 0
+    for cond, eof, bof in [(cond1,EOF0,BOF0),(cond2,EOF1,BOF1)]:
+        for key, bit, expected in [('last',eof,eof),('notlast',eof,0),('first',bof,bof),('notfirst',bof,0)]:
+            if cond[key]:
+                if (mask & bit) and (value & bit)!=expected:
+                    value = value | NEVER
+                mask, value = mask | bit, value | expected
+    return mask, value
+
+# Decodes a firmware into one table of chain records per block
+# Chain 0 is the pass through dispatched by the input buffer when there is nothing to process
+def decodeFirmware(fw):
+    valid_chains = 0 if fw is None else fw['valid_chains']
+    tables={'fu':[fuChain()],'mvru':[mvruChain()],'vsru':[vsruChain()],'vvalu':[vvaluChain()],'dp':[dpChain()]}
+    for idx in range(valid_chains):
+        fu, mvru, vsru, vvalu, dp = fw['fu'][idx], fw['mvru'][idx], fw['vsru'][idx], fw['vvalu'][idx], fw['dp'][idx]
+        cond_mask, cond_value = encodeCondition(vvalu.cond1,vvalu.cond2)
+        cache_cond_mask, cache_cond_value = encodeCondition(vvalu.cache_cond1,vvalu.cache_cond2)
+        tables['fu'].append(fuChain(filter=fu.filter,addr=fu.addr))
+        tables['mvru'].append(mvruChain(axis=mvru.axis))
+        tables['vsru'].append(vsruChain(op=vsru.op))
+        tables['vvalu'].append(vvaluChain(op=vvalu.op,addr=vvalu.addr,cache=vvalu.cache,cache_addr=vvalu.cache_addr,
+                                          load=vvalu.minicache in [1,3],save=vvalu.minicache in [2,3],
+                                          cond_mask=cond_mask,cond_value=cond_value,
+                                          cache_cond_mask=cache_cond_mask,cache_cond_value=cache_cond_value))
+        cond_mask, cond_value = encodeCondition(dp.cond1,dp.cond2)
+        tables['dp'].append(dpChain(commit=dp.commit,size=dp.size,cond_mask=cond_mask,cond_value=cond_value))
+    return tables
+
+# Memories shared with a snapshot are read-only and are copied the first time they are written (copy-on-write)
+def writable(array):
+    return np.array(array) if isinstance(array,np.ndarray) and not array.flags.writeable else array
+
+# Returns the frame flags of an input vector
+def frameFlags(eof,bof):
+    return (EOF0 if eof[0] else 0) | (EOF1 if eof[1] else 0) | (BOF0 if bof[0] else 0) | (BOF1 if bof[1] else 0)
+
 class emulatedHw():
 
     # Input buffer class 
     class InputBuffer():
-        def __init__(self,N,IB_DEPTH):
-            self.buffer=[]
+        def __init__(self,N,IB_DEPTH,dtype=float):
+            self.buffer=deque()
             self.N = N
             self.size=IB_DEPTH
             self.config=None
             self.chainId_out = 0
             self.bof_out=[True,True]
+            self.zeros=np.zeros(N,dtype=dtype)
+            # Input stream (see emulatedHw.stream) and number of cycles it was stalled by a full input buffer
+            self.source=None
+            self.pending=None
+            self.stalls=0
 
         def push(self,pushed_vals):
             eof_in = [False,False]
@@ -28,15 +96,32 @@ class emulatedHw():
                 pushed_vals.append(False)
             v_in, eof_in[0], eof_in[1] = pushed_vals
             assert list(v_in.shape)==[self.N], "Input must be Nx1"
+            if self.fxp is not None:
+                v_in=self.fxp.quantize(v_in)
             assert len(self.buffer)<=self.size, "Input buffer overflowed"
-            log.debug('Vector inserted into input buffer\n'+str(v_in))
             self.buffer.append([v_in,eof_in])
+            if 'push' in self.probes:
+                self.probes.fire('push',v_in,eof_in)
 
         def pop(self):
-            log.debug("Removing element from input buffer")
             assert len(self.buffer)>0, "Input buffer is empty"
             self.bof_out=self.buffer[0][1]
-            return self.buffer.pop(0)
+            if 'pop' in self.probes:
+                self.probes.fire('pop',*self.buffer[0])
+            return self.buffer.popleft()
+
+        def full(self):
+            return len(self.buffer)>self.size
+
+        # Pulls a new vector from the input stream if there is space in the input buffer
+        def feed(self):
+            if self.pending is None:
+                return
+            if self.full():
+                self.stalls=self.stalls+1
+            else:
+                self.push(list(self.pending))
+                self.pending=next(self.source,None)
 
         def step(self):
             # Dispatch a new chain if the input buffer is not empty
@@ -57,54 +142,90 @@ class emulatedHw():
             if len(self.buffer)>0:
                 v_out, eof_out = self.buffer[0]
             else:
-                v_out, eof_out = np.zeros(self.N), False
+                v_out, eof_out = self.zeros, False
             return v_out, eof_out, self.bof_out, self.chainId_out
 
     # Filter Unit
     class FilterUnit():
-        def __init__(self,N,M,FUVRF_SIZE):
-            self.v_in=np.zeros(N)
-            self.m_out=np.zeros((M,N))
+        def __init__(self,N,M,FUVRF_SIZE,dtype=float):
+            self.v_in=np.zeros(N,dtype=dtype)
+            self.m_out=np.zeros((M,N),dtype=dtype)
+            # Outputs alternate between two banks, so the next block can hold the previous one without copying it
+            self.m_bank=[np.zeros((M,N),dtype=dtype),np.zeros((M,N),dtype=dtype)]
+            self.bank=0
+            self.above=np.zeros((M,N),dtype=bool)
+            self.below=np.zeros((M,N),dtype=bool)
+            # Limits of the ranges and unsigned codes of the input vector (integer modes), filled in place every cycle
+            self.low_range=np.zeros(M,dtype=dtype)
+            self.high_range=np.zeros(M,dtype=dtype)
+            self.codes=np.zeros(N,dtype=dtype)
             self.eof_in = [False,False]
             self.eof_out = [False,False]
             self.bof_in = [True,True]
             self.bof_out = [True,True]
             self.chainId_in = 0
             self.chainId_out = 0
-            self.vrf=np.zeros(FUVRF_SIZE*M)
+            self.vrf=np.zeros(FUVRF_SIZE*M,dtype=dtype)
             self.config=None
             self.M = M
             self.N = N
 
+        # Returns the lower and upper limits of the M ranges starting at a given address
+        # Range i is (vrf[i],vrf[i+1]] and the upper limit of a range at the end of the vrf is extrapolated from the previous one
+        # Integer modes follow filter_reduce_unit.sv instead: limits are the unsigned codes of a single FUVRF row, and the
+        # upper limit of its last range is row[M-1]+row[1]-row[0] (row[0]+1 if M==1), wrapped around at DATA_WIDTH bits
+        def ranges(self,addr):
+            base=addr*self.M
+            vrf=self.vrf
+            if self.fxp is None:
+                np.copyto(self.low_range,vrf[base:base+self.M])
+                upper=vrf[base+1:base+self.M+1]
+                self.high_range[:len(upper)]=upper
+                if base+self.M>=len(vrf):
+                    self.high_range[-1]=self.low_range[-1]+(self.low_range[-1]-vrf[base+self.M-2])
+            else:
+                np.bitwise_and(vrf[base:base+self.M],self.fxp.mask,out=self.low_range)
+                self.high_range[:-1]=self.low_range[1:]
+                if self.M>1:
+                    self.high_range[-1]=(self.low_range[-1]+self.low_range[1]-self.low_range[0]) & self.fxp.mask
+                else:
+                    self.high_range[-1]=(self.low_range[0]+1) & self.fxp.mask
+            return self.low_range, self.high_range
+
         def step(self,input_value):
             # Check if the vector is within M ranges
             cfg=self.config[self.chainId_in]
-            log.debug('Filter input:'+str(self.v_in))
-            log.debug('Filtering using the following ranges:'+str(self.vrf[cfg.addr*self.M:cfg.addr*self.M+self.M+1]))
+            self.bank=1-self.bank
+            self.m_out=self.m_bank[self.bank]
             if cfg.filter==1:
-                for i in range(self.M):
-                    low_range = self.vrf[cfg.addr*self.M+i]
-                    if cfg.addr*self.M+i+1<len(self.vrf):
-                        high_range = self.vrf[cfg.addr*self.M+i+1]
-                    else:
-                        high_range = low_range+(low_range-self.vrf[cfg.addr*self.M+i-1])
-                    within_range = np.all([self.v_in>low_range, self.v_in<=high_range],axis=0)
-                    self.m_out[i]=within_range[:]
+                # All M ranges are compared at once by broadcasting the input vector against the range limits
+                low_range, high_range = self.ranges(cfg.addr)
+                v_in=self.v_in if self.fxp is None else np.bitwise_and(self.v_in,self.fxp.mask,out=self.codes)
+                np.greater(v_in,low_range[:,None],out=self.above)
+                np.less_equal(v_in,high_range[:,None],out=self.below)
+                np.logical_and(self.above,self.below,out=self.m_out)
+                # Values within a range are reduced as 1.0 in fixed point
+                if self.fxp is not None and self.fxp.one!=1:
+                    self.m_out*=self.fxp.one
             # If we are not filtering, just pass the value through 
             else:
-                for i in range(self.M):
-                    self.m_out[i] = self.v_in if i==0 else np.zeros(self.N)
+                np.copyto(self.m_out[0],self.v_in)
+                self.m_out[1:]=0
+            if 'filter' in self.probes:
+                self.probes.fire('filter',self.chainId_in,self.m_out)
 
             self.eof_out, self.bof_out, self.chainId_out = self.eof_in, self.bof_in, self.chainId_in
-            self.v_in, self.eof_in, self.bof_in, self.chainId_in = copy(input_value)
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
             return self.m_out, self.eof_out, self.bof_out, self.chainId_out
 
     # This block will reduce the matrix along a given axis
     # If M<N, then the results will be padded with zeros
     class MatrixVectorReduce():
-        def __init__(self,N,M):
-            self.m_in=np.zeros((M,N))
-            self.v_out=np.zeros(N)
+        def __init__(self,N,M,dtype=float):
+            self.m_in=np.zeros((M,N),dtype=dtype)
+            self.v_out=np.zeros(N,dtype=dtype)
+            self.v_bank=[np.zeros(N,dtype=dtype),np.zeros(N,dtype=dtype)]
+            self.bank=0
             self.eof_in = [False,False]
             self.eof_out = [False,False]
             self.bof_in = [True,True]
@@ -118,28 +239,32 @@ class emulatedHw():
         def step(self,input_value):
             # Reduce matrix along a given axis
             cfg=self.config[self.chainId_in]
+            self.bank=1-self.bank
+            self.v_out=self.v_bank[self.bank]
             if cfg.axis==0:
-                log.debug('Passing first vector through reduce unit')
-                self.v_out=self.m_in[0]
+                np.copyto(self.v_out,self.m_in[0])
             elif cfg.axis==1:
-                log.debug('Reducing matrix along N axis (axis = '+str(cfg.axis)+')')
-                self.v_out=np.sum(self.m_in,axis=0)
+                np.sum(self.m_in,axis=0,out=self.v_out)
             elif cfg.axis==2:
-                log.debug('Reducing matrix along M axis (axis = '+str(cfg.axis)+')')
-                self.v_out=np.sum(self.m_in,axis=1)
+                np.sum(self.m_in,axis=1,out=self.v_out[:self.M])
                 if self.N!=self.M:
-                    log.debug('Padding results with '+str(self.N-self.M)+' zeros')
-                    self.v_out=np.concatenate((self.v_out,np.zeros(self.N-self.M)))
+                    self.v_out[self.M:]=0
+            if self.fxp is not None:
+                self.fxp.wrap(self.v_out)
+            if 'reduce' in self.probes:
+                self.probes.fire('reduce',self.chainId_in,self.v_out)
 
             self.eof_out, self.bof_out, self.chainId_out    = self.eof_in, self.bof_in, self.chainId_in
-            self.m_in, self.eof_in, self.bof_in, self.chainId_in = copy(input_value)
+            self.m_in, self.eof_in, self.bof_in, self.chainId_in = input_value
             return self.v_out, self.eof_out, self.bof_out, self.chainId_out
 
     # This block will reduce a vector to a scalar and pad with zeros
     class VectorScalarReduce():
-        def __init__(self,N):
-            self.v_in=np.zeros(N)
-            self.v_out=np.zeros(N)
+        def __init__(self,N,dtype=float):
+            self.v_in=np.zeros(N,dtype=dtype)
+            self.v_out=np.zeros(N,dtype=dtype)
+            self.v_bank=[np.zeros(N,dtype=dtype),np.zeros(N,dtype=dtype)]
+            self.bank=0
             self.eof_in = [False,False]
             self.eof_out = [False,False]
             self.bof_in = [True,True]
@@ -152,33 +277,41 @@ class emulatedHw():
         def step(self,input_value):
             # Reduce matrix along a given axis
             cfg=self.config[self.chainId_in]
+            self.bank=1-self.bank
+            self.v_out=self.v_bank[self.bank]
             
             if cfg.op==0:
-                log.debug('Passing first vector through vs reduce unit')
-                self.v_out=self.v_in
+                np.copyto(self.v_out,self.v_in)
             elif cfg.op==1:
-                log.debug('Sum vector scalar reduce')
-                self.v_out=np.concatenate(([np.sum(self.v_in)],np.zeros(self.N-1))) 
-              
+                self.v_out[0]=np.sum(self.v_in)
+                self.v_out[1:]=0
+                if self.fxp is not None:
+                    self.fxp.wrap(self.v_out)
+            if 'reduce' in self.probes:
+                self.probes.fire('reduce',self.chainId_in,self.v_out)
+
             self.eof_out, self.bof_out, self.chainId_out = self.eof_in, self.bof_in, self.chainId_in
-            self.v_in, self.eof_in, self.bof_in, self.chainId_in = copy(input_value)
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
             return self.v_out, self.eof_out, self.bof_out, self.chainId_out
 
     # This block will reduce the matrix along a given axis
     class VectorVectorALU():
-        def __init__(self,N,VVVRF_SIZE):
-            self.v_in=np.zeros(N)
-            self.v_out=np.zeros(N)
+        def __init__(self,N,VVVRF_SIZE,dtype=float):
+            self.v_in=np.zeros(N,dtype=dtype)
+            self.v_out=np.zeros(N,dtype=dtype)
             self.eof_in = [False,False]
             self.eof_out = [False,False]
             self.bof_in = [False,False]
             self.bof_out = [False,False]
             self.chainId_in = 0
             self.chainId_out = 0
-            self.vrf=np.zeros(N*VVVRF_SIZE)
+            self.vrf=np.zeros(N*VVVRF_SIZE,dtype=dtype)
             self.config=None
-            self.v_out_d1=np.zeros(N)
-            self.v_out_d2=np.zeros(N)
+            # Results are written to a ring of 4 banks, so the result of 2 cycles ago is still held by the next block
+            self.v_bank=[np.zeros(N,dtype=dtype) for i in range(4)]
+            self.bank=0
+            self.v_out_d1=self.v_bank[0]
+            self.v_out_d2=self.v_bank[3]
             self.eof_out_d1 = [False,False]
             self.eof_out_d2 = [False,False]
             self.bof_out_d1 = [True,True]
@@ -186,12 +319,15 @@ class emulatedHw():
             self.chainId_out_d2 = 0
             self.chainId_out_d1 = 0
             self.N = N
-            self.minicache = np.zeros(N)
+            self.minicache = np.zeros(N,dtype=dtype)
+            self.tmp = np.zeros(N,dtype=dtype)
 
         def step(self,input_value):
             # Delay for 2 cycles, so this FU takes 3 cycles (read, calculate, write)
+            self.bank=(self.bank+1)%4
             self.v_out    = self.v_out_d2
             self.v_out_d2 = self.v_out_d1
+            self.v_out_d1 = self.v_bank[self.bank]
             self.eof_out  = self.eof_out_d2
             self.eof_out_d2  = self.eof_out_d1
             self.eof_out_d1  = self.eof_in
@@ -202,58 +338,57 @@ class emulatedHw():
             self.chainId_out_d2  = self.chainId_out_d1
             self.chainId_out_d1  = self.chainId_in
             cfg=self.config[self.chainId_in]
-            condition_met = ((not cfg.cond1['last']     or (cfg.cond1['last']     and     self.eof_in[0])) and
-                    		 (not cfg.cond1['notlast']  or (cfg.cond1['notlast']  and not self.eof_in[0])) and
-                    		 (not cfg.cond1['first']    or (cfg.cond1['first']    and     self.bof_in[0])) and
-                    		 (not cfg.cond1['notfirst'] or (cfg.cond1['notfirst'] and not self.bof_in[0])) and
-                             (not cfg.cond2['last']     or (cfg.cond2['last']     and     self.eof_in[1])) and
-                             (not cfg.cond2['notlast']  or (cfg.cond2['notlast']  and not self.eof_in[1])) and
-                             (not cfg.cond2['first']    or (cfg.cond2['first']    and     self.bof_in[1])) and
-                             (not cfg.cond2['notfirst'] or (cfg.cond2['notfirst'] and not self.bof_in[1])))
+            flags = frameFlags(self.eof_in,self.bof_in) if cfg.cond_mask or cfg.cache_cond_mask else 0
+            condition_met = (flags & cfg.cond_mask)==cfg.cond_value
 
             # Checking if we should use minicache or input vector as operator
-            if cfg.minicache == 1 or cfg.minicache==3:
+            if cfg.load:
                 operator = self.minicache
             else:
                 operator = self.v_in
 
             if cfg.op==0 or not condition_met:
-                log.debug('ALU is passing values through')
-                self.v_out_d1 = operator
+                np.copyto(self.v_out_d1,operator)
             elif cfg.op==1:
-                log.debug('Adding using vector-vector ALU')
-                self.v_out_d1 = operator + self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N]
+                np.add(operator,self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N],out=self.v_out_d1)
             elif cfg.op==2:
-                log.debug('Multiplying using vector-vector ALU')
-                self.v_out_d1 = operator * self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N]
+                if self.fxp is not None:
+                    self.fxp.multiply(operator,self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N],out=self.v_out_d1)
+                else:
+                    np.multiply(operator,self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N],out=self.v_out_d1)
             elif cfg.op==3:
-                log.debug('Subtracting using vector-vector ALU')
-                self.v_out_d1 = operator - self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N]
+                np.subtract(operator,self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N],out=self.v_out_d1)
             elif cfg.op==4:
-                log.debug('Subtracting using vector-vector ALU')
-                self.v_out_d1 = np.maximum(operator, self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N])
-
-            cache_condition_met = ((not cfg.cache_cond1['last']     or (cfg.cache_cond1['last']     and     self.eof_in[0])) and
-                             (not cfg.cache_cond1['notlast']  or (cfg.cache_cond1['notlast']  and not self.eof_in[0])) and
-                             (not cfg.cache_cond1['first']    or (cfg.cache_cond1['first']    and     self.bof_in[0])) and
-                             (not cfg.cache_cond1['notfirst'] or (cfg.cache_cond1['notfirst'] and not self.bof_in[0])) and
-                             (not cfg.cache_cond2['last']     or (cfg.cache_cond2['last']     and     self.eof_in[1])) and
-                             (not cfg.cache_cond2['notlast']  or (cfg.cache_cond2['notlast']  and not self.eof_in[1])) and
-                             (not cfg.cache_cond2['first']    or (cfg.cache_cond2['first']    and     self.bof_in[1])) and
-                             (not cfg.cache_cond2['notfirst'] or (cfg.cache_cond2['notfirst'] and not self.bof_in[1])))
-            if cfg.cache & cache_condition_met:
+                if self.fxp is not None:
+                    self.fxp.maximum(operator,self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N],out=self.v_out_d1,tmp=self.tmp)
+                else:
+                    np.maximum(operator,self.vrf[cfg.addr*self.N:cfg.addr*self.N+self.N],out=self.v_out_d1)
+            # Adders wrap around in the same way as the hardware
+            if self.fxp is not None and cfg.op in [1,3] and condition_met:
+                self.fxp.wrap(self.v_out_d1)
+            if 'alu' in self.probes:
+                self.probes.fire('alu',self.chainId_in,cfg.op if condition_met else 0,self.v_out_d1)
+
+            if cfg.cache and (flags & cfg.cache_cond_mask)==cfg.cache_cond_value:
+                self.vrf=writable(self.vrf)
                 self.vrf[cfg.cache_addr*self.N:cfg.cache_addr*self.N+self.N] = self.v_out_d1 
-            if cfg.minicache==2 or cfg.minicache==3:
-                self.minicache = copy(self.v_out_d1) 
+                if 'cache' in self.probes:
+                    self.probes.fire('cache',self.chainId_in,cfg.cache_addr,self.v_out_d1)
+            if cfg.save:
+                np.copyto(self.minicache,self.v_out_d1)
+                if 'minicache' in self.probes:
+                    self.probes.fire('minicache',self.chainId_in,self.minicache)
             
-            self.v_in, self.eof_in, self.bof_in, self.chainId_in = copy(input_value)
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
             return self.v_out, self.eof_out, self.bof_out, self.chainId_out
 
     # Packs data efficiently
     class DataPacker():
-        def __init__(self,N,M):
-            self.v_in=np.zeros(N)
-            self.v_out=np.zeros(N)
+        def __init__(self,N,M,dtype=float):
+            self.v_in=np.zeros(N,dtype=dtype)
+            # Values are packed in place (values that overflow N elements are never pushed, so they are not kept)
+            self.packed=np.zeros(N,dtype=dtype)
+            self.packed_length=N
             self.eof_in = [False,False]
             self.bof_in = [True,True]
             self.chainId_in = 0
@@ -262,52 +397,66 @@ class emulatedHw():
             self.config=None
             self.N = N
 
+        @property
+        def v_out(self):
+            return self.packed[:min(self.packed_length,self.N)]
+
         def step(self,input_value):
             cfg=self.config[self.chainId_in]
-            if (cfg.commit and 
-                (not cfg.cond1['last']     or (cfg.cond1['last']     and     self.eof_in[0])) and
-                (not cfg.cond1['notlast']  or (cfg.cond1['notlast']  and not self.eof_in[0])) and
-                (not cfg.cond1['first']    or (cfg.cond1['first']    and     self.bof_in[0])) and
-                (not cfg.cond1['notfirst'] or (cfg.cond1['notfirst'] and not self.bof_in[0])) and
-                (not cfg.cond2['last']     or (cfg.cond2['last']     and     self.eof_in[1])) and
-                (not cfg.cond2['notlast']  or (cfg.cond2['notlast']  and not self.eof_in[1])) and
-                (not cfg.cond2['first']    or (cfg.cond2['first']    and     self.bof_in[1])) and
-                (not cfg.cond2['notfirst'] or (cfg.cond2['notfirst'] and not self.bof_in[1]))):
-                if self.v_out_size==0:
-                    self.v_out = self.v_in[:cfg.size]
-                else:
-                    self.v_out = np.append(self.v_out,self.v_in[:cfg.size])
+            if cfg.commit and (cfg.cond_mask==0 or (frameFlags(self.eof_in,self.bof_in) & cfg.cond_mask)==cfg.cond_value):
+                if self.v_out_size<self.N:
+                    end=min(self.v_out_size+cfg.size,self.N)
+                    self.packed[self.v_out_size:end]=self.v_in[:end-self.v_out_size]
+                if 'commit' in self.probes:
+                    self.probes.fire('commit',self.chainId_in,self.v_in[:cfg.size])
                 self.v_out_size=self.v_out_size+cfg.size
+                self.packed_length=self.v_out_size
                 if self.v_out_size==self.N:
-                    log.debug('Data Packer full. Pushing values to Trace Buffer')
                     self.v_out_valid=1
                     self.v_out_size = 0
+                    if 'packed' in self.probes:
+                        self.probes.fire('packed',self.packed)
                 else:
                     self.v_out_valid=0
             else:
                 self.v_out_valid=0
-            self.v_in, self.eof_in, self.bof_in, self.chainId_in = copy(input_value)
+            self.v_in, self.eof_in, self.bof_in, self.chainId_in = input_value
             return self.v_out, self.v_out_valid
 
     # Packs data efficiently
     class TraceBuffer():
-        def __init__(self,N,TB_SIZE):
-            self.input=np.zeros(N)
-            self.mem=np.zeros((TB_SIZE,N))
+        def __init__(self,N,TB_SIZE,dtype=float,file=None,grow=False):
+            # Memory can be backed by a file (see traceFile) to emulate trace buffers that don't fit in RAM
+            self.file=None if file is None else traceFile(file,N,TB_SIZE,dtype,grow)
+            self.mem=np.zeros((TB_SIZE,N),dtype=dtype) if self.file is None else self.file.mem
             self.size=0
             self.TB_SIZE=TB_SIZE
+            # Address written in the last cycle (-1 if nothing was written) and the row it held before
+            self.addr=-1
+            self.old=np.zeros(N,dtype=dtype)
 
         def step(self,packed_data):
             output, output_valid = packed_data
+            self.addr=-1
             if output_valid:
                 if self.size==self.TB_SIZE:
                     self.size=0
-                self.mem[self.size]=output
+                np.copyto(self.old,self.mem[self.size])
+                if self.file is not None:
+                    self.mem=self.file.write(self.size,output)
+                else:
+                    self.mem=writable(self.mem)
+                    self.mem[self.size]=output
+                if 'write' in self.probes:
+                    self.probes.fire('write',self.size,self.mem[self.size])
+                self.addr=self.size
                 self.size=self.size+1
-            self.input=copy(packed_data)
 
     def step(self):
-        log.debug('New step')
+        self.cycle=self.cycle+1
+        self.log.cycle=self.cycle
+        self.probes.cycle=self.cycle
+        self.ib.feed()
 
         # Perform operations according to how building blocks are connected
         for b in self.BUILDING_BLOCKS:
@@ -330,7 +479,7 @@ class emulatedHw():
                 self.log['dp'].append(packed_data)
             elif b=='TraceBuffer':
                 self.tb.step(packed_data)
-                self.log['tb'].append(self.tb.mem)
+                self.log['tb'].append((self.tb.addr,packed_data[0],self.tb.old))
             else:
                 assert False, "Unknown building block "+b
         
@@ -340,53 +489,184 @@ class emulatedHw():
         self.ib.push(pushed_vals)
 
     def config(self,fw=None):
-        # Configure processor
-        # Fixme - For some reason I need to append a chain of zeros here
-        no_cond={'last':False,'notlast':False,'first':False,'notfirst':False}
-        self.fu.config=[struct(filter=0,addr=0)]
-        self.mvru.config=[struct(axis=0)]
-        self.vsru.config=[struct(op=0)]
-        self.vvalu.config=[struct(op=0,addr=0,cache=0,cache_addr=0,cond1=copy(no_cond),cond2=copy(no_cond),minicache=0,cache_cond1=copy(no_cond),cache_cond2=copy(no_cond))]
-        self.dp.config=[struct(commit=0,size=0,cond1=copy(no_cond),cond2=copy(no_cond))]
-        self.ib.config=struct(num_chains=1)
-        if fw is not None:
-            self.ib.config=struct(num_chains=fw['valid_chains']+1)
-            for idx in range(fw['valid_chains']):
-                self.fu.config.append(fw['fu'][idx])
-                self.mvru.config.append(fw['mvru'][idx])
-                self.vsru.config.append(fw['vsru'][idx])
-                self.vvalu.config.append(fw['vvalu'][idx])
-                self.dp.config.append(fw['dp'][idx])
+        # Configure processor by decoding the firmware once into per-block tables indexed by chainId
+        self.firmware=fw
+        tables=decodeFirmware(fw)
+        self.ib.config=struct(num_chains=len(tables['fu']))
+        self.fu.config=tables['fu']
+        self.mvru.config=tables['mvru']
+        self.vsru.config=tables['vsru']
+        self.vvalu.config=tables['vvalu']
+        self.dp.config=tables['dp']
+
+    # Reconfigures the processor with the bytes sent to the hardware through the UART (a full image or a delta, see firmware.binary)
+    # As in the hardware, only one condition per chain is kept and only the FUVRF rows that are sent are written
+    # DATA_TYPE and DATA_WIDTH are those of the hardware the image was encoded for (by default the ones of the emulator, with
+    # 'int' for a float emulator), so e.g. a float emulator can be reconfigured with the image of a 'fixed_point' board
+    def reconfigure(self,image,DATA_TYPE=None,DATA_WIDTH=None):
+        if DATA_TYPE is None:
+            DATA_TYPE='fixed_point' if self.DATA_TYPE=='fixed_point' else 'int'
+        DATA_WIDTH=self.DATA_WIDTH if DATA_WIDTH is None else DATA_WIDTH
+        assert DATA_TYPE in ['int','fixed_point'], "Images can only be encoded as 'int' or 'fixed_point'"
+        rows=range(self.FUVRF_SIZE)
+        if image[0]==DELTA_COMMAND:
+            fw=compiler(self.N,self.M,self.MAX_CHAINS).compile() if self.firmware is None else self.firmware
+            fuvrf=self.fu.vrf if self.fxp is None else self.fxp.toFloat(self.fu.vrf)
+            current=encodeImage(fw,fuvrf,self.N,self.M,self.MAX_CHAINS,self.FUVRF_SIZE,DATA_WIDTH,DATA_TYPE)
+            rows=deltaFuvrfRows(image,self.M,self.MAX_CHAINS,DATA_WIDTH)
+            image=applyDelta(current,image,self.M,self.MAX_CHAINS,self.FUVRF_SIZE,DATA_WIDTH)
+        fw, fuvrf=decodeImage(image,self.N,self.M,self.MAX_CHAINS,self.FUVRF_SIZE,DATA_WIDTH,DATA_TYPE)
+        self.config(fw)
+        values=np.asarray(fuvrf,dtype=float) if self.fxp is None else self.fxp.quantize(fuvrf)
+        vrf=np.array(self.fu.vrf,dtype=self.dtype)
+        for row in rows:
+            vrf[row*self.M:(row+1)*self.M]=values[row*self.M:(row+1)*self.M]
+        self.fu.vrf=vrf
+
+    # Sets how many cycles are kept in the log and which blocks are logged (None logs all blocks but the trace buffer)
+    def configLog(self,window=64,blocks=None):
+        self.log=signalLog(self.N,self.M,self.tb.TB_SIZE,window,blocks,self.dtype,self.tb)
+        self.log.cycle=self.cycle
 
     def initialize_fu(vals):
         self.fu.vrf=vals
 
+    # Calls a function every time a given event happens in a given block (None matches all blocks/events)
+    # The function receives a struct with the block, event, cycle and the values of the event
+    def attachProbe(self,block,event,callback):
+        self.probes.attach(block,event,callback)
+
+    def detachProbe(self,block=None,event=None,callback=None):
+        self.probes.detach(block,event,callback)
+
+    # Returns a bounded queue that receives every row packed by the DataPacker while the processor runs (see commitQueue)
+    # With policy='block', rows must be consumed from another thread while the processor runs (e.g. queue.start(callback))
+    def subscribe(self,maxsize=1024,policy='block'):
+        rows=commitQueue(maxsize,policy)
+        self.attachProbe('dp','packed',rows)
+        return rows
+
+    # Stops sending rows to a queue and marks its end, so its consumer finishes
+    def unsubscribe(self,rows):
+        self.detachProbe('dp','packed',rows)
+        rows.close()
+
+    # Returns the full state of the processor (registers, memories, input buffer and firmware) as a dict of NumPy arrays
+    # Memories are shared with the snapshot until one of them is written, so snapshots are cheap
+    # The input stream (see stream) is not part of the snapshot
+    def snapshot(self):
+        return snapshot.snapshot(self)
+
+    def restore(self,state):
+        snapshot.restore(self,state)
+
+    # Returns a copy of the processor that can be run (e.g. with a different firmware) without affecting this one
+    def fork(self):
+        hw=emulatedHw(self.N,self.M,self.IB_DEPTH,self.FUVRF_SIZE,self.VVVRF_SIZE,self.TB_SIZE,self.MAX_CHAINS,self.BUILDING_BLOCKS,
+                      self.DATA_TYPE,self.DATA_WIDTH)
+        hw.configLog(self.log['ib'].window,[b for b in self.log.keys() if self.log[b].enabled])
+        hw.restore(self.snapshot())
+        hw.firmware=self.firmware
+        return hw
+
+    # Streams (vector,eof0,eof1) tuples from an iterator or generator into the input buffer
+    # One vector is pulled per cycle while the input buffer has space (cycles without space are counted in ib.stalls)
+    # A stream that was not drained yet is continued by the new one
+    def stream(self,source):
+        if self.ib.pending is not None:
+            source=itertools.chain([self.ib.pending],self.ib.source,source)
+        self.ib.source=iter(source)
+        self.ib.pending=next(self.ib.source,None)
+
+    # Checks if the input buffer and the input stream are empty and only pass through bubbles (chain 0) are left in the pipeline
+    def drained(self):
+        return (len(self.ib.buffer)==0 and self.ib.pending is None and
+                self.fu.chainId_in==0 and self.fu.chainId_out==0 and
+                self.mvru.chainId_in==0 and self.mvru.chainId_out==0 and
+                self.vvalu.chainId_in==0 and self.vvalu.chainId_out_d1==0 and self.vvalu.chainId_out_d2==0 and self.vvalu.chainId_out==0 and
+                self.vsru.chainId_in==0 and self.vsru.chainId_out==0 and
+                self.dp.chainId_in==0)
+
+    # Converts values written to the vector register files (e.g. proc.fu.vrf=...) to arrays in the format of the datapath
+    def quantizeVrfs(self):
+        for block in [self.fu,self.vvalu]:
+            if not (isinstance(block.vrf,np.ndarray) and block.vrf.dtype==self.dtype):
+                block.vrf=np.asarray(block.vrf,dtype=float) if self.fxp is None else self.fxp.quantize(block.vrf)
+
+    # Skips idle cycles of a drained pipeline, leaving the processor in the same state as stepping them
+    # Bubbles flush the values left in the pipeline registers (and per-cycle outputs such as dp.v_out_valid) within
+    # FLUSH_CYCLES cycles, after which only the banks used by each block change, and they repeat every BANK_PERIOD cycles
+    def skip(self,cycles):
+        flush=min(cycles,FLUSH_CYCLES)
+        for i in range(flush):
+            self.step()
+        cycles=cycles-flush
+        self.cycle=self.cycle+cycles-cycles%BANK_PERIOD
+        self.log.cycle=self.probes.cycle=self.cycle
+        for i in range(cycles%BANK_PERIOD):
+            self.step()
+
     def run(self,steps=50):
         # Keep stepping through the circuit as long as we have instructions to execute
-        for i in range(steps):
+        # If steps is None, we stop as soon as the pipeline is drained
+        i=0
+        self.quantizeVrfs()
+        while steps is None or i<steps:
+            # Once the pipeline is drained the remaining cycles are fast-forwarded (see skip)
+            # unless they are logged or probed, since every stepped cycle has its own log entry and events
+            if self.drained() and (steps is None or not (self.log.enabled() or self.probes.attached())):
+                if steps is not None:
+                    self.skip(steps-i)
+                break
             self.step()
+            i=i+1
+        if self.tb.file is not None:
+            self.tb.file.flush()
         return self.log
 
-    def __init__(self,N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS):
+    def __init__(self,N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS,DATA_TYPE='float',DATA_WIDTH=32,TB_FILE=None,TB_GROW=False):
         ''' Verifying parameters '''
         assert math.log(N, 2).is_integer(), "N must be a power of 2" 
         assert math.log(M, 2).is_integer(), "N must be a power of 2" 
         assert M<=N, "M must be less or equal to N" 
 
         # hardware building blocks   
+        self.N=N
+        self.M=M
         self.BUILDING_BLOCKS=BUILDING_BLOCKS
         self.MAX_CHAINS=MAX_CHAINS
-        self.ib   = self.InputBuffer(N,IB_DEPTH)
-        self.fu   = self.FilterUnit(N,M,FUVRF_SIZE)
-        self.mvru = self.MatrixVectorReduce(N,M)
-        self.vsru = self.VectorScalarReduce(N)
-        self.vvalu= self.VectorVectorALU(N,VVVRF_SIZE)
-        self.dp   = self.DataPacker(N,M)
-        self.tb   = self.TraceBuffer(N,TB_SIZE)
+        self.IB_DEPTH=IB_DEPTH
+        self.FUVRF_SIZE=FUVRF_SIZE
+        self.VVVRF_SIZE=VVVRF_SIZE
+        self.TB_SIZE=TB_SIZE
+
+        # 'float' emulates an ideal datapath, while 'int' and 'fixed_point' match the RTL bit by bit (see fixedPoint)
+        self.DATA_TYPE=DATA_TYPE
+        self.DATA_WIDTH=DATA_WIDTH
+        self.fxp=None if DATA_TYPE=='float' else fixedPoint(DATA_TYPE,DATA_WIDTH)
+        self.dtype=float if self.fxp is None else np.int64
+
+        self.ib   = self.InputBuffer(N,IB_DEPTH,self.dtype)
+        self.fu   = self.FilterUnit(N,M,FUVRF_SIZE,self.dtype)
+        self.mvru = self.MatrixVectorReduce(N,M,self.dtype)
+        self.vsru = self.VectorScalarReduce(N,self.dtype)
+        self.vvalu= self.VectorVectorALU(N,VVVRF_SIZE,self.dtype)
+        self.dp   = self.DataPacker(N,M,self.dtype)
+        self.tb   = self.TraceBuffer(N,TB_SIZE,self.dtype,TB_FILE,TB_GROW)
+        for b in [self.ib,self.fu,self.mvru,self.vsru,self.vvalu]:
+            b.fxp=self.fxp
         self.config()
 
+        # Probes attached to the events of each block (see attachProbe)
+        self.probes=probeSet()
+        for b in self.probes.blocks:
+            getattr(self,b).probes=self.probes[b]
+
         # Firmware compiler
         self.compiler = compiler(N,M,MAX_CHAINS)
 
-        # used to simulate a trace buffer to match results with simulation
-        self.log={k: [] for k in ['ib','fu','mvru','vsru','vvalu','dp','tb']}
+        # Number of cycles emulated so far
+        self.cycle=0
+
+        # Signals are only logged once configLog is called (log['tb'][-1] always returns the trace buffer)
+        self.configLog(blocks=[])
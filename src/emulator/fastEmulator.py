@@ -0,0 +1,371 @@
+import math, itertools
+import numpy as np
+from firmware.compiler import compiler
+from misc.misc import *
+
+''' Transaction-level emulation settings '''
+BLOCK_SIZE=65536    # Maximum number of input vectors processed at once by run()
+FILTER_ELEMENTS=1<<24 # Maximum number of elements of the KxMxN filter matrix computed at once
+
+# Operations performed by the vector-vector ALU (op=0 is a pass through)
+ALU_OPS={1:np.add, 2:np.multiply, 3:np.subtract, 4:np.maximum}
+
+# Returns a mask of the input vectors that meet both conditions of a given chain
+def conditionMask(cond1,cond2,eof,bof):
+    mask=np.ones(len(eof),dtype=bool)
+    for idx, cond in enumerate([cond1,cond2]):
+        if cond['last']:
+            mask&=eof[:,idx]
+        if cond['notlast']:
+            mask&=~eof[:,idx]
+        if cond['first']:
+            mask&=bof[:,idx]
+        if cond['notfirst']:
+            mask&=~bof[:,idx]
+    return mask
+
+# Checks if any of the conditions is being used
+def hasCondition(cond1,cond2):
+    return any(cond[c] for cond in [cond1,cond2] for c in ['last','notlast','first','notfirst'])
+
+# Applies out[k]=ufunc(x[k],out[k-1]) while cond[k] holds and restarts with out[k]=x[k] otherwise (out[-1] is carry)
+def segmentedScan(ufunc,x,cond,carry):
+    K=len(x)
+    out=np.array(x,dtype=float)
+    seg_id=np.cumsum(~cond)
+    seg_start=np.concatenate(([0],np.flatnonzero(~cond)))
+    pos=np.arange(K)-seg_start[seg_id]
+    if cond[0]:
+        out[0]=ufunc(x[0],carry)
+
+    # Either accumulate each segment or sweep all segments in lockstep, whichever needs fewer iterations
+    num_segments, max_length = seg_id[-1]+1, pos.max()+1
+    if num_segments<=max_length:
+        seg_end=np.concatenate((seg_start[1:],[K]))
+        for start, end in zip(seg_start,seg_end):
+            if end-start>1:
+                ufunc.accumulate(out[start:end],axis=0,out=out[start:end])
+    else:
+        order=np.argsort(pos,kind='stable')
+        offsets=np.concatenate(([0],np.cumsum(np.bincount(pos))))
+        for j in range(1,max_length):
+            idx=order[offsets[j]:offsets[j+1]]
+            out[idx]=ufunc(x[idx],out[idx-1])
+    return out
+
+class fastEmulatedHw():
+
+    # Input buffer class
+    class InputBuffer():
+        def __init__(self,N):
+            self.buffer=[]
+            self.N = N
+            # Input stream (see fastEmulatedHw.stream)
+            self.source=None
+            self.bof=np.array([True,True])
+
+        def push(self,pushed_vals):
+            eof_in = [False,False]
+            if len(pushed_vals)==2:
+                pushed_vals.append(False)
+            v_in, eof_in[0], eof_in[1] = pushed_vals
+            assert list(np.shape(v_in))==[self.N], "Input must be Nx1"
+            self.buffer.append([v_in,eof_in])
+
+        # Returns all buffered vectors with their eof and bof flags
+        def pop(self,count):
+            popped, self.buffer = self.buffer[:count], self.buffer[count:]
+            vectors=np.array([v for v, _ in popped],dtype=float).reshape(-1,self.N)
+            eof=np.array([e for _, e in popped],dtype=bool).reshape(-1,2)
+            return vectors, eof
+
+        # The beginning of a frame is signaled by the end of the previous one
+        def process(self,eof):
+            bof=np.concatenate(([self.bof],eof[:-1]))
+            if len(eof)>0:
+                self.bof=eof[-1].copy()
+            return bof
+
+    # Filter Unit
+    class FilterUnit():
+        def __init__(self,N,M,FUVRF_SIZE):
+            self.vrf=np.zeros(FUVRF_SIZE*M)
+            self.config=None
+            self.M = M
+            self.N = N
+
+        # Returns the KxMxN matrix of M ranges for K input vectors
+        def process(self,v_in,cfg):
+            vrf=np.asarray(self.vrf,dtype=float)
+            base=cfg.addr*self.M
+            low_range=vrf[base:base+self.M]
+            high_range=np.empty(self.M)
+            high_range[:len(vrf[base+1:base+self.M+1])]=vrf[base+1:base+self.M+1]
+            if base+self.M>=len(vrf):
+                # The upper limit of the last range is extrapolated from the previous one
+                high_range[-1]=low_range[-1]+(low_range[-1]-vrf[base+self.M-2])
+            v=v_in[:,None,:]
+            return (v>low_range[None,:,None]) & (v<=high_range[None,:,None])
+
+    # This block will reduce the matrix along a given axis
+    # If M<N, then the results will be padded with zeros
+    class MatrixVectorReduce():
+        def __init__(self,N,M):
+            self.config=None
+            self.N = N
+            self.M = M
+
+        def process(self,m_in,cfg):
+            if cfg.axis==0:
+                return m_in[:,0].astype(float)
+            elif cfg.axis==1:
+                return np.sum(m_in,axis=1,dtype=float)
+            v_out=np.zeros((len(m_in),self.N))
+            v_out[:,:self.M]=np.sum(m_in,axis=2,dtype=float)
+            return v_out
+
+        # Reduces an unfiltered vector, which is equivalent to a matrix with the vector in its first row
+        def passThrough(self,v_in,cfg):
+            if cfg.axis==2:
+                v_out=np.zeros((len(v_in),self.N))
+                v_out[:,0]=np.sum(v_in,axis=1)
+                return v_out
+            return v_in
+
+    # This block will reduce a vector to a scalar and pad with zeros
+    class VectorScalarReduce():
+        def __init__(self,N):
+            self.config=None
+            self.N = N
+
+        def process(self,v_in,cfg):
+            if cfg.op==0:
+                return v_in
+            v_out=np.zeros((len(v_in),self.N))
+            v_out[:,0]=np.sum(v_in,axis=1)
+            return v_out
+
+    # This block performs vector-vector operations using the VRF and the minicache
+    class VectorVectorALU():
+        def __init__(self,N,VVVRF_SIZE):
+            self.vrf=np.zeros(N*VVVRF_SIZE)
+            self.minicache = np.zeros(N)
+            self.config=None
+            self.N = N
+
+        # Chains that accumulate on their own address can be computed with a scan over all vectors
+        def isScan(self,c):
+            cfg=self.config[c]
+            if cfg.op not in [1,2,4] or not cfg.cache or cfg.cache_addr!=cfg.addr or cfg.minicache!=0 or hasCondition(cfg.cache_cond1,cfg.cache_cond2):
+                return False
+            for idx, other in enumerate(self.config):
+                if idx!=c and ((other.op!=0 and other.addr==cfg.addr) or (other.cache and other.cache_addr==cfg.addr)):
+                    return False
+            return True
+
+        def process(self,v_in,eof,bof):
+            self.vrf=np.asarray(self.vrf,dtype=float)
+            vrf=self.vrf.reshape(-1,self.N)
+            K, C = len(eof), len(self.config)
+            cond=[conditionMask(cfg.cond1,cfg.cond2,eof,bof) for cfg in self.config]
+            cache_cond=[conditionMask(cfg.cache_cond1,cfg.cache_cond2,eof,bof) for cfg in self.config]
+            written=[cfg.cache_addr for cfg in self.config if cfg.cache]
+
+            # Compute chains that do not depend on previous results all at once
+            v_out=[None]*C
+            sequential=[]
+            for c, cfg in enumerate(self.config):
+                if cfg.minicache==1 or cfg.minicache==3 or (cfg.op!=0 and cfg.addr in written and not self.isScan(c)):
+                    sequential.append(c)
+                elif cfg.op==0:
+                    v_out[c]=v_in[c]
+                elif self.isScan(c):
+                    v_out[c]=segmentedScan(ALU_OPS[cfg.op],v_in[c],cond[c],vrf[cfg.addr].copy())
+                else:
+                    v_out[c]=np.where(cond[c][:,None],ALU_OPS[cfg.op](v_in[c],vrf[cfg.addr]),v_in[c])
+
+            # Remaining chains are computed vector by vector, interleaved with every chain that writes to the VRF or minicache
+            if sequential:
+                actors=[c for c, cfg in enumerate(self.config) if c in sequential or cfg.cache or cfg.minicache>=2]
+                for c in sequential:
+                    v_out[c]=np.empty((K,self.N))
+                for k in range(K):
+                    for c in actors:
+                        cfg=self.config[c]
+                        if c in sequential:
+                            operator = self.minicache if cfg.minicache==1 or cfg.minicache==3 else v_in[c][k]
+                            if cfg.op!=0 and cond[c][k]:
+                                v_out[c][k]=ALU_OPS[cfg.op](operator,vrf[cfg.addr])
+                            else:
+                                v_out[c][k]=operator
+                        if cfg.cache and cache_cond[c][k]:
+                            vrf[cfg.cache_addr]=v_out[c][k]
+                        if cfg.minicache>=2:
+                            self.minicache=v_out[c][k].copy()
+
+            # Otherwise, only the last write to each address and to the minicache is kept
+            elif K>0:
+                last_write={}
+                for c, cfg in enumerate(self.config):
+                    if cfg.cache and cache_cond[c].any():
+                        k=np.flatnonzero(cache_cond[c])[-1]
+                        if cfg.cache_addr not in last_write or k*C+c>last_write[cfg.cache_addr][0]:
+                            last_write[cfg.cache_addr]=(k*C+c,c,k)
+                    if cfg.minicache>=2:
+                        self.minicache=v_out[c][-1].copy()
+                for addr, (_, c, k) in last_write.items():
+                    vrf[addr]=v_out[c][k]
+            return v_out
+
+    # Packs data efficiently
+    class DataPacker():
+        def __init__(self,N,M):
+            self.v_out=np.zeros(N)
+            self.v_out_size=0
+            self.config=None
+            self.N = N
+
+        # Returns the rows that would be pushed to the trace buffer
+        def process(self,v_in,eof,bof):
+            K, C = len(eof), len(self.config)
+            commit=np.stack([conditionMask(cfg.cond1,cfg.cond2,eof,bof) & bool(cfg.commit) for cfg in self.config],axis=1)
+            committed=np.flatnonzero(commit.reshape(-1))
+            if len(committed)==0:
+                return np.zeros((0,self.N))
+
+            # Concatenate all committed values in the order they reach the data packer
+            size=np.array([cfg.size for cfg in self.config])[committed%C]
+            values=np.stack(v_in,axis=1).reshape(K*C,self.N)[committed]
+            values=values[np.arange(self.N)[None,:]<size[:,None]]
+            packed=np.concatenate((self.v_out[:self.v_out_size],values))
+
+            # Rows are pushed every time exactly N values are packed
+            # If a commit overflows N values the packer stops pushing rows (same as the cycle-accurate emulator)
+            total=self.v_out_size+np.cumsum(size)
+            previous=total-size
+            if self.v_out_size>self.N:
+                overflow=0
+            else:
+                overflowed=np.flatnonzero((total//self.N>previous//self.N) & (total%self.N!=0))
+                overflow=overflowed[0] if len(overflowed)>0 else len(total)
+            num_rows=int(np.sum(total[:overflow]%self.N==0)) if overflow>0 else 0
+            rows=packed[:num_rows*self.N].reshape(num_rows,self.N)
+
+            # Keep values that have not been pushed yet
+            self.v_out_size=len(packed)-num_rows*self.N
+            if self.v_out_size>0:
+                self.v_out=packed[num_rows*self.N:]
+            elif num_rows>0:
+                self.v_out=rows[-1].copy()
+            return rows
+
+    # Stores packed data
+    class TraceBuffer():
+        def __init__(self,N,TB_SIZE):
+            self.mem=np.zeros((TB_SIZE,N))
+            self.size=0
+            self.TB_SIZE=TB_SIZE
+
+        def process(self,rows):
+            if len(rows)==0:
+                return
+            position=(self.size+np.arange(len(rows)))%self.TB_SIZE
+            self.mem[position[-self.TB_SIZE:]]=rows[-self.TB_SIZE:]
+            self.size=int(position[-1])+1
+
+    # Computes the effect of all chains on a block of input vectors
+    def processBlock(self,vectors,eof):
+        bof=self.ib.process(eof)
+        chains=range(len(self.vvalu.config))
+        v=[vectors for c in chains]
+        for b in self.BUILDING_BLOCKS[1:-2]:
+            if b=='FilterReduceUnit':
+                v=[self.filterReduce(v[c],c) for c in chains]
+            elif b=='VectorVectorALU':
+                v=self.vvalu.process(v,eof,bof)
+            elif b=='VectorScalarReduce':
+                v=[self.vsru.process(v[c],self.vsru.config[c]) for c in chains]
+            else:
+                assert False, "Unknown building block "+b
+        self.tb.process(self.dp.process(v,eof,bof))
+
+    def filterReduce(self,v_in,c):
+        if self.fu.config[c].filter==0:
+            return self.mvru.passThrough(v_in,self.mvru.config[c])
+        v_out=np.empty((len(v_in),self.N))
+        block=max(1,FILTER_ELEMENTS//(self.M*self.N))
+        for start in range(0,len(v_in),block):
+            m=self.fu.process(v_in[start:start+block],self.fu.config[c])
+            v_out[start:start+block]=self.mvru.process(m,self.mvru.config[c])
+        return v_out
+
+    # Pushes values to the input of the chain
+    def push(self,pushed_vals):
+        self.ib.push(pushed_vals)
+
+    def config(self,fw=None):
+        # Configure processor (unlike the cycle-accurate emulator, no pass through chain is needed)
+        valid_chains = 0 if fw is None else fw['valid_chains']
+        self.fu.config   = [] if fw is None else fw['fu'][:valid_chains]
+        self.mvru.config = [] if fw is None else fw['mvru'][:valid_chains]
+        self.vsru.config = [] if fw is None else fw['vsru'][:valid_chains]
+        self.vvalu.config= [] if fw is None else fw['vvalu'][:valid_chains]
+        self.dp.config   = [] if fw is None else fw['dp'][:valid_chains]
+
+    # Processes a whole block of input vectors with their eof flags
+    def runBlock(self,vectors,eof):
+        vectors=np.asarray(vectors,dtype=float).reshape(-1,self.N)
+        eof=np.asarray(eof,dtype=bool).reshape(len(vectors),-1)
+        if eof.shape[1]==1:
+            eof=np.concatenate((eof,np.zeros((len(eof),1),dtype=bool)),axis=1)
+        for start in range(0,len(vectors),BLOCK_SIZE):
+            if len(self.vvalu.config)>0:
+                self.processBlock(vectors[start:start+BLOCK_SIZE],eof[start:start+BLOCK_SIZE])
+            else:
+                self.ib.process(eof[start:start+BLOCK_SIZE])
+        return self.log
+
+    def run(self):
+        # Process everything that has been pushed to the input buffer
+        while len(self.ib.buffer)>0:
+            self.runBlock(*self.ib.pop(BLOCK_SIZE))
+        # Then drain the input stream BLOCK_SIZE vectors at a time
+        if self.ib.source is not None:
+            block=list(itertools.islice(self.ib.source,BLOCK_SIZE))
+            while len(block)>0:
+                self.runBlock([item[0] for item in block],[list(item[1:])+[False]*(3-len(item)) for item in block])
+                block=list(itertools.islice(self.ib.source,BLOCK_SIZE))
+            self.ib.source=None
+        return self.log
+
+    # Attaches (vector,eof0,eof1) tuples from an iterator or generator to the input, which are consumed by run()
+    # A stream that was not drained yet is continued by the new one
+    def stream(self,source):
+        self.ib.source=iter(source) if self.ib.source is None else itertools.chain(self.ib.source,source)
+
+    def __init__(self,N,M,IB_DEPTH,FUVRF_SIZE,VVVRF_SIZE,TB_SIZE,MAX_CHAINS,BUILDING_BLOCKS):
+        ''' Verifying parameters '''
+        assert math.log(N, 2).is_integer(), "N must be a power of 2"
+        assert math.log(M, 2).is_integer(), "N must be a power of 2"
+        assert M<=N, "M must be less or equal to N"
+        assert BUILDING_BLOCKS[0]=="InputBuffer" and BUILDING_BLOCKS[-2:]==["DataPacker","TraceBuffer"], "Building blocks do not follow order currently supported by the transaction-level emulator"
+
+        # hardware building blocks
+        self.N=N
+        self.M=M
+        self.BUILDING_BLOCKS=BUILDING_BLOCKS
+        self.MAX_CHAINS=MAX_CHAINS
+        self.ib   = self.InputBuffer(N)
+        self.fu   = self.FilterUnit(N,M,FUVRF_SIZE)
+        self.mvru = self.MatrixVectorReduce(N,M)
+        self.vsru = self.VectorScalarReduce(N)
+        self.vvalu= self.VectorVectorALU(N,VVVRF_SIZE)
+        self.dp   = self.DataPacker(N,M)
+        self.tb   = self.TraceBuffer(N,TB_SIZE)
+        self.config()
+
+        # Firmware compiler
+        self.compiler = compiler(N,M,MAX_CHAINS)
+
+        # Only the final state of the trace buffer is kept (same format as the cycle-accurate emulator's log)
+        self.log={'tb':[self.tb.mem]}
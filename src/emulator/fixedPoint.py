@@ -0,0 +1,53 @@
+import numpy as np
+
+''' Two's complement arithmetic of the hardware datapath on int64 NumPy arrays '''
+# Values are kept as signed integers in [-2**(DATA_WIDTH-1),2**(DATA_WIDTH-1)), scaled by 2**frac_bits
+# 'fixed_point' uses DATA_WIDTH/2 fractional bits (same format as misc.encode) and 'int' uses none
+class fixedPoint():
+
+    # Converts floats to the integer format, rounding and saturating the same way as misc.encode
+    def quantize(self,values):
+        x=np.round(np.asarray(values,dtype=float)*(1<<self.frac_bits))
+        return np.clip(x,-self.max_value,self.max_value).astype(np.int64)
+
+    # Converts values in the integer format back to floats
+    def toFloat(self,values):
+        return np.asarray(values,dtype=np.int64)/(1<<self.frac_bits)
+
+    # Converts values in the integer format to the unsigned codes used by the RTL (see misc.encode)
+    def toEncoded(self,values):
+        return np.asarray(values,dtype=np.int64) & self.mask
+
+    # Wraps results that overflowed DATA_WIDTH bits (in place), as the RTL adders and multipliers do
+    def wrap(self,values):
+        np.add(values,self.offset,out=values)
+        np.bitwise_and(values,self.mask,out=values)
+        np.subtract(values,self.offset,out=values)
+        return values
+
+    # Multiplies two values and drops the extra fractional bits of the result
+    def multiply(self,a,b,out):
+        np.multiply(a,b,out=out)
+        np.right_shift(out,self.frac_bits,out=out)
+        return self.wrap(out)
+
+    # Maximum of two values, as the RTL compares them: 'fixed_point' compares signed values and 'int' their unsigned codes
+    # tmp is a buffer with the shape of the values, so nothing is allocated
+    def maximum(self,a,b,out,tmp):
+        if self.frac_bits:
+            return np.maximum(a,b,out=out)
+        np.bitwise_and(a,self.mask,out=out)
+        np.bitwise_and(b,self.mask,out=tmp)
+        np.maximum(out,tmp,out=out)
+        return self.wrap(out)
+
+    def __init__(self,DATA_TYPE,DATA_WIDTH):
+        assert DATA_TYPE in ['int','fixed_point'], "Unknown data type "+str(DATA_TYPE)
+        # Products of two values must fit in 64 bits
+        assert DATA_WIDTH<=32, "Integer emulation supports up to 32 bits"
+        self.DATA_WIDTH=DATA_WIDTH
+        self.frac_bits=DATA_WIDTH//2 if DATA_TYPE=='fixed_point' else 0
+        self.max_value=(1<<(DATA_WIDTH-1))-1
+        self.mask=(1<<DATA_WIDTH)-1
+        self.offset=1<<(DATA_WIDTH-1)
+        self.one=1<<self.frac_bits
@@ -0,0 +1,75 @@
+import logging as log
+from misc.misc import struct
+
+# Events that can be probed in each building block of the emulator and the values passed to the probes
+def probeEvents():
+    return {'ib':    {'push':      ['vector','eof'],
+                      'pop':       ['vector','eof']},
+            'fu':    {'filter':    ['chainId','vector']},
+            'mvru':  {'reduce':    ['chainId','vector']},
+            'vvalu': {'alu':       ['chainId','op','vector'],
+                      'cache':     ['chainId','addr','vector'],
+                      'minicache': ['chainId','vector']},
+            'vsru':  {'reduce':    ['chainId','vector']},
+            'dp':    {'commit':    ['chainId','vector'],
+                      'packed':    ['vector']},
+            'tb':    {'write':     ['addr','vector']}}
+
+# Probe that writes events to the debug log (events are only formatted if the debug level is enabled)
+def logProbe(info):
+    log.debug('%s',info)
+
+''' Callbacks (probes) attached to the events of the building blocks of the emulator '''
+class probeSet():
+
+    # Probes of a single building block, indexed by event
+    # Blocks check "event in probes" before building any values, so events without probes cost a single lookup
+    class blockProbes(dict):
+        def __init__(self,parent,block,events):
+            self.parent=parent
+            self.block=block
+            self.events=events
+
+        # Calls all probes of an event (vectors are passed by reference and must be copied to be kept)
+        def fire(self,event,*values):
+            info=struct(block=self.block,event=event,cycle=self.parent.cycle,**dict(zip(self.events[event],values)))
+            for callback in self[event]:
+                callback(info)
+
+    def __getitem__(self,block):
+        return self.blocks[block]
+
+    # Attaches a callback to an event of a block (None attaches it to all blocks/events)
+    def attach(self,block,event,callback):
+        for b, events in self.select(block,event).items():
+            for e in events:
+                self.blocks[b].setdefault(e,[]).append(callback)
+
+    # Detaches a callback from an event of a block (None detaches all callbacks)
+    def detach(self,block=None,event=None,callback=None):
+        for b, events in self.select(block,event).items():
+            for e in events:
+                if e in self.blocks[b]:
+                    callbacks=[c for c in self.blocks[b][e] if callback is not None and c!=callback]
+                    if callbacks:
+                        self.blocks[b][e]=callbacks
+                    else:
+                        del self.blocks[b][e]
+
+    # Checks if any probe is attached
+    def attached(self):
+        return any(len(probes)>0 for probes in self.blocks.values())
+
+    # Returns the events matched by a given block and event
+    def select(self,block,event):
+        assert block is None or block in self.blocks, "Unknown block "+str(block)
+        selected={}
+        for b in self.blocks:
+            if block is None or b==block:
+                assert event is None or block is None or event in self.blocks[b].events, "Unknown event "+str(event)+" of block "+b
+                selected[b]=[e for e in self.blocks[b].events if event is None or e==event]
+        return selected
+
+    def __init__(self):
+        self.cycle=0
+        self.blocks={b: self.blockProbes(self,b,events) for b, events in probeEvents().items()}
@@ -0,0 +1,109 @@
+import numpy as np
+
+# Signals logged for each building block of the emulator (name, shape, dtype)
+def logSignals(N,M,TB_SIZE,dtype=float):
+    stream=[('vector',(N,),dtype),('eof',(2,),bool),('bof',(2,),bool),('chainId',(),np.int32)]
+    return {'ib':    stream,
+            'fu':    [('vector',(M,N),dtype)]+stream[1:],
+            'mvru':  stream,
+            'vvalu': stream,
+            'vsru':  stream,
+            'dp':    [('vector',(N,),dtype),('valid',(),bool)],
+            'tb':    [('addr',(),np.int32),('row',(N,),dtype),('old',(N,),dtype)]}
+
+# Blocks logged when none are given (the trace buffer is only logged when it is asked for)
+DEFAULT_BLOCKS=['ib','fu','mvru','vvalu','vsru','dp']
+
+''' Fixed-size log of the signals of all building blocks, stored as one ring buffer per signal '''
+class signalLog():
+
+    # Ring buffers of a single building block
+    class blockLog():
+        def __init__(self,parent,signals,window,enabled):
+            self.parent=parent
+            self.names=[name for name, _, _ in signals]
+            self.enabled=enabled
+            self.window=window
+            self.data={name: np.zeros((window if enabled else 0,)+shape,dtype=dtype) for name, shape, dtype in signals}
+            self.cycles=np.zeros(window if enabled else 0,dtype=np.int64)
+            self.count=0
+
+        # Copies the values of all signals into the next position of the ring buffers
+        def append(self,values):
+            if not self.enabled:
+                return
+            if len(self.names)==1:
+                values=[values]
+            idx=self.count%self.window
+            for name, value in zip(self.names,values):
+                mem=self.data[name]
+                value=np.asarray(value)
+                if value.shape==mem.shape[1:] or value.ndim==0:
+                    mem[idx]=value
+                else:
+                    # Vectors with a different length (partially packed data) are zero padded or truncated
+                    size=min(len(value),mem.shape[1])
+                    mem[idx,:size]=value[:size]
+                    mem[idx,size:]=0
+            self.cycles[idx]=self.parent.cycle
+            self.count=self.count+1
+
+        # Returns the values of a signal (or the cycle of each entry) for all cycles in the window (oldest first)
+        def column(self,name):
+            mem=self.cycles if name=='cycle' else self.data[name]
+            if self.count<=self.window:
+                return mem[:self.count]
+            idx=self.count%self.window
+            return np.concatenate((mem[idx:],mem[:idx]))
+
+        def __len__(self):
+            return min(self.count,self.window) if self.enabled else 0
+
+        # Entries are indexed the same way as a list with the oldest cycle in the window first
+        def __getitem__(self,i):
+            length=len(self)
+            if i<-length or i>=length:
+                raise IndexError("Cycle is not in the log window")
+            idx=(self.count-length+i%length)%self.window
+            if len(self.names)==1:
+                return self.data[self.names[0]][idx]
+            return tuple(self.data[name][idx] for name in self.names)
+
+        def __iter__(self):
+            for i in range(len(self)):
+                yield self[i]
+
+    # Trace buffer writes, with the address, the row written and the row it replaced in each cycle (address -1 if nothing was written)
+    # The trace buffer is never copied into the log: log['tb'][-1] returns its current contents, and the contents of older
+    # cycles are rebuilt by undoing the writes that came after them
+    class traceLog(blockLog):
+        def __getitem__(self,i):
+            length=len(self)
+            if i==-1:
+                return self.parent.tb.mem
+            if i<-length or i>=length:
+                raise IndexError("Cycle is not in the log window")
+            mem=np.array(self.parent.tb.mem)
+            addr, old=self.column('addr'), self.column('old')
+            for j in range(length-1,i%length,-1):
+                if addr[j]>=0:
+                    mem[addr[j]]=old[j]
+            return mem
+
+    def __getitem__(self,block):
+        return self.blocks[block]
+
+    def keys(self):
+        return self.blocks.keys()
+
+    # Checks if any block is logged
+    def enabled(self):
+        return any(block.enabled for block in self.blocks.values())
+
+    def __init__(self,N,M,TB_SIZE,window=64,blocks=None,dtype=float,tb=None):
+        # Only the last "window" cycles are kept for the blocks being logged (DEFAULT_BLOCKS by default)
+        self.cycle=0
+        self.tb=tb
+        signals=logSignals(N,M,TB_SIZE,dtype)
+        blocks=DEFAULT_BLOCKS if blocks is None else blocks
+        self.blocks={b: (self.traceLog if b=='tb' else self.blockLog)(self,signals[b],window,b in blocks) for b in signals}
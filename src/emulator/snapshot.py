@@ -0,0 +1,86 @@
+import numpy as np
+from misc.misc import struct
+
+# State of each building block of emulatedHw (firmware tables and the input buffer queue are handled separately)
+STREAM=['eof_in','eof_out','bof_in','bof_out','chainId_in','chainId_out']
+STATE={'ib':    ['chainId_out','bof_out','stalls'],
+       'fu':    ['v_in','m_bank','bank','vrf']+STREAM,
+       'mvru':  ['m_in','v_bank','bank']+STREAM,
+       'vsru':  ['v_in','v_bank','bank']+STREAM,
+       'vvalu': ['v_in','v_out','v_out_d1','v_out_d2','v_bank','bank','vrf','minicache',
+                 'eof_out_d1','eof_out_d2','bof_out_d1','bof_out_d2','chainId_out_d1','chainId_out_d2']+STREAM,
+       'dp':    ['v_in','packed','packed_length','v_out_valid','v_out_size','eof_in','bof_in','chainId_in'],
+       'tb':    ['mem','size']}
+CHAINS=['fu','mvru','vsru','vvalu','dp']
+
+# Memories that are shared (read-only) between an emulator and its snapshots until one of them writes to it
+SHARED=[('vvalu','vrf'),('tb','mem')]
+
+def readOnly(array):
+    array=np.asarray(array)
+    array.setflags(write=False)
+    return array
+
+''' Returns the full state of an emulator as a dict of flat NumPy arrays '''
+# Large memories are not copied: they become read-only and are copied by the emulator the next time it writes to them
+def snapshot(hw):
+    assert hw.tb.file is None, "Snapshots of trace buffers backed by a file are not supported"
+    state={'cycle':np.array(hw.cycle)}
+    for block, names in STATE.items():
+        for name in names:
+            value=getattr(getattr(hw,block),name)
+            if (block,name) in SHARED:
+                value=readOnly(value)
+                setattr(getattr(hw,block),name,value)
+            else:
+                value=readOnly(np.array(value))
+            state[block+'.'+name]=value
+
+    # Input buffer queue and firmware tables
+    state['ib.vectors']=readOnly(np.array([v for v, _ in hw.ib.buffer]).reshape(-1,hw.N))
+    state['ib.eof']=readOnly(np.array([eof for _, eof in hw.ib.buffer],dtype=bool).reshape(-1,2))
+    state['ib.num_chains']=np.array(hw.ib.config.num_chains)
+    for block in CHAINS:
+        table=[[getattr(chain,field) for field in chain.__slots__] for chain in getattr(hw,block).config]
+        state[block+'.config']=readOnly(np.array(table,dtype=np.int64))
+    return state
+
+''' Sets the state of an emulator (with the same parameters) to a given snapshot '''
+def restore(hw,state):
+    hw.cycle=int(state['cycle'])
+    hw.log.cycle=hw.probes.cycle=hw.cycle
+    for block, names in STATE.items():
+        for name in names:
+            value=state[block+'.'+name]
+            if (block,name) in SHARED:
+                pass
+            elif value.ndim==0:
+                value=value.item()
+            elif name.startswith('eof') or name.startswith('bof'):
+                value=value.tolist()
+            else:
+                value=np.array(value)
+            setattr(getattr(hw,block),name,value)
+
+    # Outputs that alternate between banks point to the current bank
+    for block in [hw.mvru,hw.vsru]:
+        block.v_bank=list(block.v_bank)
+        block.v_out=block.v_bank[block.bank]
+    hw.fu.m_bank=list(hw.fu.m_bank)
+    hw.fu.m_out=hw.fu.m_bank[hw.fu.bank]
+    hw.vvalu.v_bank=list(hw.vvalu.v_bank)
+
+    hw.ib.buffer.clear()
+    for vector, eof in zip(state['ib.vectors'],state['ib.eof']):
+        hw.ib.buffer.append([np.array(vector),eof.tolist()])
+    hw.ib.config=struct(num_chains=int(state['ib.num_chains']))
+    for block in CHAINS:
+        record=type(getattr(hw,block).config[0])
+        getattr(hw,block).config=[record(**dict(zip(record.__slots__,chain.tolist()))) for chain in state[block+'.config']]
+
+def save(state,file):
+    np.savez(file,**state)
+
+def load(file):
+    with np.load(file) as data:
+        return {key: readOnly(data[key]) for key in data.files}
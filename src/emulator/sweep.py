@@ -0,0 +1,68 @@
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from emulator.emulator import emulatedHw
+from emulator.fastEmulator import fastEmulatedHw
+
+EMULATORS = {'emulatedHw': emulatedHw, 'fastEmulatedHw': fastEmulatedHw}
+PARAMETERS = ['N','M','IB_DEPTH','FUVRF_SIZE','VVVRF_SIZE','TB_SIZE','MAX_CHAINS','BUILDING_BLOCKS']
+
+# Input vectors and eof flags shared by all jobs of a worker (attached once by initWorker)
+shared = {}
+
+def initWorker(names,shape):
+    for key, dtype, s in [('vectors',float,shape),('eof',bool,(shape[0],2))]:
+        shared[key+'_shm']=shared_memory.SharedMemory(name=names[key])
+        shared[key]=np.ndarray(s,dtype=dtype,buffer=shared[key+'_shm'].buf)
+
+# Emulates a given firmware over one shard of the input vectors
+def runJob(job):
+    idx, config, name, firmware, shard, start, end, emulator = job
+    begin = time.perf_counter()
+    proc = EMULATORS[emulator](*[config[p] for p in PARAMETERS])
+    if emulator=='emulatedHw':
+        proc.configLog(blocks=[])
+    if 'fuvrf' in config:
+        proc.fu.vrf=np.array(config['fuvrf'],dtype=float)
+    if 'vvvrf' in config:
+        proc.vvalu.vrf=np.array(config['vvvrf'],dtype=float)
+    proc.config(firmware(proc.compiler))
+    vectors, eof = shared['vectors'][start:end], shared['eof'][start:end]
+    if emulator=='emulatedHw':
+        proc.stream((vectors[i],eof[i,0],eof[i,1]) for i in range(end-start))
+        proc.run(steps=None)
+    else:
+        proc.runBlock(vectors,eof)
+    return {'config':idx,'firmware':name,'shard':shard,'vectors':end-start,
+            'tb':np.array(proc.tb.mem),'tb_size':proc.tb.size,
+            'cycles':getattr(proc,'cycle',None),'seconds':time.perf_counter()-begin}
+
+''' Runs every (config x firmware x input shard) job on a pool of processes and gathers the trace buffers in a table '''
+# configs is a list of dicts with the parameters of config.yaml (and optionally initial fuvrf/vvvrf values)
+# firmwares maps names to picklable functions that receive a compiler (e.g. functools.partial(firm.distribution,bins=16,M=8))
+# Results are ordered by config, firmware and shard, regardless of the order in which jobs finish
+def sweep(configs,firmwares,vectors,eof,shards=1,workers=None,emulator='emulatedHw'):
+    vectors=np.ascontiguousarray(vectors,dtype=float)
+    eof=np.ascontiguousarray(np.asarray(eof,dtype=bool).reshape(len(vectors),-1))
+    if eof.shape[1]==1:
+        eof=np.concatenate((eof,np.zeros_like(eof)),axis=1)
+    assert all(config['N']==vectors.shape[1] for config in configs), "Input vectors must have N elements in all configurations"
+    assert emulator in EMULATORS, "Unknown emulator "+emulator
+
+    # Inputs are copied once to shared memory, so they are not pickled for each job
+    memory={}
+    try:
+        for key, array in [('vectors',vectors),('eof',eof)]:
+            memory[key]=shared_memory.SharedMemory(create=True,size=max(array.nbytes,1))
+            np.ndarray(array.shape,dtype=array.dtype,buffer=memory[key].buf)[:]=array
+        bounds=np.linspace(0,len(vectors),shards+1).astype(int)
+        jobs=[(idx,config,name,firmware,shard,bounds[shard],bounds[shard+1],emulator)
+              for idx, config in enumerate(configs) for name, firmware in firmwares.items() for shard in range(shards)]
+        names={key: shm.name for key, shm in memory.items()}
+        with ProcessPoolExecutor(max_workers=workers,initializer=initWorker,initargs=(names,vectors.shape)) as pool:
+            return list(pool.map(runJob,jobs))
+    finally:
+        for shm in memory.values():
+            shm.close()
+            shm.unlink()
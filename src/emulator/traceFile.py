@@ -0,0 +1,66 @@
+import json, mmap
+import numpy as np
+from misc.misc import struct
+
+# Rows mapped when a growing file is created, and rows written between flushes to disk
+GROW_ROWS=1024
+FLUSH_ROWS=4096
+
+''' Trace buffer memory backed by a memory-mapped file, so committed rows go to disk instead of RAM '''
+# The file holds the raw TB_SIZE x N rows and a .json file next to it holds the metadata needed to reopen it
+class traceFile():
+
+    # Maps the first "capacity" rows of the file (growing the file if needed)
+    def map(self,capacity):
+        self.handle.truncate(capacity*self.row_bytes)
+        self.mmap=mmap.mmap(self.handle.fileno(),capacity*self.row_bytes)
+        self.mem=np.ndarray((capacity,self.N),dtype=self.dtype,buffer=self.mmap)
+        self.capacity=capacity
+
+    # Writes one row and returns the (possibly remapped) memory
+    def write(self,row,value):
+        if row>=self.capacity:
+            self.flush()
+            self.map(min(self.TB_SIZE,max(2*self.capacity,row+1)))
+        self.mem[row]=value
+        self.size=row+1
+        self.rows=self.rows+1
+        if self.rows%FLUSH_ROWS==0:
+            self.flush()
+        return self.mem
+
+    # Writes dirty rows and the metadata to disk and releases the pages already written, which keeps RSS bounded
+    def flush(self):
+        self.mmap.flush()
+        if hasattr(mmap,'MADV_DONTNEED'):
+            self.mmap.madvise(mmap.MADV_DONTNEED)
+        with open(self.file+'.json','w') as f:
+            json.dump({'N':self.N,'TB_SIZE':self.TB_SIZE,'dtype':self.dtype.str,'capacity':self.capacity,
+                       'size':self.size,'rows':self.rows},f)
+
+    def __init__(self,file,N,TB_SIZE,dtype=float,grow=False):
+        self.file=str(file)
+        self.N=N
+        self.TB_SIZE=TB_SIZE
+        self.dtype=np.dtype(dtype)
+        self.row_bytes=N*self.dtype.itemsize
+        self.size=0
+        self.rows=0
+        self.handle=open(self.file,'w+b')
+        self.map(min(TB_SIZE,GROW_ROWS) if grow else TB_SIZE)
+        self.flush()
+
+''' Reopens a trace buffer file (read-only) for analysis '''
+# mem is a numpy.memmap with the rows of the trace buffer, size is the next row to be written and rows is the number of rows ever written
+def openTraceFile(file):
+    with open(str(file)+'.json') as f:
+        meta=json.load(f)
+    mem=np.memmap(file,dtype=np.dtype(meta['dtype']),mode='r',shape=(meta['capacity'],meta['N']))
+    return struct(mem=mem,size=meta['size'],rows=meta['rows'],N=meta['N'],TB_SIZE=meta['TB_SIZE'])
+
+''' Returns the rows of a trace buffer file that are still stored, from the oldest to the newest '''
+# Rows that were overwritten when the trace buffer wrapped around are lost
+def traceHistory(trace):
+    if trace.rows<=trace.TB_SIZE:
+        return trace.mem[:trace.rows]
+    return np.concatenate((trace.mem[trace.size:trace.TB_SIZE],trace.mem[:trace.size]))
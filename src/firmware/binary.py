@@ -0,0 +1,172 @@
+from misc.misc import struct, encodeArray, decodeArray
+
+# Bytes that start a full or a delta reconfiguration in reconfig_unit.sv (any other byte dumps the trace buffer)
+RECONFIG_COMMAND=42
+DELTA_COMMAND=43
+
+# A delta is a list of records with the unit id, the address within the unit (2 bytes), the length and the data bytes
+# The id of each unit is the index of its section in the image, and the delta ends with DELTA_END instead of an id
+DELTA_END=255
+RECORD_HEADER=4
+MAX_RECORD_LENGTH=255
+
+# Conditions of the compiler and their bit in the condition byte of the VVALU and DP (bits 4-7 are used for the second eof/bof pair)
+CONDITIONS=['last','notlast','first','notfirst']
+
+# Only one condition per chain is supported by the hardware, so the first one that is set is encoded
+def encodeCond(cond1,cond2):
+    for bit, (cond, key) in enumerate([(c,k) for c in [cond1,cond2] for k in CONDITIONS]):
+        if cond[key]:
+            return 1<<bit
+    return 0
+
+def decodeCond(byte):
+    conds=[{key: bool(byte>>(4*i+bit)&1) for bit, key in enumerate(CONDITIONS)} for i in range(2)]
+    return conds[0], conds[1]
+
+# The DataPacker encodes the size of each commit (3 means no commit)
+def encodeDpFirmware(commit,size,N,M):
+    if commit==0:
+        return 3
+    elif size==1:
+        return 2
+    elif size==M:
+        return 1
+    elif size==N:
+        return 0
+    else:
+        assert False, "Cannot commit "+str(size)+" elements"
+
+def decodeDpFirmware(byte,N,M):
+    assert byte<=3, "Unknown DataPacker firmware "+str(byte)
+    return struct(commit=int(byte!=3),size=[N,M,1,0][byte])
+
+# Number of bytes of each section of the stream received by reconfig_unit.sv (after the command byte)
+def imageSections(M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH):
+    return {'ib':1,'fu':3*MAX_CHAINS+FUVRF_SIZE*M*DATA_WIDTH//8,'vvalu':7*MAX_CHAINS,'vsru':MAX_CHAINS,'dp':2*MAX_CHAINS}
+
+''' Encodes a firmware and the initial FUVRF values into the byte stream that reconfigures the hardware through the UART '''
+# Each element of a FUVRF row is stored in DATA_WIDTH bits (element 0 in the least significant bits, as in the .mif files)
+# and rows are sent most significant byte first
+def encodeImage(fw,fuvrf,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,DATA_TYPE):
+    assert len(fw['fu'])==MAX_CHAINS, "Firmware must be compiled for MAX_CHAINS chains"
+    assert len(fuvrf)==FUVRF_SIZE*M, "FUVRF must have FUVRF_SIZE*M values"
+    if DATA_TYPE=='fixed_point':
+        fuvrf=encodeArray(fuvrf,DATA_WIDTH).tolist()
+    else:
+        fuvrf=[int(v)&((1<<DATA_WIDTH)-1) for v in fuvrf]
+    rows=[sum(v<<(DATA_WIDTH*idx) for idx, v in enumerate(fuvrf[i*M:(i+1)*M])).to_bytes(M*DATA_WIDTH//8,'big') for i in range(FUVRF_SIZE)]
+
+    image=[RECONFIG_COMMAND,fw['valid_chains']]
+    image+=[chain.filter for chain in fw['fu']]+[chain.addr for chain in fw['fu']]+[chain.axis for chain in fw['mvru']]
+    image+=[b for row in rows for b in row]
+    image+=[chain.op for chain in fw['vvalu']]+[chain.addr for chain in fw['vvalu']]
+    image+=[encodeCond(chain.cond1,chain.cond2) for chain in fw['vvalu']]
+    image+=[chain.cache for chain in fw['vvalu']]+[chain.cache_addr for chain in fw['vvalu']]+[chain.minicache for chain in fw['vvalu']]
+    image+=[encodeCond(chain.cache_cond1,chain.cache_cond2) for chain in fw['vvalu']]
+    image+=[chain.op for chain in fw['vsru']]
+    image+=[encodeCond(chain.cond1,chain.cond2) for chain in fw['dp']]+[encodeDpFirmware(chain.commit,chain.size,N,M) for chain in fw['dp']]
+    assert all(0<=b<256 for b in image), "Firmware values must fit in a byte"
+    assert len(image)==1+sum(imageSections(M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH).values())
+    return bytes(image)
+
+# Splits an image into the bytes of each section
+def splitImage(image,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH):
+    sections=imageSections(M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+    assert len(image)==1+sum(sections.values()), "Image has "+str(len(image))+" bytes instead of "+str(1+sum(sections.values()))
+    assert image[0]==RECONFIG_COMMAND, "Image does not start with the reconfiguration command"
+    data, start={}, 1
+    for name, size in sections.items():
+        data[name]=list(image[start:start+size])
+        start=start+size
+    return data
+
+''' Decodes a byte stream created by encodeImage back into a firmware (as returned by compiler.compile) and the FUVRF values '''
+def decodeImage(image,N,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH,DATA_TYPE):
+    # Split image into sections and each section into fields of MAX_CHAINS bytes
+    data=splitImage(image,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+    field=lambda name, i: data[name][i*MAX_CHAINS:(i+1)*MAX_CHAINS]
+
+    row_bytes=M*DATA_WIDTH//8
+    fuvrf=[]
+    for i in range(FUVRF_SIZE):
+        row=int.from_bytes(bytes(data['fu'][3*MAX_CHAINS+i*row_bytes:3*MAX_CHAINS+(i+1)*row_bytes]),'big')
+        fuvrf+=[(row>>(DATA_WIDTH*idx))&((1<<DATA_WIDTH)-1) for idx in range(M)]
+    if DATA_TYPE=='fixed_point':
+        fuvrf=decodeArray(fuvrf,DATA_WIDTH).tolist()
+    else:
+        fuvrf=[v-(1<<DATA_WIDTH) if v>>(DATA_WIDTH-1) else v for v in fuvrf]
+
+    fw={'valid_chains':data['ib'][0]}
+    fw['fu']=[struct(filter=f,addr=a) for f, a in zip(field('fu',0),field('fu',1))]
+    fw['mvru']=[struct(axis=a) for a in field('fu',2)]
+    fw['vsru']=[struct(op=o) for o in field('vsru',0)]
+    fw['vvalu']=[]
+    for op, addr, cond, cache, cache_addr, minicache, cache_cond in zip(*[field('vvalu',i) for i in range(7)]):
+        cond1, cond2=decodeCond(cond)
+        cache_cond1, cache_cond2=decodeCond(cache_cond)
+        fw['vvalu'].append(struct(op=op,addr=addr,cond1=cond1,cond2=cond2,cache=cache,cache_addr=cache_addr,minicache=minicache,
+                                  cache_cond1=cache_cond1,cache_cond2=cache_cond2))
+    fw['dp']=[]
+    for cond, dp in zip(field('dp',0),field('dp',1)):
+        chain=decodeDpFirmware(dp,N,M)
+        chain.cond1, chain.cond2=decodeCond(cond)
+        fw['dp'].append(chain)
+    return fw, fuvrf
+
+''' Encodes the bytes that turn the configuration of one image into another, so only what changed is sent through the UART '''
+# Changed FUVRF bytes are sent with the rest of their row, since the FRU writes whole rows, and records are merged
+# when the unchanged bytes between them are fewer than the header of a new record
+def encodeDelta(old,new,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH):
+    old_data=splitImage(old,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+    new_data=splitImage(new,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+    row_bytes=M*DATA_WIDTH//8
+    delta=[DELTA_COMMAND]
+    for unit, name in enumerate(new_data):
+        changed=[addr for addr, (a, b) in enumerate(zip(old_data[name],new_data[name])) if a!=b]
+        if name=='fu':
+            rows={(addr-3*MAX_CHAINS)//row_bytes for addr in changed if addr>=3*MAX_CHAINS}
+            changed=sorted({addr for addr in changed if addr<3*MAX_CHAINS}|
+                           {3*MAX_CHAINS+row*row_bytes+i for row in rows for i in range(row_bytes)})
+        records=[]
+        for addr in changed:
+            if records and addr-records[-1][1]<=RECORD_HEADER and addr-records[-1][0]<MAX_RECORD_LENGTH:
+                records[-1][1]=addr
+            else:
+                records.append([addr,addr])
+        for first, last in records:
+            delta+=[unit,first>>8,first&255,last-first+1]+new_data[name][first:last+1]
+    return bytes(delta+[DELTA_END])
+
+# Returns the records of a delta as structs with the unit, address and data bytes
+def decodeDelta(delta):
+    assert delta[0]==DELTA_COMMAND, "Delta does not start with the delta command"
+    records, idx=[], 1
+    while delta[idx]!=DELTA_END:
+        length=delta[idx+3]
+        assert length>0, "Records must have at least one byte"
+        records.append(struct(unit=delta[idx],addr=(delta[idx+1]<<8)|delta[idx+2],data=list(delta[idx+4:idx+4+length])))
+        idx=idx+RECORD_HEADER+length
+    assert idx==len(delta)-1, "Delta has bytes after its end"
+    return records
+
+''' Returns the image that results from applying a delta to another image, as the reconfiguration unit does '''
+def applyDelta(image,delta,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH):
+    data=splitImage(image,M,MAX_CHAINS,FUVRF_SIZE,DATA_WIDTH)
+    names=list(data)
+    for record in decodeDelta(delta):
+        assert record.unit<len(names), "Unknown unit "+str(record.unit)
+        name=names[record.unit]
+        assert record.addr+len(record.data)<=len(data[name]), "Record does not fit in the "+name+" section"
+        data[name][record.addr:record.addr+len(record.data)]=record.data
+    deltaFuvrfRows(delta,M,MAX_CHAINS,DATA_WIDTH)
+    return bytes([RECONFIG_COMMAND]+[b for name in names for b in data[name]])
+
+# Returns the FUVRF rows written by a delta (the FRU only writes a row after receiving all its bytes)
+def deltaFuvrfRows(delta,M,MAX_CHAINS,DATA_WIDTH):
+    row_bytes=M*DATA_WIDTH//8
+    written={addr-3*MAX_CHAINS for record in decodeDelta(delta) if record.unit==1
+             for addr in range(record.addr,record.addr+len(record.data)) if addr>=3*MAX_CHAINS}
+    rows=sorted({addr//row_bytes for addr in written})
+    assert len(written)==len(rows)*row_bytes, "FUVRF rows must be sent whole"
+    return rows
@@ -0,0 +1,132 @@
+import functools, hashlib, inspect, os, pickle, tempfile
+from collections import OrderedDict
+import numpy as np
+from firmware import compiler as compilerModule
+
+# Hash of the compiler source, so cached firmware is invalidated whenever the compiler (and its encoding) changes
+def compilerVersion():
+    return hashlib.sha256(inspect.getsource(compilerModule).encode()).hexdigest()
+
+# Identifies a firmware function by its name, source, code, defaults and closure (functools.partial arguments are merged into args/kwargs)
+# The code and closure tell apart functions with the same name and source, e.g. lambdas created in a loop or on the same line
+def functionKey(function,args,kwargs):
+    while isinstance(function,functools.partial):
+        args=function.args+tuple(args)
+        kwargs={**function.keywords,**kwargs}
+        function=function.func
+    closure=[cellContents(cell) for cell in function.__closure__ or []]
+    return (function.__module__+'.'+function.__qualname__, functionSource(function), codeKey(function.__code__),
+            argumentKey(function.__defaults__), argumentKey(function.__kwdefaults__), argumentKey(closure),
+            argumentKey(tuple(args)), argumentKey(sorted(kwargs.items())))
+
+# Identifies compiled code by its bytecode, names, constants and position in the source (nested code is identified in the same way)
+def codeKey(code):
+    consts=tuple(codeKey(c) if inspect.iscode(c) else repr(c) for c in code.co_consts)
+    positions=tuple(code.co_positions()) if hasattr(code,'co_positions') else ()
+    return (code.co_code, code.co_names, consts, code.co_firstlineno, positions)
+
+def cellContents(cell):
+    try:
+        return cell.cell_contents
+    except ValueError:
+        return None
+
+# Identifies an argument by its repr, except NumPy arrays, whose repr can be truncated, which are identified by their contents
+def argumentKey(value):
+    if isinstance(value,np.ndarray) and value.dtype!=object:
+        return ('ndarray',str(value.dtype),value.shape,hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value,np.ndarray):
+        return ('ndarray',value.shape,argumentKey(value.tolist()))
+    if isinstance(value,(list,tuple)):
+        return (type(value).__name__,)+tuple(argumentKey(v) for v in value)
+    if isinstance(value,dict):
+        return ('dict',)+tuple((repr(k),argumentKey(v)) for k, v in sorted(value.items(),key=lambda item: repr(item[0])))
+    if inspect.isfunction(value):
+        return ('function',value.__module__+'.'+value.__qualname__,codeKey(value.__code__))
+    return repr(value)
+
+# Source of a function and of the module that defines it, so editing a helper of the same module also invalidates its firmware
+# Helpers defined in other modules are not part of the key
+# Reading the source is slower than compiling small firmware, so it is only done once per function
+@functools.lru_cache(maxsize=1024)
+def functionSource(function):
+    try:
+        source=inspect.getsource(function)
+    except (OSError,TypeError):
+        return ''
+    try:
+        return source+inspect.getsource(inspect.getmodule(function))
+    except (OSError,TypeError):
+        return source
+
+''' Memoizes compiled firmware in memory (LRU) and optionally on disk '''
+# Firmware is keyed on the firmware function (its code, closure, defaults and the source of its module), its arguments, N, M, MAX_CHAINS and the compiler version
+# Arguments are identified by their repr (NumPy arrays by their contents), and the returned firmware is shared between callers, so it must not be modified
+class firmwareCache():
+
+    def key(self,function,cp,args,kwargs):
+        parts=functionKey(function,args,kwargs)+(cp.N,cp.M,cp.MAX_CHAINS,self.version)
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    # Returns the firmware that function(cp,*args,**kwargs) would compile, compiling it (with a new compiler) only on a miss
+    def firmware(self,function,cp,*args,**kwargs):
+        key=self.key(function,cp,args,kwargs)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits=self.hits+1
+            return self.memory[key]
+        fw=self.read(key)
+        if fw is None:
+            self.misses=self.misses+1
+            fw=function(compilerModule.compiler(cp.N,cp.M,cp.MAX_CHAINS),*args,**kwargs)
+            self.write(key,fw)
+        else:
+            self.disk_hits=self.disk_hits+1
+        self.memory[key]=fw
+        if len(self.memory)>self.maxsize:
+            self.memory.popitem(last=False)
+        return fw
+
+    def read(self,key):
+        if self.folder is None:
+            return None
+        try:
+            with open(os.path.join(self.folder,key+'.pkl'),'rb') as f:
+                return pickle.load(f)
+        except (OSError,EOFError,pickle.UnpicklingError):
+            return None
+
+    # Files are written to a temporary file first, so parallel processes never read partially written firmware
+    def write(self,key,fw):
+        if self.folder is None:
+            return
+        os.makedirs(self.folder,exist_ok=True)
+        handle, path=tempfile.mkstemp(dir=self.folder)
+        with os.fdopen(handle,'wb') as f:
+            pickle.dump(fw,f)
+        os.replace(path,os.path.join(self.folder,key+'.pkl'))
+
+    def clear(self):
+        self.memory.clear()
+
+    def __init__(self,maxsize=128,folder=None):
+        self.maxsize=maxsize
+        self.folder=folder
+        self.version=compilerVersion()
+        self.memory=OrderedDict()
+        self.hits=0
+        self.disk_hits=0
+        self.misses=0
+
+# Cache used by default (set defaultCache.folder to keep firmware on disk)
+defaultCache=firmwareCache()
+
+''' Firmware function that is compiled through a cache, e.g. cached(firm.distribution)(proc.compiler,bins=16,M=8) '''
+# Instances can be pickled (if the function can), so they can also be used in sweeps
+class cached():
+    def __call__(self,cp,*args,**kwargs):
+        return (defaultCache if self.cache is None else self.cache).firmware(self.function,cp,*args,**kwargs)
+
+    def __init__(self,function,cache=None):
+        self.function=function
+        self.cache=cache
@@ -75,12 +75,15 @@ class compiler():
         self.firmware['vsru'].append(copy(self.vsru))
         self.firmware['vvalu'].append(copy(self.vvalu))
         self.firmware['dp'].append(copy(self.dp))
-    def compile(self):
+    def compile(self,optimize=False):
         # Make sure we are returning a firmware with MAX_CHAINS chains
         self.firmware['valid_chains'] = self.chains_created
         while self.chains_created!=self.MAX_CHAINS:
             self.begin_chain()
             self.end_chain()
+        # Optionally reduce the number of chains (see optimizeFirmware), keeping the report of what was done
+        if optimize:
+            self.firmware, self.report = optimizeFirmware(self.firmware)
         # Return final firmware    
         return self.firmware
 
@@ -97,3 +100,116 @@ class compiler():
         self.fu, self.mvru, self.vsru, self.vvalu, self.dp = [],[],[],[],[]
         self.firmware ={"fu":[],"mvru":[],"vsru":[],"vvalu":[],"dp":[],"valid_chains":0}
         self.chains_created = 0
+
+# Conditions set in the condition dicts of a chain (the compiler also sets a None key when no condition is given)
+def activeConditions(*conds):
+    return tuple(tuple(k for k in ['last','notlast','first','notfirst'] if cond.get(k)) for cond in conds)
+
+# State each chain reads and writes ('mc' is the minicache and integers are VVVRF addresses) and whether it commits
+def chainEffects(fw,idx):
+    vvalu, dp = fw['vvalu'][idx], fw['dp'][idx]
+    reads, writes = set(), set()
+    if vvalu.op!=0:
+        reads.add(vvalu.addr)
+    if vvalu.minicache in [1,3]:
+        reads.add('mc')
+    if vvalu.cache:
+        writes.add(vvalu.cache_addr)
+    if vvalu.minicache in [2,3]:
+        writes.add('mc')
+    return reads, writes, bool(dp.commit)
+
+# Values that the VVALU of a chain outputs (chains with the same datapath compute the same vector from the same state)
+def chainDatapath(fw,idx,vsru_first):
+    fu, mvru, vvalu = fw['fu'][idx], fw['mvru'][idx], fw['vvalu'][idx]
+    datapath=(fu.filter, fu.addr if fu.filter else 0, mvru.axis, vvalu.op, vvalu.addr if vvalu.op else 0,
+              activeConditions(vvalu.cond1,vvalu.cond2) if vvalu.op else (), vvalu.minicache in [1,3])
+    return datapath+(fw['vsru'][idx].op,) if vsru_first else datapath
+
+# Merges chain j into chain i (i<j), if the merged chain can do the work of both at the position of chain i
+def mergeChains(fw,i,j,vsru_first):
+    if chainDatapath(fw,i,vsru_first)!=chainDatapath(fw,j,vsru_first):
+        return None
+    reads_i, writes_i, commit_i = chainEffects(fw,i)
+    reads_j, writes_j, commit_j = chainEffects(fw,j)
+    vi, vj = fw['vvalu'][i], fw['vvalu'][j]
+    if commit_i and commit_j:
+        return None
+    if vi.cache and vj.cache and (vi.cache_addr!=vj.cache_addr or activeConditions(vi.cache_cond1,vi.cache_cond2)!=activeConditions(vj.cache_cond1,vj.cache_cond2)):
+        return None
+    # Chain j must see the same state at the position of chain i, and moving its writes and commits up must not be noticed by the chains in between
+    if writes_i & reads_j:
+        return None
+    for k in range(i+1,j):
+        reads_k, writes_k, commit_k = chainEffects(fw,k)
+        if writes_k & (reads_j | writes_j) or reads_k & writes_j or (commit_k and commit_j):
+            return None
+
+    merged={b: copy(fw[b][i]) for b in ['fu','mvru','vsru','vvalu','dp']}
+    if commit_j:
+        merged['vsru'], merged['dp'] = copy(fw['vsru'][j]), copy(fw['dp'][j])
+    if vj.cache:
+        merged['vvalu'].cache, merged['vvalu'].cache_addr = vj.cache, vj.cache_addr
+        merged['vvalu'].cache_cond1, merged['vvalu'].cache_cond2 = copy(vj.cache_cond1), copy(vj.cache_cond2)
+    if vj.minicache in [2,3] and vi.minicache in [0,1]:
+        merged['vvalu'].minicache=vi.minicache+2
+    return merged
+
+''' Optimization pass that reduces the number of chains (and so the cycles spent on each input vector) without changing the results '''
+# Removes writes to the VVVRF/minicache that are never read, chains without any effect, and merges chains that compute the same vector
+# BUILDING_BLOCKS is only needed when the VectorScalarReduce comes before the VectorVectorALU
+def optimizeFirmware(fw,BUILDING_BLOCKS=None):
+    vsru_first=BUILDING_BLOCKS is not None and BUILDING_BLOCKS.index('VectorScalarReduce')<BUILDING_BLOCKS.index('VectorVectorALU')
+    chains=[{b: copy(fw[b][idx]) for b in ['fu','mvru','vsru','vvalu','dp']} for idx in range(fw['valid_chains'])]
+    report=struct(chains_before=fw['valid_chains'],removed=0,merged=0,dead_writes=0)
+    table=lambda: {b: [c[b] for c in chains] for b in ['fu','mvru','vsru','vvalu','dp']}
+
+    changed=True
+    while changed:
+        changed=False
+        # Writes that no chain reads
+        current=table()
+        reads=set().union(*[chainEffects(current,idx)[0] for idx in range(len(chains))])
+        for c in chains:
+            if c['vvalu'].cache and c['vvalu'].cache_addr not in reads:
+                c['vvalu'].cache=0
+                report.dead_writes+=1
+                changed=True
+            if c['vvalu'].minicache in [2,3] and 'mc' not in reads:
+                c['vvalu'].minicache-=2
+                report.dead_writes+=1
+                changed=True
+
+        # Chains without effects
+        current=table()
+        kept=[c for idx, c in enumerate(chains) if chainEffects(current,idx)[1] or chainEffects(current,idx)[2]]
+        report.removed+=len(chains)-len(kept)
+        changed=changed or len(kept)!=len(chains)
+        chains=kept
+
+        # Chains that compute the same vector
+        current=table()
+        for i in range(len(chains)):
+            for j in range(i+1,len(chains)):
+                merged=mergeChains(current,i,j,vsru_first)
+                if merged is not None:
+                    chains[i]=merged
+                    del chains[j]
+                    report.merged+=1
+                    changed=True
+                    break
+            if changed:
+                break
+
+    # Pad the firmware with empty chains, as compile does
+    MAX_CHAINS=len(fw['fu'])
+    optimized={b: [c[b] for c in chains] for b in ['fu','mvru','vsru','vvalu','dp']}
+    cp=compiler(0,0,MAX_CHAINS)
+    for idx in range(len(chains),MAX_CHAINS):
+        cp.begin_chain()
+        for b in ['fu','mvru','vsru','vvalu','dp']:
+            optimized[b].append(copy(getattr(cp,b)))
+    optimized['valid_chains']=len(chains)
+    report.chains_after=len(chains)
+    report.cycles_saved_per_vector=max(1,report.chains_before)-max(1,report.chains_after)
+    return optimized, report
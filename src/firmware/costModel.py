@@ -0,0 +1,59 @@
+import math
+import numpy as np
+from misc.misc import struct
+from emulator.emulator import decodeFirmware, frameFlags
+
+# Clock of the FPGA and baud rate of the UART (see uart.sv) and cycles that reconfig_unit.sv sleeps before dumping the trace buffer
+CLOCK_FREQ=50e6
+BAUD_RATE=57600
+DUMP_SLEEP_CYCLES=25000000
+# Each byte sent through the UART also has a start and a stop bit
+UART_BITS_PER_BYTE=10
+
+# Returns how many times each chain of a firmware commits to the DataPacker in one period of the eof/bof flags
+# Input vectors are assumed to arrive in frames of frame_length vectors (eof[0]) grouped in frames of frame2_length vectors (eof[1])
+def commitsPerPeriod(tables,frame_length,frame2_length):
+    period=frame_length if frame2_length is None else math.lcm(frame_length,frame2_length)
+    k=np.arange(period)
+    eof0=k%frame_length==frame_length-1
+    eof1=np.zeros(period,dtype=bool) if frame2_length is None else k%frame2_length==frame2_length-1
+    # The bof of a vector is the eof of the previous one (flags repeat every period)
+    flags=np.array([frameFlags([e0,e1],[b0,b1]) for e0, e1, b0, b1 in zip(eof0,eof1,np.roll(eof0,1),np.roll(eof1,1))])
+    commits=[int(np.count_nonzero((flags & dp.cond_mask)==dp.cond_value)) if dp.commit else 0 for dp in tables['dp']]
+    return commits, period
+
+''' Estimates the throughput and trace buffer usage of a firmware without emulating it '''
+# input_rate is the rate at which vectors arrive (vectors per cycle, 1 if not given)
+def firmwareCost(fw,N,M,IB_DEPTH,TB_SIZE,DATA_WIDTH,frame_length=1,frame2_length=None,input_rate=None,clock_freq=CLOCK_FREQ,baud_rate=BAUD_RATE):
+    tables=decodeFirmware(fw)
+    cost=struct(chains=fw['valid_chains'])
+
+    # The input buffer dispatches one chain per cycle, so each input vector takes as many cycles as there are chains
+    cost.cycles_per_vector=max(1,fw['valid_chains'])
+    cost.max_input_rate=1/cost.cycles_per_vector
+    cost.max_vectors_per_sec=clock_freq*cost.max_input_rate
+
+    # Vectors that arrive faster than they are processed accumulate in the input buffer until it overflows
+    input_rate=1 if input_rate is None else input_rate
+    growth=input_rate-cost.max_input_rate
+    cost.cycles_to_overflow=None if growth<=0 else IB_DEPTH/growth
+    cost.vectors_to_overflow=None if growth<=0 else cost.cycles_to_overflow*input_rate
+
+    # Elements committed by all chains, and the trace buffer rows they fill
+    # Commits that don't add up to N elements (e.g. M elements after a single one) can leave rows unfinished, which is not modeled
+    commits, period=commitsPerPeriod(tables,frame_length,frame2_length)
+    elements=sum(c*dp.size for c, dp in zip(commits,tables['dp']))
+    cost.elements_per_vector=elements/period
+    cost.rows_per_vector=cost.elements_per_vector/N
+    cost.rows_per_frame=cost.rows_per_vector*frame_length
+
+    # Time until the trace buffer wraps around when vectors arrive at the given rate (or as fast as they can be processed)
+    vector_rate=min(input_rate,cost.max_input_rate)
+    rows_per_cycle=cost.rows_per_vector*vector_rate
+    cost.cycles_to_fill_tb=None if rows_per_cycle==0 else TB_SIZE/rows_per_cycle
+    cost.seconds_to_fill_tb=None if rows_per_cycle==0 else cost.cycles_to_fill_tb/clock_freq
+
+    # Dumping the trace buffer sends TB_SIZE rows of N elements through the UART
+    cost.dump_bytes=TB_SIZE*N*DATA_WIDTH//8
+    cost.dump_seconds=DUMP_SLEEP_CYCLES/clock_freq+cost.dump_bytes*UART_BITS_PER_BYTE/baud_rate
+    return cost
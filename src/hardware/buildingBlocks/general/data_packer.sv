@@ -21,6 +21,8 @@
   input logic [$clog2(MAX_CHAINS)-1:0] chainId_in,
   input logic [7:0] configId,
   input logic [7:0] configData,
+  input logic [15:0] configAddr,
+  input logic configValid,
   input logic [DATA_WIDTH-1:0] vector_in [N-1:0],
   output reg [DATA_WIDTH-1:0] vector_out [N-1:0],
   output reg valid_out
@@ -37,7 +39,6 @@
     reg cond_valid;
     wire [DATA_WIDTH-1:0] pack_1 [N-1:0];
     wire [DATA_WIDTH-1:0] pack_M [N-1:0];
-    reg [7:0] byte_counter=0;
 
     //-------------Code Start-----------------
 
@@ -80,18 +81,14 @@
       else begin
         valid_out<=0;
         if (tracing==1'b0) begin // If we are not tracing, we are reconfiguring the instrumentation
-          if (configId==PERSONAL_CONFIG_ID) begin
-            byte_counter<=byte_counter+1;
-            if (byte_counter<MAX_CHAINS)begin
-              firmware_cond[byte_counter]=configData;
+          if (configValid==1'b1 && configId==PERSONAL_CONFIG_ID) begin
+            if (configAddr<MAX_CHAINS)begin
+              firmware_cond[configAddr]=configData;
             end
-            else if (byte_counter<MAX_CHAINS*2)begin
-              firmware[byte_counter]=configData;
+            else if (configAddr<MAX_CHAINS*2)begin
+              firmware[configAddr-MAX_CHAINS]=configData;
             end
           end
-          else begin
-            byte_counter<=0;
-          end
         end
       end
         //$display("New Cycle:");
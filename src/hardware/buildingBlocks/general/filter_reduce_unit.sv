@@ -24,6 +24,8 @@
   input logic [$clog2(MAX_CHAINS)-1:0] chainId_in,
   input logic [7:0] configId,
   input logic [7:0] configData,
+  input logic [15:0] configAddr,
+  input logic configValid,
   input logic [DATA_WIDTH-1:0] vector_in [N-1:0],
   output reg [DATA_WIDTH-1:0] vector_out [N-1:0],
   output reg [$clog2(MAX_CHAINS)-1:0] chainId_out,
@@ -63,10 +65,10 @@
     reg [FRU_WIDTH-1:0] reduce_result [N-1:0];
     reg [DATA_WIDTH-1:0] reduce_result_wide [N-1:0];
     reg [7:0] firmware_reduce_axis_delay;
-    reg [7:0] byte_counter=0;
-    reg [7:0] FRU_reconfig_byte_counter=0;
-    reg [$clog2(FUVRF_SIZE)-1:0] FRU_reconfig_M_counter=0;
+    parameter ROW_BYTES = M*DATA_WIDTH/8;
     reg [M*DATA_WIDTH-1:0] FRU_reconfig_vector =0;
+    // Bytes of the FUVRF are received most significant first
+    wire [M*DATA_WIDTH-1:0] FRU_reconfig_vector_next = (FRU_reconfig_vector<<8) | configData;
 
     integer i,j,k;
 
@@ -88,7 +90,7 @@
     reg [$clog2(FUVRF_SIZE)-1:0] mem_address_a=0;
     reg [$clog2(FUVRF_SIZE)-1:0] mem_address_b=0;
     reg mem_write_enable_a=0;
-    reg mem_write_enable_b;
+    reg mem_write_enable_b=0;
     reg [MEM_WIDTH-1:0] mem_in_a =0;
     reg [MEM_WIDTH-1:0] mem_in_b;
     wire [MEM_WIDTH-1:0] mem_out_a;
@@ -127,46 +129,36 @@
         eof_out <= eof_in_delay_variable[reduce_delays];
         bof_out <= bof_in_delay_variable[reduce_delays];
         chainId_out <= chainId_in_delay_variable[reduce_delays];
+        mem_write_enable_b <= 0;
 
       end
       else begin // If we are not tracing, we are reconfiguring the instrumentation
         valid_out<=0;
-          if (configId==PERSONAL_CONFIG_ID) begin
-            byte_counter<=byte_counter+1;
-            if (byte_counter<MAX_CHAINS)begin
-              firmware_filter_op[byte_counter]<=configData;
+          if (configValid==1'b1 && configId==PERSONAL_CONFIG_ID) begin
+            if (configAddr<MAX_CHAINS)begin
+              firmware_filter_op[configAddr]<=configData;
             end
-            else if (byte_counter<MAX_CHAINS*2)begin
-              firmware_filter_addr[byte_counter]<=configData;
+            else if (configAddr<MAX_CHAINS*2)begin
+              firmware_filter_addr[configAddr-MAX_CHAINS]<=configData;
             end
-            else if (byte_counter<MAX_CHAINS*3)begin
-              firmware_reduce_axis[byte_counter]<=configData;
+            else if (configAddr<MAX_CHAINS*3)begin
+              firmware_reduce_axis[configAddr-MAX_CHAINS*2]<=configData;
             end
-            else if (byte_counter<MAX_CHAINS*3+FUVRF_SIZE*(M*DATA_WIDTH/8)) begin
-              if (M*DATA_WIDTH<=8) begin
-                FRU_reconfig_vector<=configData;
-              end
-              else begin
-                FRU_reconfig_vector<={FRU_reconfig_vector[M*DATA_WIDTH-8-1:0],configData};
-              end
-              if (FRU_reconfig_byte_counter==M*DATA_WIDTH/8-1) begin
-                FRU_reconfig_byte_counter<=0;
-                FRU_reconfig_M_counter<=FRU_reconfig_M_counter+1;
+            else if (configAddr<MAX_CHAINS*3+FUVRF_SIZE*ROW_BYTES) begin
+              // Rows are always received whole, so the row is written to the FUVRF with its last byte
+              FRU_reconfig_vector<=FRU_reconfig_vector_next;
+              if ((configAddr-MAX_CHAINS*3)%ROW_BYTES==ROW_BYTES-1) begin
                 mem_write_enable_b<=1;
-                mem_address_b<=FRU_reconfig_M_counter;
-                mem_in_b<=FRU_reconfig_vector;
+                mem_address_b<=(configAddr-MAX_CHAINS*3)/ROW_BYTES;
+                mem_in_b<=FRU_reconfig_vector_next;
               end
               else begin 
                 mem_write_enable_b<=0;
-                FRU_reconfig_byte_counter<=FRU_reconfig_byte_counter+1;
               end
             end
           end
           else begin
-            byte_counter<=0;
             mem_write_enable_b<=0;
-            FRU_reconfig_byte_counter<=0;
-            FRU_reconfig_M_counter<=0;
           end
         end
 
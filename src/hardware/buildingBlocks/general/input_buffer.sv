@@ -19,6 +19,8 @@
   input logic tracing,
   input logic [7:0] configId,
   input logic [7:0] configData,
+  input logic [15:0] configAddr,
+  input logic configValid,
   input logic [DATA_WIDTH-1:0] vector_in [N-1:0],
   output reg valid_out=0,
   output reg [1:0] eof_out,
@@ -148,7 +150,7 @@
       // If we are not tracing, we are reconfiguring the instrumentation
       else begin
         valid_out<=0;
-        if (configId==PERSONAL_CONFIG_ID )begin
+        if (configValid==1'b1 && configId==PERSONAL_CONFIG_ID)begin
           valid_chains<=configData;
         end
       end
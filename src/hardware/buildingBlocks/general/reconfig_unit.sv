@@ -1,6 +1,9 @@
  //-----------------------------------------------------
  // Design Name : Reconfig unit
  // Function    : Receive UART data, reconfigure all blocks and dump trace buffer data when needed
+ //               Byte 42 starts a full reconfiguration and byte 43 a delta reconfiguration, made of records with the
+ //               unit id, the address within the unit (2 bytes, most significant first), the length and the data bytes,
+ //               that ends with unit id 255. Any other byte dumps the trace buffer
  //-----------------------------------------------------
 
   module  reconfigUnit     #(
@@ -21,33 +24,42 @@
   output logic tracing,
   output logic [7:0] configId,
   output logic [7:0] configData,
+  output logic [15:0] configAddr,
+  output logic configValid,
   output logic [$clog2(TB_SIZE)-1:0] tb_mem_address,
   input logic [DATA_WIDTH-1:0] vector_out_tb [N-1:0]
 
  );
 
-  parameter [9:0]
-    DBG_TRACING                 = 10'b0000000001,
-    DBG_SLEEP_HALF_SECOND       = 10'b0000000010,
-    DBG_SELECT_DATA_TO_TRANSMIT = 10'b0000000100,
-    DBG_DELAY                   = 10'b0000001000,
-    DBG_READ_SELECTED_DATA      = 10'b0000010000, 
-    DBG_START_TRANSMISSION      = 10'b0000100000, 
-    DBG_WAIT_BYTE_TRANSMISSION  = 10'b0001000000,
-    DBG_CHECK_DONE              = 10'b0010000000,
-    DBG_FINAL                   = 10'b0100000000,
-    DBG_UPDATING_INTRUMENTATION = 10'b1000000000;
+  parameter [14:0]
+    DBG_TRACING                 = 15'b000000000000001,
+    DBG_SLEEP_HALF_SECOND       = 15'b000000000000010,
+    DBG_SELECT_DATA_TO_TRANSMIT = 15'b000000000000100,
+    DBG_DELAY                   = 15'b000000000001000,
+    DBG_READ_SELECTED_DATA      = 15'b000000000010000, 
+    DBG_START_TRANSMISSION      = 15'b000000000100000, 
+    DBG_WAIT_BYTE_TRANSMISSION  = 15'b000000001000000,
+    DBG_CHECK_DONE              = 15'b000000010000000,
+    DBG_FINAL                   = 15'b000000100000000,
+    DBG_UPDATING_INTRUMENTATION = 15'b000001000000000,
+    DBG_DELTA_ID                = 15'b000010000000000,
+    DBG_DELTA_ADDR_HIGH         = 15'b000100000000000,
+    DBG_DELTA_ADDR_LOW          = 15'b001000000000000,
+    DBG_DELTA_LENGTH            = 15'b010000000000000,
+    DBG_DELTA_DATA              = 15'b100000000000000;
 
   parameter BYTES_TO_DUMP=N*DATA_WIDTH/8;
-  reg [9:0]   dbg_state = DBG_TRACING;
+  reg [14:0]  dbg_state = DBG_TRACING;
   reg [15:0]  dbg_tx_counter = 0;
   reg [31:0]  dbg_TB_SIZE_counter = 0;
   reg [31:0]  dbg_sleep_half_second = 0;
-  reg [7:0]   dbg_rx_counter = 0;
+  reg [15:0]  dbg_rx_counter = 0;
   reg         dbg_last_uart_byte_received=0;
   reg [DATA_WIDTH*N-1:0] vector_to_dump;
   reg new_tx_data_reg=0;
   reg dump_new_vector=1;
+  reg [15:0]  delta_addr = 0;
+  reg [7:0]   delta_length = 0;
 
   assign tx_data=vector_to_dump[7:0];
   assign tb_mem_address = dbg_TB_SIZE_counter;
@@ -56,7 +68,7 @@
 
   parameter BYTES_IB=1;
   parameter BYTES_FRU=3*MAX_CHAINS+FUVRF_SIZE*M*DATA_WIDTH/8;
-  parameter BYTES_VVALU=5*MAX_CHAINS;
+  parameter BYTES_VVALU=7*MAX_CHAINS;
   parameter BYTES_VSRU=MAX_CHAINS;
   parameter BYTES_DP=2*MAX_CHAINS;
   parameter BYTES_TO_RECEIVE=BYTES_IB+BYTES_FRU+BYTES_VVALU+BYTES_VSRU+BYTES_DP;
@@ -66,19 +78,25 @@
   parameter ID_VVALU=2;
   parameter ID_VSRU=3;
   parameter ID_DP=4;
+  parameter DELTA_END=255;
 
   // State transitions
   always @(posedge clk) begin
+    // Blocks only write configData at configAddr in the cycle after a byte is received
+    configValid <= 1'b0;
     case (dbg_state)
       DBG_TRACING:
       begin
         if (new_rx_data) begin
-            if (rx_data!=8'd42) begin   // This will start dumping the information
-                dbg_state <= DBG_SLEEP_HALF_SECOND;
-            end
-            else begin                  // Otherwise, we read the values that come from the UART to update the instrumentation
+            if (rx_data==8'd42) begin   // Read all the values that come from the UART to update the instrumentation
                 dbg_state <= DBG_UPDATING_INTRUMENTATION;
             end
+            else if (rx_data==8'd43) begin   // Read only the values that changed
+                dbg_state <= DBG_DELTA_ID;
+            end
+            else begin                  // Otherwise, this will start dumping the information
+                dbg_state <= DBG_SLEEP_HALF_SECOND;
+            end
         end
         else begin
             dbg_state <= DBG_TRACING;
@@ -88,31 +106,72 @@
       begin
           if (new_rx_data) begin
               configData	              <= rx_data;
+              configValid                 <= 1'b1;
               dbg_rx_counter              <= dbg_rx_counter+1;
               dbg_state                   <= DBG_UPDATING_INTRUMENTATION;
               dbg_last_uart_byte_received <= (dbg_rx_counter==BYTES_TO_RECEIVE-1);
               if (dbg_rx_counter<BYTES_IB) begin
               	configId <= ID_IB;
+              	configAddr <= dbg_rx_counter;
               end
-              else if (dbg_rx_counter<BYTES_IB+ID_FRU) begin
+              else if (dbg_rx_counter<BYTES_IB+BYTES_FRU) begin
               	configId <= ID_FRU;
+              	configAddr <= dbg_rx_counter-BYTES_IB;
               end
-              else if (dbg_rx_counter<BYTES_IB+ID_FRU+BYTES_VVALU) begin
+              else if (dbg_rx_counter<BYTES_IB+BYTES_FRU+BYTES_VVALU) begin
               	configId <= ID_VVALU;
+              	configAddr <= dbg_rx_counter-(BYTES_IB+BYTES_FRU);
               end
-              else if (dbg_rx_counter<BYTES_IB+ID_FRU+BYTES_VVALU+BYTES_VSRU) begin
+              else if (dbg_rx_counter<BYTES_IB+BYTES_FRU+BYTES_VVALU+BYTES_VSRU) begin
               	configId <= ID_VSRU;
+              	configAddr <= dbg_rx_counter-(BYTES_IB+BYTES_FRU+BYTES_VVALU);
               end
               else if (dbg_rx_counter<BYTES_TO_RECEIVE) begin
               	configId <= ID_DP;
+              	configAddr <= dbg_rx_counter-(BYTES_IB+BYTES_FRU+BYTES_VVALU+BYTES_VSRU);
               end
           end
           else if (dbg_last_uart_byte_received==1'b1) begin
-                  dbg_rx_counter              <= 8'b0;
+                  dbg_rx_counter              <= 16'b0;
                   dbg_last_uart_byte_received <= 1'b0;
                   dbg_state                   <= DBG_TRACING;
           end
       end
+      DBG_DELTA_ID:
+          if (new_rx_data) begin
+              if (rx_data==DELTA_END) begin
+                  dbg_state <= DBG_TRACING;
+              end
+              else begin
+                  configId  <= rx_data;
+                  dbg_state <= DBG_DELTA_ADDR_HIGH;
+              end
+          end
+      DBG_DELTA_ADDR_HIGH:
+          if (new_rx_data) begin
+              delta_addr[15:8] <= rx_data;
+              dbg_state        <= DBG_DELTA_ADDR_LOW;
+          end
+      DBG_DELTA_ADDR_LOW:
+          if (new_rx_data) begin
+              delta_addr[7:0] <= rx_data;
+              dbg_state       <= DBG_DELTA_LENGTH;
+          end
+      DBG_DELTA_LENGTH:
+          if (new_rx_data) begin
+              // Records without data are skipped (their length would wrap around in DBG_DELTA_DATA)
+              delta_length <= rx_data;
+              dbg_state    <= (rx_data==0) ? DBG_DELTA_ID : DBG_DELTA_DATA;
+          end
+      DBG_DELTA_DATA:
+          if (new_rx_data) begin
+              configData   <= rx_data;
+              configAddr   <= delta_addr;
+              configValid  <= 1'b1;
+              delta_addr   <= delta_addr+1;
+              delta_length <= delta_length-1;
+              dbg_state    <= (delta_length==1) ? DBG_DELTA_ID : DBG_DELTA_DATA;
+          end
       DBG_SLEEP_HALF_SECOND:
       begin
           if (dbg_sleep_half_second<32'd25000000) 
@@ -21,6 +21,8 @@ module  vectorScalarReduceUnit #(
   input logic tracing,
   input logic [7:0] configId,
   input logic [7:0] configData,
+  input logic [15:0] configAddr,
+  input logic configValid,
   input logic [DATA_WIDTH-1:0] vector_in [N-1:0],
   output reg valid_out,
   output reg [DATA_WIDTH-1:0] vector_out [N-1:0],
@@ -33,7 +35,6 @@ module  vectorScalarReduceUnit #(
     reg [7:0] firmware [0:MAX_CHAINS-1] = INITIAL_FIRMWARE;
     wire [DATA_WIDTH-1:0] sum; 
     reg [DATA_WIDTH-1:0] zeros [N-1:0]='{N{0}};
-    reg [7:0] byte_counter =0;
 
 
     //-------------Code Start-----------------
@@ -60,15 +61,11 @@ module  vectorScalarReduceUnit #(
         // If we are not tracing, we are reconfiguring the instrumentation
         else begin
           valid_out<=0;
-          if (configId==PERSONAL_CONFIG_ID) begin
-            byte_counter<=byte_counter+1;
-            if (byte_counter<MAX_CHAINS)begin
-              firmware[byte_counter]=configData;
+          if (configValid==1'b1 && configId==PERSONAL_CONFIG_ID) begin
+            if (configAddr<MAX_CHAINS)begin
+              firmware[configAddr]=configData;
             end
           end
-          else begin
-            byte_counter<=0;
-          end
         end
 
         eof_out<=eof_in;
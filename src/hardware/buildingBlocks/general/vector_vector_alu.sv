@@ -27,6 +27,8 @@
   input logic [$clog2(MAX_CHAINS)-1:0] chainId_in,
   input logic [7:0] configId,
   input logic [7:0] configData,
+  input logic [15:0] configAddr,
+  input logic configValid,
   input logic [DATA_WIDTH-1:0] vector_in [N-1:0],
   output reg [DATA_WIDTH-1:0] vector_out [N-1:0],
   output reg [$clog2(MAX_CHAINS)-1:0] chainId_out,
@@ -42,7 +44,7 @@
     reg [7:0] firmware_cache      [0:MAX_CHAINS-1] = INITIAL_FIRMWARE_CACHE;
     reg [7:0] firmware_cache_addr [0:MAX_CHAINS-1] = INITIAL_FIRMWARE_CACHE_ADDR;
     reg [7:0] firmware_minicache  [0:MAX_CHAINS-1] = INITIAL_FIRMWARE_MINICACHE;
-    reg [7:0] firmware_cahce_cond [0:MAX_CHAINS-1] = INITIAL_FIRMWARE_CACHE_COND;
+    reg [7:0] firmware_cache_cond [0:MAX_CHAINS-1] = INITIAL_FIRMWARE_CACHE_COND;
     reg [DATA_WIDTH-1:0] valid_result [N-1:0];
     reg [DATA_WIDTH-1:0] mini_cache [N-1:0];
     reg [7:0] firmware_minicache_delay;
@@ -60,7 +62,6 @@
     reg [7:0] firmware_cache_addr_delay = 0;
     reg [7:0] firmware_cache_addr_delay_2 = 0;
     reg [7:0] firmware_cond_delay =0;
-    reg [7:0] firmware_cache_cond =0;
     reg [7:0] firmware_cache_cond_delay =0;
     reg cond_valid, cache_cond_valid;
     reg [DATA_WIDTH-1:0] operator [N-1:0];
@@ -72,7 +73,6 @@
     reg [DATA_WIDTH*4-1:0] alu_mul_wide [N-1:0];
     reg [DATA_WIDTH-1:0] alu_sub [N-1:0];
     reg [DATA_WIDTH-1:0] alu_max [N-1:0];
-    reg [7:0] byte_counter=0;
 
     parameter LATENCY = 2;
     parameter RAM_LATENCY = LATENCY-1;
@@ -128,33 +128,29 @@
       end
       else begin
         valid_out<=0;
-        if (configId==PERSONAL_CONFIG_ID) begin
-          byte_counter<=byte_counter+1;
-          if (byte_counter<MAX_CHAINS)begin
-            firmware_op[byte_counter]=configData;
+        if (configValid==1'b1 && configId==PERSONAL_CONFIG_ID) begin
+          if (configAddr<MAX_CHAINS)begin
+            firmware_op[configAddr]=configData;
           end
-          else if (byte_counter<MAX_CHAINS*2)begin
-            firmware_addr_rd[byte_counter]=configData;
+          else if (configAddr<MAX_CHAINS*2)begin
+            firmware_addr_rd[configAddr-MAX_CHAINS]=configData;
           end
-          else if (byte_counter<MAX_CHAINS*3)begin
-            firmware_cond[byte_counter]=configData;
+          else if (configAddr<MAX_CHAINS*3)begin
+            firmware_cond[configAddr-MAX_CHAINS*2]=configData;
           end
-          else if (byte_counter<MAX_CHAINS*4)begin
-            firmware_cache[byte_counter]=configData;
+          else if (configAddr<MAX_CHAINS*4)begin
+            firmware_cache[configAddr-MAX_CHAINS*3]=configData;
           end
-          else if (byte_counter<MAX_CHAINS*5)begin
-            firmware_cache_addr[byte_counter]=configData;
+          else if (configAddr<MAX_CHAINS*5)begin
+            firmware_cache_addr[configAddr-MAX_CHAINS*4]=configData;
           end
-          else if (byte_counter<MAX_CHAINS*6)begin
-            firmware_minicache[byte_counter]=configData;
+          else if (configAddr<MAX_CHAINS*6)begin
+            firmware_minicache[configAddr-MAX_CHAINS*5]=configData;
           end
-          else if (byte_counter<MAX_CHAINS*7)begin
-            firmware_cache_cond[byte_counter]=configData;
+          else if (configAddr<MAX_CHAINS*7)begin
+            firmware_cache_cond[configAddr-MAX_CHAINS*6]=configData;
           end
         end
-        else begin
-          byte_counter<=0;
-        end
       end
 
       // Delay values until we can read the value to perform the op
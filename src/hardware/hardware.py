@@ -1,11 +1,10 @@
 import logging as log
-import sys, math, os, shutil, textwrap, subprocess,shlex
-from distutils.dir_util import copy_tree
-from shutil import copyfile
+import sys, math, os, shutil, textwrap, subprocess,shlex, hashlib, json, tempfile
 from firmware.compiler import compiler
+from firmware.binary import encodeCond, encodeDpFirmware, encodeImage
 from misc.misc import *
 import numpy as np
-from containers.modelsim.modelsimContainer import modelsimContainer
+from containers.modelsim.modelsimSession import modelsimSession
 import time
 
 # Setting Debug level (can be debug, info, warning, error and critical)
@@ -14,6 +13,39 @@ log.basicConfig(stream=sys.stderr, level=log.INFO)
 ''' General settings '''
 DEBUG=True
 
+# File of the rtl folder with the hash of every generated file
+MANIFEST=".manifest.json"
+
+def readFile(path):
+    with open(path,"rb") as f:
+        return f.read()
+
+def readFolder(folder):
+    return {name: readFile(folder+"/"+name) for name in sorted(os.listdir(folder)) if os.path.isfile(folder+"/"+name)}
+
+def readManifest(folder):
+    try:
+        with open(folder+"/"+MANIFEST) as f:
+            return json.load(f)
+    except (OSError,ValueError):
+        return {}
+
+# Size and modification time of a file (None if it doesn't exist)
+def fileStat(path):
+    try:
+        stat=os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size,stat.st_mtime_ns]
+
+# Files are written to a temporary file first, so an interrupted generation never leaves a partially written file
+def writeFile(path,data):
+    handle, tmp=tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle,"wb") as f:
+        f.write(data)
+    os.chmod(tmp,0o644)
+    os.replace(tmp,path)
+
 # Run a given command using subprocess
 def run(cmd,wait=True):
     proc = subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
@@ -67,6 +99,8 @@ class rtlHw():
                 if self.module_class.configurable_parameters!=0:
                     signals_to_connect.append(struct(name='configData_reconfig',type='logic',bits=8,elements=1))
                     signals_to_connect.append(struct(name='configId_reconfig',type='logic',bits=8,elements=1))
+                    signals_to_connect.append(struct(name='configAddr_reconfig',type='logic',bits=16,elements=1))
+                    signals_to_connect.append(struct(name='configValid_reconfig',type='logic',bits=1,elements=1))
 
             # Check if number of signals is the same
             assert len(signals_to_connect)==len(self.module_input), "Not the same number of connected signals"
@@ -125,7 +159,7 @@ class rtlHw():
             self.mem[name]['packed_elements']=packed_elements
 
         def setAsConfigurable(self,configurable_parameters):
-            self.addInput([['tracing','logic',1],['configId','logic',8],['configData','logic',8]])
+            self.addInput([['tracing','logic',1],['configId','logic',8],['configData','logic',8],['configAddr','logic',16],['configValid','logic',1]])
             self.configurable_parameters=configurable_parameters
 
         # Recursively adds Modules to module
@@ -145,7 +179,9 @@ class rtlHw():
             self.inst.__dict__[instance_name]=self.parent.rtlInstance(module_class,instance_name)
 
         # Dump RTL class into readable RTL
-        def dump(self):
+        # MIF files of the memories are added to files (name and contents)
+        def dump(self,files=None):
+            files={} if files is None else files
 
             # Append with identation (apdi is apd shifted)
             ident=self.getDepth()*"    "
@@ -162,13 +198,13 @@ class rtlHw():
             def dumpMifFile(mem):
                 for mem_name in mem.keys():
                     m=mem[mem_name]
-                    f = open(f"rtl/{mem_name}.mif", "w")
-                    f.write(f"Depth = {m['depth']};\n")
-                    f.write(f"Width = {m['width']};\n")
-                    f.write("Address_radix = dec;\n")
-                    f.write("Data_radix = dec;\n")
-                    f.write("Content\n")
-                    f.write("Begin\n")
+                    f = []
+                    f.append(f"Depth = {m['depth']};\n")
+                    f.append(f"Width = {m['width']};\n")
+                    f.append("Address_radix = dec;\n")
+                    f.append("Data_radix = dec;\n")
+                    f.append("Content\n")
+                    f.append("Begin\n")
                     if m['init_values']!=False:
                         for i in range(m['depth']):
                             # Transform array into a packed value if we are using wide memories to represent arrays
@@ -178,13 +214,13 @@ class rtlHw():
                                 packed_bits = int(0)
                                 for idx, val in enumerate(m['init_values'][i]):
                                     packed_bits=packed_bits | int(val)<<(element_width*idx)
-                                f.write(f"{i} : {packed_bits};\n")
+                                f.append(f"{i} : {packed_bits};\n")
                             else:
-                                f.write(f"{i} : {m['init_values'][i]};\n")
+                                f.append(f"{i} : {m['init_values'][i]};\n")
                     else:
-                        f.write(f"[0..{m['depth']-1}] : 0;\n")
-                    f.write("End;")
-                    f.close()
+                        f.append(f"[0..{m['depth']-1}] : 0;\n")
+                    f.append("End;")
+                    files[f"{mem_name}.mif"]="".join(f)
 
             # Add includes
             if self.includes!=[]:
@@ -212,7 +248,7 @@ class rtlHw():
                 for m in self.mod.__dict__.keys():
                     mod=self.mod.__dict__[m]
                     if mod.included==False:
-                        rtlCode=rtlCode+mod.dump()
+                        rtlCode=rtlCode+mod.dump(files)
 
                 # Create mif file and output wires
                 for i in self.inst.__dict__.keys():
@@ -349,9 +385,13 @@ class rtlHw():
             ['tracing','logic',1],
             ['configId','logic',8],
             ['configData','logic',8],
+            ['configAddr','logic',16],
+            ['configValid','logic',1],
             ['tb_mem_address','logic','$clog2(TB_SIZE)']])
         top.mod.reconfigUnit.addParameter([
             ['N'],
+            ['M'],
+            ['FUVRF_SIZE'],
             ['DATA_WIDTH'],
             ['TB_SIZE'],
             ['MAX_CHAINS']])
@@ -527,38 +567,8 @@ class rtlHw():
             DP_INITIAL_FIRMWARE_COND = EMPTY_FIRMWARE
         else:
             
-            def encodeDpFirmware(commit,size):
-                if commit==0:
-                    return 3
-                elif size==1:
-                    return 2
-                elif size==self.M:
-                    return 1
-                elif size==self.N:
-                    return 0
-                else:
-                    assert False
-            def encodeCond(cond1,cond2):
-                if cond1['last']:
-                    return 1
-                elif cond1['notlast']:
-                    return 2
-                elif cond1['first']:
-                    return 4
-                elif cond1['notfirst']:
-                    return 8
-                elif cond2['last']:
-                    return 16
-                elif cond2['notlast']:
-                    return 32
-                elif cond2['first']:
-                    return 64
-                elif cond2['notfirst']:
-                    return 128
-                else:
-                    return 0
             VSRU_INITIAL_FIRMWARE=str([chain.op for chain in self.firmware['vsru']]).replace("[", "'{").replace("]", "}")
-            DP_INITIAL_FIRMWARE = str([encodeDpFirmware(chain.commit,chain.size) for chain in self.firmware['dp']]).replace("[", "'{").replace("]", "}")
+            DP_INITIAL_FIRMWARE = str([encodeDpFirmware(chain.commit,chain.size,self.N,self.M) for chain in self.firmware['dp']]).replace("[", "'{").replace("]", "}")
             VVALU_INITIAL_FIRMWARE_OP=str([chain.op for chain in self.firmware['vvalu']]).replace("[", "'{").replace("]", "}")
             VVALU_INITIAL_FIRMWARE_ADDR_RD=str([chain.addr for chain in self.firmware['vvalu']]).replace("[", "'{").replace("]", "}")
             VVALU_INITIAL_FIRMWARE_COND=str([encodeCond(chain.cond1,chain.cond2) for chain in self.firmware['vvalu']]).replace("[", "'{").replace("]", "}")
@@ -578,6 +588,8 @@ class rtlHw():
         top.instantiateModule(top.mod.reconfigUnit,"reconfig")
         top.inst.reconfig.setParameters([
             ['N','N'],
+            ['M','M'],
+            ['FUVRF_SIZE','FUVRF_SIZE'],
             ['DATA_WIDTH','DATA_WIDTH'],
             ['TB_SIZE','TB_SIZE'],
             ['MAX_CHAINS','MAX_CHAINS']])
@@ -661,7 +673,9 @@ class rtlHw():
                                     'vector_in': 'vector_in', 
                                     'tracing': 'tracing_reconfig', 
                                     'configId': 'configId_reconfig', 
-                                    'configData': 'configData_reconfig'}
+                                    'configData': 'configData_reconfig',
+                                    'configAddr': 'configAddr_reconfig',
+                                    'configValid': 'configValid_reconfig'}
 
         # Check if building blocks are not breaking any rules
         if self.BUILDING_BLOCKS[0] != "InputBuffer" or self.BUILDING_BLOCKS[-2]!="DataPacker" or self.BUILDING_BLOCKS[-1]!="TraceBuffer":
@@ -692,35 +706,24 @@ class rtlHw():
         top.output_assignment={'vector_out': 'vector_out_tb','uart_txd':'uart_txd_comm'}
 
 
-    def testbench(self):
-        # Prepare testbench inputs
-        tb_inputs=[]
+    # Returns the stimulus read by the testbench, with one line per cycle and the values in hexadecimal
+    # Each line has a nibble with the dump, valid and eof flags followed by the N elements of the input vector (element 0 last)
+    # Inputs are followed by idle cycles (which hold the last vector and eof) until steps+1 cycles, and results are dumped on every cycle but the first one
+    def stimulus(self):
+        mask=(1<<self.DATA_WIDTH)-1
+        digits=(self.N*self.DATA_WIDTH+4+3)//4
+        lines=[]
+        vector, eof = 0, 0
         for i, inp in enumerate(self.testbench_inputs):
-            tb_inputs.append("valid = 1;")
-            tb_inputs.append(f"eof[0] = {int(inp[1])};")
-            if len(inp)>2:
-                tb_inputs.append(f"eof[1] = {int(inp[2])};")
-            else:
-                tb_inputs.append(f"eof[1] = 0;")
-            for idx,ele in enumerate(inp[0]):
-                tb_inputs.append(f"vector[{idx}]=32'd{ele};")
-            tb_inputs.append("#half_period;")
-            tb_inputs.append("#half_period;")
-            if i!=0:
-                tb_inputs.append("toFile();")  
-            tb_inputs.append("")
-        tb_inputs=("\n"+"    "*4).join(tb_inputs)
-
-        # Prepare testbench steps
-        tb_steps=[]
+            eof=int(inp[1]) | (int(inp[2])<<1 if len(inp)>2 else 0)
+            vector=sum((int(ele)&mask)<<(self.DATA_WIDTH*idx) for idx, ele in enumerate(inp[0]))
+            lines.append(((int(i!=0)<<3 | 1<<2 | eof)<<(self.N*self.DATA_WIDTH)) | vector)
         for i in range(self.steps-len(self.testbench_inputs)+1):
-            tb_steps.append("valid = 0;")
-            tb_steps.append("#half_period;")
-            tb_steps.append("#half_period;")
-            tb_steps.append("toFile();")
-            tb_steps.append("")
-        tb_steps=("\n"+"    "*4).join(tb_steps)
+            lines.append(((1<<3 | eof)<<(self.N*self.DATA_WIDTH)) | vector)
+        return "".join(f"{l:0{digits}x}\n" for l in lines)
 
+    # Testbench that feeds the stimulus file to the processor, which doesn't depend on the inputs or the number of steps
+    def testbench(self):
         # Prepare testbench values to save to file
         tb_store=[]
         tb_var_names={}
@@ -772,7 +775,7 @@ class rtlHw():
             reg valid=1'b0;
             reg [1:0] eof=2'b00;
             reg [DATA_WIDTH-1:0] vector [N-1:0];
-            reg uart_rxd = 1'b0;
+            reg uart_rxd = 1'b1;
             reg reset = 1'b1;
             wire uart_txd;
             
@@ -788,6 +791,9 @@ class rtlHw():
             // duration for each bit = 10 * timescale = 10 * 1 ns  = 10ns
             localparam period = 10; 
             localparam half_period = 5; 
+
+            // Duration of each UART bit (57600 baud on the 50MHz clock of uart.sv)
+            localparam uart_bit = 868*period;
             
             always #half_period clk=~clk; 
             
@@ -814,7 +820,10 @@ class rtlHw():
             );
 
             //Task to print all content to file
-            integer write_data,write_data2,i,j;
+            integer write_data,write_data2,stimulus,uart_file,i,j;
+            reg [7:0] uart_byte;
+            reg [N*DATA_WIDTH+3:0] stimulus_line;
+            reg dump;
             task toFile;
                 begin
                 {tb_store}
@@ -826,9 +835,42 @@ class rtlHw():
                 write_data = $fopen("simulation_results.txt");
                 
                 $display("Test Started");
-                {tb_inputs}
-                
-                {tb_steps}
+
+                // Bytes of uart.hex (e.g. reconfiguration images) are sent through the UART before the first input vector
+                uart_file = $fopen("uart.hex","r");
+                while ($fscanf(uart_file,"%h\\n",uart_byte)==1) begin
+                    if (reset) begin
+                        reset = 1'b0;
+                        #uart_bit;
+                    end
+                    uart_rxd = 1'b0;
+                    #uart_bit;
+                    for (j=0; j<8; j=j+1) begin
+                        uart_rxd = uart_byte[j];
+                        #uart_bit;
+                    end
+                    uart_rxd = 1'b1;
+                    #uart_bit;
+                end
+                $fclose(uart_file);
+                if (!reset) begin
+                    // Let the reconfiguration unit go back to tracing
+                    #(4*period);
+                end
+
+                stimulus = $fopen("stimulus.hex","r");
+                while ($fscanf(stimulus,"%h\\n",stimulus_line)==1) begin
+                    {{dump,valid,eof}} = stimulus_line[N*DATA_WIDTH+:4];
+                    for (j=0; j<N; j=j+1) begin
+                        vector[j] = stimulus_line[DATA_WIDTH*j+:DATA_WIDTH];
+                    end
+                    #half_period;
+                    #half_period;
+                    if (dump) begin
+                        toFile();
+                    end
+                end
+                $fclose(stimulus);
                 
                 $fclose(write_data);
                 write_data2 = $fopen("simulation_results_tb.txt");
@@ -851,65 +893,85 @@ class rtlHw():
         self.tb_var_names=tb_var_names
         return testbench
 
-    def generateRtl(self):
-
-        # Create subfolder where all files will be generated
-        rtl_folder=os.getcwd()+"/rtl"
-        if os.path.isdir(rtl_folder):
-            shutil.rmtree(rtl_folder)
-        os.mkdir(rtl_folder)
-        copy_tree(self.hwFolder+"/buildingBlocks/general", rtl_folder)
+    # Returns the name and contents (bytes) of every file of the generated RTL
+    def rtlFiles(self):
+        files=readFolder(self.hwFolder+"/buildingBlocks/general")
         if self.DEVICE_FAM == "Cyclone V":
-            copyfile(self.hwFolder+"/buildingBlocks/device-specific/ram_dual_port_cycloneV.sv", rtl_folder+"/ram_dual_port.sv")
+            files["ram_dual_port.sv"]=readFile(self.hwFolder+"/buildingBlocks/device-specific/ram_dual_port_cycloneV.sv")
         elif self.DEVICE_FAM == "Stratix 10":
-            copyfile(self.hwFolder+"/buildingBlocks/device-specific/ram_dual_port_stratix10.sv", rtl_folder+"/ram_dual_port.sv")
+            files["ram_dual_port.sv"]=readFile(self.hwFolder+"/buildingBlocks/device-specific/ram_dual_port_stratix10.sv")
         else:
             assert False, f"Currently only 'Cyclone V' and 'Stratix 10' are supported (received {self.DEVICE_FAM})"
-        copy_tree(self.hwFolder+"/simulationBlocks", rtl_folder)
+        files.update(readFolder(self.hwFolder+"/simulationBlocks"))
 
-        # Writes debugProcessor to file
-        f = open(rtl_folder+"/debugProcessor.sv", "w")
+        # debugProcessor (and the MIF files of its memories), testbench and its stimulus (inputs and UART bytes)
         self.rtlLogicConfig()
-        for l in self.top.dump():
-            f.write(l+"\n")
-        f.close()
-
-        # Writes testbench to file
-        f = open(rtl_folder+"/testbench.sv", "w")
-        for l in self.testbench():
-            f.write(l+"\n")
-        f.close()
+        mif_files={}
+        files["debugProcessor.sv"]="".join(l+"\n" for l in self.top.dump(mif_files)).encode()
+        files["testbench.sv"]="".join(l+"\n" for l in self.testbench()).encode()
+        files["stimulus.hex"]=self.stimulus().encode()
+        files["uart.hex"]="".join(f"{b:02x}\n" for b in self.uart_inputs).encode()
+        files.update({name: text.encode() for name, text in mif_files.items()})
+        return files
+
+    # Writes the RTL to a folder (rtl in the current directory by default), only rewriting the files whose contents changed since the last time
+    # Returns a struct with the hash of the whole tree (key), the files that were written (changed), the ones that were deleted (removed)
+    # and the hash of every file (hashes)
+    def generateRtl(self,folder=None):
+        rtl_folder=os.path.abspath("rtl" if folder is None else folder)
+        files=self.rtlFiles()
+        hashes={name: hashlib.sha256(data).hexdigest() for name, data in files.items()}
+        key=hashlib.sha256(repr(sorted(hashes.items())).encode()).hexdigest()
+
+        # Files are compared with the manifest of the previous generation, which is only trusted for files that were not touched since
+        manifest=readManifest(rtl_folder)
+        previous={name: entry[0] for name, entry in manifest.get('files',{}).items() if fileStat(rtl_folder+"/"+name)==entry[1]}
+        changed=[name for name in files if previous.get(name)!=hashes[name]]
+        removed=[name for name in manifest.get('files',{}) if name not in files]
+        if changed or removed:
+            os.makedirs(rtl_folder,exist_ok=True)
+            for name in changed:
+                writeFile(rtl_folder+"/"+name,files[name])
+            for name in removed:
+                if os.path.isfile(rtl_folder+"/"+name):
+                    os.remove(rtl_folder+"/"+name)
+            entries={name: [hashes[name],fileStat(rtl_folder+"/"+name)] for name in files}
+            writeFile(rtl_folder+"/"+MANIFEST,json.dumps({'key':key,'files':entries},indent=1).encode())
+        self.rtl=struct(key=key,changed=changed,removed=removed,hashes=hashes)
+        return self.rtl
 
     def config(self,fw):
         #Configure processor
         self.firmware=fw
 
+    # Returns the bytes that reconfigure a running board with the current firmware and FUVRF values through the UART (see firmware.binary)
+    def reconfigImage(self,fuvrf):
+        assert self.firmware is not None, "Firmware must be configured first"
+        return encodeImage(self.firmware,fuvrf,self.N,self.M,self.MAX_CHAINS,self.FUVRF_SIZE,self.DATA_WIDTH,['int','fixed_point'][self.DATA_TYPE])
+
+    # Sends bytes through the UART of the testbench before the first input vector (e.g. reconfigImage or a delta, see firmware.binary)
+    def reconfigure(self,image):
+        self.uart_inputs=self.uart_inputs+bytes(image)
+
     # This will run the testbench of the generated hardware and return its results
-    def run(self,steps=50,gui=False,log=True):
+    # A running modelsimSession can be given to reuse its container and compiled libraries across runs (otherwise one is started for this run)
+    # The RTL and the results are kept in folder (rtl in the current directory by default), so runs with different folders and sessions
+    # can happen at the same time (see modelsimPool)
+    def run(self,steps=50,gui=False,log=True,session=None,folder=None):
         # First, generate the RTL
         self.steps=steps
-        self.generateRtl()
+        self.generateRtl(folder)
 
         # Then, run simulation
-        current_folder=os.getcwd()
-        rtl_folder=current_folder+"/rtl/"
-        os.chdir(rtl_folder)
-
-        modelsim = modelsimContainer(log)
-        modelsim.start()
-        modelsim.exec('mkdir rtl')
-        modelsim.copy(rtl_folder,'modelsim:.')
-        modelsim.exec('vlib work',working_directory='/rtl')
-        modelsim.exec('vlog altera_mf.v altera_lnsim.sv testbench.sv',working_directory='/rtl')
-        if gui:
-            print("Opening GUI\n\tMake sure to open socket using this command on your mac:\n\tsocat TCP-LISTEN:6000,reuseaddr,fork UNIX-CLIENT:\\\"$DISPLAY\\\"")
-            modelsim.exec('vsim -gui -do "run -all" testbench',working_directory='/rtl')
-        else:
-            modelsim.exec('vsim -c -do "run -all" testbench',working_directory='/rtl')
-        modelsim.copy('modelsim:/rtl/simulation_results.txt','simulation_results.txt')
-        modelsim.copy('modelsim:/rtl/simulation_results_tb.txt','simulation_results_tb.txt')
-        modelsim.exec('rm -r rtl')
-        modelsim.stop()
+        rtl_folder=os.path.abspath("rtl" if folder is None else folder)
+        modelsim = modelsimSession(log) if session is None else session
+        if session is None:
+            modelsim.start()
+        modelsim.sync(rtl_folder,self.rtl.hashes)
+        modelsim.compile()
+        modelsim.simulate(['simulation_results.txt','simulation_results_tb.txt'],rtl_folder,gui=gui)
+        if session is None:
+            modelsim.close()
 
         # Get results from file back to python
         results={}
@@ -917,7 +979,7 @@ class rtlHw():
                 results[mod]={}
                 for var_name, elements in self.tb_var_names[mod]:
                     results[mod][var_name]=[]
-        f = open("simulation_results.txt", "r")
+        f = open(rtl_folder+"/simulation_results.txt", "r")
         for line in f:
             count=0
             l= line.replace("\n","").split(" ")
@@ -928,7 +990,7 @@ class rtlHw():
                     results[mod][var_name].append(l[count:count+elements])
                     count=count+elements
 
-        f = open("simulation_results_tb.txt", "r")
+        f = open(rtl_folder+"/simulation_results_tb.txt", "r")
         tb=[]
         for line in f:
             count=0
@@ -937,22 +999,19 @@ class rtlHw():
                 tb.append(l)
         results['tb']['mem_data']=tb
 
-        # Go back to main directory
-        os.chdir(current_folder)
-
         return results
 
-    def initialize_fu(vals):
+    def initialize_fu(self,vals):
         # Check if the values received have the correct size
-        assert len(vals)==self.FUVRF_SIZE*M, "FU Initialization failed"
+        assert len(vals)==self.FUVRF_SIZE*self.M, "FU Initialization failed"
 
-        vals = np.array_split(vals, FUVRF_SIZE)
+        vals = np.array_split(vals, self.FUVRF_SIZE)
         # If we are dealing with integers
         if self.DATA_TYPE==0:
-            hw_proc.top.mod.filterReduceUnit.mem['furf']['init_values']=vals
+            self.top.mod.filterReduceUnit.mem['furf']['init_values']=vals
         # If we are dealing with fixed-point
         elif self.DATA_TYPE==1:
-            hw_proc.top.mod.filterReduceUnit.mem['furf']['init_values']=[floatToEncodedInt(v,DATA_WIDTH) for v in vals]
+            self.top.mod.filterReduceUnit.mem['furf']['init_values']=[floatToEncodedInt(v,self.DATA_WIDTH) for v in vals]
 
     def push(self,pushed_values):
         self.testbench_inputs.append(pushed_values)
@@ -982,9 +1041,11 @@ class rtlHw():
             exit()
         self.hwFolder = os.path.dirname(os.path.realpath(__file__))
         self.testbench_inputs=[]    # Stores inputs to testbench
+        self.uart_inputs=b''        # Bytes sent through the UART by the testbench
         self.steps=0 # Number of steps for testbench 
         self.tb_var_names = None
         self.compiler = compiler(N,M,MAX_CHAINS)
         self.firmware = None
+        self.rtl = None # Result of the last generateRtl
         self.top=self.rtlLogicInit()
         
\ No newline at end of file
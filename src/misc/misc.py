@@ -1,4 +1,5 @@
 from copy import deepcopy as copy
+import numpy as np
 import yaml
 
 ''' C-like struct '''
@@ -8,13 +9,22 @@ class struct:
     def __repr__(self):
         return str(self.__dict__)
 
+''' C-like struct with a fixed set of fields (missing fields default to 0) '''
+class record:
+    __slots__=()
+    def __init__(self, **kwds):
+        for k in self.__slots__:
+            setattr(self,k,kwds.get(k,0))
+    def __repr__(self):
+        return str({k: getattr(self,k) for k in self.__slots__})
+
 ''' Map list to int '''
 def toInt(lst):
     return [list(map(int, l)) for l in lst]
 
 ''' Encode vector of floats to ints '''
 def floatToEncodedInt(float_array,DATA_WIDTH):
-    return [encode(x,DATA_WIDTH) for x in float_array]
+    return encodeArray(float_array,DATA_WIDTH).tolist()
 
 ''' Encode vector of floats to ints '''    
 def encode(value,DATA_WIDTH):
@@ -30,8 +40,7 @@ def encode(value,DATA_WIDTH):
 
 ''' Decode vector of floats from encoded ints back to floats '''
 def encodedIntTofloat(encoded_int,DATA_WIDTH):
-    frac_bits=int(DATA_WIDTH/2)
-    return [[decode(encoded_value,DATA_WIDTH) for encoded_value in l] for l in encoded_int] 
+    return decodeArray(encoded_int,DATA_WIDTH).tolist()
 
 ''' Decode vector of floats from encoded ints back to floats '''
 def decode(value,DATA_WIDTH):
@@ -42,4 +51,36 @@ def decode(value,DATA_WIDTH):
     is_negative = value>max_value
     if is_negative:
         value = -((1<<DATA_WIDTH) - value)
-    return value / (1 << frac_bits)
\ No newline at end of file
+    return value / (1 << frac_bits)
+
+''' Encode array of floats (any shape) to ints, with the same rounding and saturation as encode '''
+# Results are int64 arrays (uint64 for DATA_WIDTH of 63 and 64 bits)
+def encodeArray(values,DATA_WIDTH):
+    assert DATA_WIDTH<=64, "Encoding supports up to 64 bits"
+    frac_bits=int(DATA_WIDTH/2)
+    sign_bit=2*frac_bits-1
+    max_value=(1<<sign_bit)-1
+    values=np.asarray(values,dtype=float)
+    x=np.round(values*(1<<frac_bits))
+
+    # Rounded values are integers, so comparing them with max_value+1 (a power of 2) is exact even for 64 bits
+    above=x>=2.0**sign_bit
+    below=x<=-2.0**sign_bit
+    x=np.where(above|below,0,x).astype(np.int64)
+    x[above]=max_value
+    x[below]=-max_value
+
+    # Negative values wrap around (as in encode, values that round to zero are also offset when negative)
+    negative=values<0
+    x=x.astype(np.int64 if DATA_WIDTH<63 else np.uint64)
+    if DATA_WIDTH<64:
+        x[negative]+=1<<DATA_WIDTH
+    return x
+
+''' Decode array of encoded ints (any shape) back to floats, with the same results as decode '''
+def decodeArray(values,DATA_WIDTH):
+    assert DATA_WIDTH<=64, "Decoding supports up to 64 bits"
+    frac_bits=int(DATA_WIDTH/2)
+    sign_bit=2*frac_bits-1
+    values=np.asarray(values,dtype=float)
+    return np.where(values>=2.0**sign_bit,values-2.0**DATA_WIDTH,values)/(1<<frac_bits)